@@ -0,0 +1,183 @@
+import hashlib
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+GENERATION_KEY = "recipes:generation"
+# Флаг рецепта в ответе и модель, по которой он строится.
+SAVED_MODELS = {
+    "is_favorited": Favorite,
+    "is_in_shopping_cart": ShoppingCart,
+}
+# Счётчики рецепта, которые хранятся отдельно от страниц списка.
+COUNTER_FIELDS = ("favorites_count", "in_carts_count")
+
+
+def get_version(key) -> int:
+    """
+    Текущая версия данных под ключом key.
+
+    Начальное значение берётся из времени, чтобы после потери счётчика
+    не вернуться к ключам старых данных.
+    """
+    cache.add(key, time.time_ns(), timeout=None)
+    return cache.get(key)
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def get_generation() -> int:
+    """Текущее поколение данных рецептов."""
+    return get_version(GENERATION_KEY)
+
+
+def bump_generation():
+    """Смена поколения делает недействительными все сохранённые страницы."""
+    bump_version(GENERATION_KEY)
+
+
+def saved_version_key(user_id, flag) -> str:
+    return f"recipes:saved:{user_id}:{flag}"
+
+
+def get_saved_versions(user_id) -> dict[str, int]:
+    """Версии избранного и списка покупок пользователя."""
+    keys = {flag: saved_version_key(user_id, flag) for flag in SAVED_MODELS}
+    versions = cache.get_many(keys.values())
+    return {
+        flag: versions[key] if key in versions else get_version(key)
+        for flag, key in keys.items()
+    }
+
+
+def get_saved_recipe_ids(user_id) -> dict[str, frozenset[int]]:
+    """
+    Id рецептов в избранном и списке покупок пользователя по флагам.
+
+    Множества хранятся в кэше под ключами с версией, поэтому запрос,
+    прочитавший базу до изменения, не перезапишет новые данные.
+    """
+    keys = {
+        flag: f"{saved_version_key(user_id, flag)}:{version}"
+        for flag, version in get_saved_versions(user_id).items()
+    }
+    cached = cache.get_many(keys.values())
+    saved = {}
+    for flag, key in keys.items():
+        if key not in cached:
+            cached[key] = frozenset(
+                SAVED_MODELS[flag]
+                .objects.filter(user_id=user_id)
+                .values_list("recipe_id", flat=True)
+            )
+            cache.set(
+                key, cached[key], timeout=settings.SAVED_RECIPES_CACHE_TIMEOUT
+            )
+        saved[flag] = cached[key]
+    return saved
+
+
+def invalidate_saved_recipe_ids(user_id, model):
+    """
+    Новая версия избранного или списка покупок пользователя.
+
+    Версия меняется сразу, чтобы изменения были видны в той же
+    транзакции, и ещё раз после фиксации: параллельный запрос мог
+    сохранить под промежуточной версией данные до изменения.
+    """
+    for flag, saved_model in SAVED_MODELS.items():
+        if saved_model is model:
+            key = saved_version_key(user_id, flag)
+            bump_version(key)
+            transaction.on_commit(partial(bump_version, key))
+
+
+def counters_key(recipe_id) -> str:
+    return f"recipes:counters:{recipe_id}"
+
+
+def get_recipe_counters(recipe_ids) -> dict[int, tuple[int, ...]]:
+    """
+    Счётчики COUNTER_FIELDS рецептов по id.
+
+    Счётчики меняются при каждом добавлении в избранное и список
+    покупок, поэтому не сбрасывают сохранённые страницы, а хранятся в
+    кэше по рецептам. Отсутствующие в кэше читаются одним запросом.
+    """
+    keys = {recipe_id: counters_key(recipe_id) for recipe_id in recipe_ids}
+    cached = cache.get_many(keys.values())
+    counters = {
+        recipe_id: cached[key]
+        for recipe_id, key in keys.items()
+        if key in cached
+    }
+    missing = [recipe_id for recipe_id in keys if recipe_id not in counters]
+    if missing:
+        rows = Recipe.objects.filter(id__in=missing).values_list(
+            "id", *COUNTER_FIELDS
+        )
+        for recipe_id, *values in rows:
+            counters[recipe_id] = tuple(values)
+            add_recipe_counters(recipe_id, counters[recipe_id])
+    return counters
+
+
+def add_recipe_counters(recipe_id, values):
+    # Значения, прочитанные запросом, не заменяют уже сохранённые:
+    # после изменения счётчиков их записывает refresh_recipe_counters.
+    cache.add(
+        counters_key(recipe_id),
+        tuple(values),
+        timeout=settings.RECIPES_CACHE_TIMEOUT,
+    )
+
+
+def refresh_recipe_counters(recipe_ids):
+    """Запись в кэш зафиксированных счётчиков рецептов."""
+    rows = Recipe.objects.filter(id__in=recipe_ids).values_list(
+        "id", *COUNTER_FIELDS
+    )
+    cache.set_many(
+        {
+            counters_key(recipe_id): tuple(values)
+            for recipe_id, *values in rows
+        },
+        timeout=settings.RECIPES_CACHE_TIMEOUT,
+    )
+
+
+def recipes_cache_key(request) -> str:
+    """Ключ страницы по нормализованным параметрам запроса."""
+    params = sorted(
+        (key, sorted(values)) for key, values in request.query_params.lists()
+    )
+    digest = hashlib.sha256(
+        repr((request.build_absolute_uri("/"), params)).encode()
+    ).hexdigest()
+    return f"recipes:list:{get_generation()}:{digest}"
+
+
+def get_cached_recipes(request):
+    """ETag, данные страницы без флагов пользователя и id рецептов."""
+    return cache.get(recipes_cache_key(request))
+
+
+def set_cached_recipes(request, etag, data, recipe_ids):
+    # ETag хранится вместе со страницей, чтобы совпадать с её данными,
+    # пока страница отдаётся из кэша. По id рецептов в ответ
+    # подставляются флаги пользователя, даже если поле id не запрошено.
+    cache.set(
+        recipes_cache_key(request),
+        (etag, data, recipe_ids),
+        timeout=settings.RECIPES_CACHE_TIMEOUT,
+    )
@@ -0,0 +1,90 @@
+"""
+Условные GET-запросы к рецептам.
+
+Версия рецепта - его updated_at, который меняется при любом изменении
+данных рецепта в ответе. Версия страницы списка - id и updated_at её
+рецептов, общее количество и ссылки на соседние страницы. Страница всё
+равно выбирается для ответа, поэтому проверка не добавляет запросов, а
+при совпадении ETag не строятся теги, ингредиенты и тело ответа. В ETag
+также входят адрес запроса и формат ответа.
+
+Рецепты в ответе одинаковы для всех пользователей, кроме флагов
+is_favorited и is_in_shopping_cart, поэтому ETag пользователя строится
+из общего ETag и версий его избранного и списка покупок.
+"""
+
+import hashlib
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.pagination import PageNumberPagination
+
+from api.cache import get_saved_versions
+
+
+def make_etag(request, *version) -> str:
+    digest = hashlib.sha256(
+        repr(
+            (
+                request.get_full_path(),
+                getattr(request, "accepted_media_type", None),
+                version,
+            )
+        ).encode()
+    ).hexdigest()
+    return quote_etag(digest[:32])
+
+
+def get_user_etag(request, etag) -> str:
+    """ETag ответа с флагами пользователя по общему ETag."""
+    if not request.user.is_authenticated:
+        return etag
+    return make_etag(
+        request, etag, request.user.id, get_saved_versions(request.user.id)
+    )
+
+
+def get_page_etag(request, rows, paginator) -> str:
+    """ETag страницы списка по уже выбранным строкам рецептов."""
+    # Курсорная пагинация не считает количество рецептов.
+    count = (
+        paginator.page.paginator.count
+        if isinstance(paginator, PageNumberPagination)
+        else None
+    )
+    return make_etag(
+        request,
+        [(row["id"], row["updated_at"]) for row in rows],
+        count,
+        paginator.get_next_link(),
+        paginator.get_previous_link(),
+    )
+
+
+def get_validator_headers(etag, updated_at=None) -> dict[str, str]:
+    headers = {"ETag": etag}
+    if updated_at is not None:
+        headers["Last-Modified"] = http_date(updated_at.timestamp())
+    return headers
+
+
+def get_not_modified(request, etag, updated_at=None):
+    """
+    Ответ 304 или 412, если клиенту не нужно новое тело ответа.
+
+    Last-Modified передаётся только для отдельного рецепта: у списка
+    наибольший updated_at не меняется при удалении рецепта или его
+    выходе из выборки.
+    """
+    # Заготовка нужна, чтобы ответ 304 получил заголовки валидаторов.
+    response = HttpResponse(headers=get_validator_headers(etag, updated_at))
+    conditional = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=(
+            int(updated_at.timestamp()) if updated_at is not None else None
+        ),
+        response=response,
+    )
+    return None if conditional is response else conditional
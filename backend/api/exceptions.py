@@ -0,0 +1,10 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class ShoppingListUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = (
+        "Сервис формирования списков покупок перегружен, попробуйте позже."
+    )
+    default_code = "shopping_list_unavailable"
@@ -1,7 +1,13 @@
 from django_filters import rest_framework as filter
-from rest_framework.filters import SearchFilter
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, SearchFilter
 
+from api.cache import get_saved_recipe_ids
+from api.paginators import RecipeCursorPaginator
 from recipes.models import Ingredient, Recipe, Tag
+from recipes.popularity import POPULAR_ORDERING
+from recipes.search import search_recipes
+from recipes.tags_mask import filter_by_tags
 from users.models import User
 
 
@@ -14,25 +20,91 @@ class RecipeFilter(filter.FilterSet):
         field_name="tags__slug",
         queryset=Tag.objects.all(),
         to_field_name="slug",
+        method="get_tags",
     )
     is_favorited = filter.BooleanFilter(method="get_is_favorited")
     is_in_shopping_cart = filter.BooleanFilter(
         method="get_is_in_shopping_cart"
     )
+    # ChoiceFilter из django-filter 21.1 несовместим с формами Django 5.
+    ordering = filter.CharFilter(method="get_ordering")
 
     class Meta:
         model = Recipe
-        fields = ("tags", "author", "is_favorited", "is_in_shopping_cart")
+        fields = (
+            "tags",
+            "author",
+            "is_favorited",
+            "is_in_shopping_cart",
+            "ordering",
+        )
 
-    def get_is_favorited(self, queryset, name, value):
+    def get_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return filter_by_tags(queryset, value)
+
+    def filter_saved(self, queryset, name, value):
+        """Рецепты из множества id пользователя в кэше, без JOIN."""
+        user = self.request.user
+        recipe_ids = (
+            get_saved_recipe_ids(user.id)[name]
+            if user.is_authenticated
+            else frozenset()
+        )
         if value:
-            return queryset.filter(in_favorite__user=self.request.user)
-        return queryset.exclude(in_favorite__user=self.request.user)
+            return queryset.filter(id__in=recipe_ids)
+        return queryset.exclude(id__in=recipe_ids)
+
+    def get_is_favorited(self, queryset, name, value):
+        return self.filter_saved(queryset, name, value)
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        if value:
-            return queryset.filter(shopping__user=self.request.user)
-        return queryset.exclude(shopping__user=self.request.user)
+        return self.filter_saved(queryset, name, value)
+
+    def get_ordering(self, queryset, name, value):
+        if value != "popular":
+            raise ValidationError(
+                {name: ["Допустимое значение сортировки: popular."]}
+            )
+        return queryset.order_by(*POPULAR_ORDERING)
+
+
+class RecipeSearchFilter(BaseFilterBackend):
+    """
+    Полнотекстовый поиск рецептов с сортировкой по релевантности.
+
+    Релевантность не хранится в таблице рецептов, поэтому поиск
+    несовместим с другой сортировкой и с курсорной пагинацией, которая
+    задаёт свой порядок: такие запросы отклоняются.
+    """
+
+    search_param = "search"
+    incompatible_params = (
+        RecipeCursorPaginator.cursor_query_param,
+        "ordering",
+    )
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, "").strip()
+        if not query:
+            return queryset
+        conflicts = [
+            param
+            for param in self.incompatible_params
+            if param in request.query_params
+        ]
+        if conflicts:
+            raise ValidationError(
+                {
+                    self.search_param: [
+                        "Поиск сортирует рецепты по релевантности и не "
+                        "совместим с параметрами: "
+                        f"{', '.join(conflicts)}."
+                    ]
+                }
+            )
+        return search_recipes(queryset, query)
 
 
 class SearchIngredientsFilter(SearchFilter):
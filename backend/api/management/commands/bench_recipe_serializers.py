@@ -0,0 +1,81 @@
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.serializers.recipe_rows import recipe_rows, serialize_recipes
+from api.serializers.recipe_serializers import RecipeReadSerializer
+from api.views.recipe_views import RecipeViewSet
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнение скорости RecipeReadSerializer и быстрой сериализации "
+        "списка рецептов на данных текущей базы."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=50,
+            help="Количество рецептов в одном ответе.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=20,
+            help="Количество повторов каждого варианта.",
+        )
+        parser.add_argument(
+            "--user",
+            help="Email пользователя, от имени которого строится список.",
+        )
+
+    def get_view(self, email):
+        request = APIRequestFactory().get(reverse("api:recipes-list"))
+        if email:
+            user = User.objects.filter(email=email).first()
+            if user is None:
+                raise CommandError(f"Пользователь {email} не найден.")
+            force_authenticate(request, user)
+        view = RecipeViewSet(
+            action="list", action_map={"get": "list"}, format_kwarg=None
+        )
+        view.request = view.initialize_request(request)
+        return view
+
+    def measure(self, render, repeat) -> float:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            render()
+        return (time.perf_counter() - started) / repeat * 1000
+
+    def handle(self, *args, **options):
+        view = self.get_view(options["user"])
+        limit = options["limit"]
+
+        def render_serializer():
+            queryset = view.get_queryset()[:limit]
+            return JSONRenderer().render(
+                RecipeReadSerializer(
+                    queryset, many=True, context={"request": view.request}
+                ).data
+            )
+
+        def render_rows():
+            rows = recipe_rows(view.get_queryset())[:limit]
+            return JSONRenderer().render(serialize_recipes(rows, view.request))
+
+        if render_serializer() != render_rows():
+            raise CommandError("Ответы сериализаторов различаются.")
+        serializer_ms = self.measure(render_serializer, options["repeat"])
+        rows_ms = self.measure(render_rows, options["repeat"])
+        self.stdout.write(
+            f"RecipeReadSerializer: {serializer_ms:.2f} мс\n"
+            f"serialize_recipes: {rows_ms:.2f} мс\n"
+            f"Ускорение: {serializer_ms / rows_ms:.1f}x"
+        )
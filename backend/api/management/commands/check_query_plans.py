@@ -0,0 +1,355 @@
+import re
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.urls import resolve, reverse
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.cache import bump_generation
+from recipes.models import (
+    Favorite,
+    FeedEntry,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    Tag,
+)
+from recipes.ingredient_index import bump_data_version
+from recipes.reference import REFERENCE, get_reference_data
+from recipes.shopping_list import add_to_shopping_list
+from recipes.tags_mask import update_tags_mask
+from users.models import Subscribe, User
+
+# (название, url по данным базы, запрос от имени пользователя)
+ENDPOINTS = (
+    ("recipes-list", lambda data: reverse("api:recipes-list"), False),
+    ("recipes-list-auth", lambda data: reverse("api:recipes-list"), True),
+    (
+        "recipes-list-cursor",
+        lambda data: reverse("api:recipes-list") + "?cursor=",
+        False,
+    ),
+    (
+        "recipes-list-popular",
+        lambda data: reverse("api:recipes-list") + "?ordering=popular",
+        False,
+    ),
+    (
+        "recipes-list-popular-cursor",
+        lambda data: reverse("api:recipes-list") + "?ordering=popular&cursor=",
+        False,
+    ),
+    (
+        "recipes-list-favorited",
+        lambda data: reverse("api:recipes-list") + "?is_favorited=1",
+        True,
+    ),
+    (
+        "recipes-list-in-cart",
+        lambda data: reverse("api:recipes-list") + "?is_in_shopping_cart=1",
+        True,
+    ),
+    (
+        "recipes-list-author",
+        lambda data: reverse("api:recipes-list")
+        + f"?author={data['recipe'].author.email}",
+        False,
+    ),
+    (
+        "recipes-list-tags",
+        lambda data: reverse("api:recipes-list") + f"?tags={data['tag'].slug}",
+        False,
+    ),
+    ("recipes-feed", lambda data: reverse("api:recipes-feed"), True),
+    (
+        "recipes-detail",
+        lambda data: reverse("api:recipes-detail", args=[data["recipe"].id]),
+        True,
+    ),
+    (
+        "recipes-pantry",
+        lambda data: reverse("api:recipes-pantry")
+        + f"?ingredients={data['ingredient'].id}",
+        False,
+    ),
+    (
+        "recipes-related",
+        lambda data: reverse("api:recipes-related", args=[data["recipe"].id]),
+        False,
+    ),
+    ("users-list", lambda data: reverse("api:users-list"), True),
+    (
+        "users-detail",
+        lambda data: reverse(
+            "api:users-detail", args=[data["recipe"].author_id]
+        ),
+        True,
+    ),
+    (
+        "users-subscriptions",
+        lambda data: reverse("api:users-subscriptions"),
+        True,
+    ),
+    (
+        "download-shopping-cart",
+        lambda data: reverse("api:download_shop_list") + "?format=csv",
+        True,
+    ),
+)
+# Полный просмотр таблицы в EXPLAIN QUERY PLAN SQLite, без индекса.
+SQLITE_SCAN_RE = re.compile(r"^SCAN (\w+)$")
+# Подзапрос во FROM, который SQLite выполняет отдельно: его просмотр -
+# чтение уже выбранных строк, а не таблицы.
+SQLITE_DERIVED_RE = re.compile(r"^(?:CO-ROUTINE|MATERIALIZE) (\w+)$")
+LIMIT_RE = re.compile(r"\sLIMIT \S+(?: OFFSET \S+)?$")
+# Таблица и её псевдоним в SQL, который строит Django.
+TABLE_ALIAS_RE = re.compile(r'"(\w+)" (?:AS )?"?([A-Z]\d+)"?')
+JOIN_NODES = ("Nested Loop", "Hash Join", "Merge Join")
+
+
+class QueryCollector:
+    """Обёртка выполнения запросов, запоминающая SELECT с параметрами."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith("SELECT"):
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def postgres_seq_scans(plan, parent=None):
+    """
+    Таблицы, которые Postgres читает последовательно в поиске строк.
+
+    Просмотр без условия на верхнем уровне (например, COUNT всех
+    рецептов) индекс не ускорит, поэтому он не учитывается.
+    """
+    if plan["Node Type"] == "Seq Scan" and (
+        "Filter" in plan or parent in JOIN_NODES
+    ):
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", ()):
+        yield from postgres_seq_scans(child, plan["Node Type"])
+
+
+def sqlite_seq_scans(sql, rows):
+    """
+    Таблицы, которые SQLite просматривает без индекса.
+
+    Просмотр с LIMIT без сортировки останавливается на первых строках:
+    так SQLite читает таблицу в порядке первичного ключа.
+    """
+    details = [detail for *_, detail in rows]
+    if LIMIT_RE.search(sql) and not any(
+        "USE TEMP B-TREE" in detail for detail in details
+    ):
+        return
+    aliases = {alias: table for table, alias in TABLE_ALIAS_RE.findall(sql)}
+    derived = {
+        match[1] for match in map(SQLITE_DERIVED_RE.match, details) if match
+    }
+    for detail in details:
+        match = SQLITE_SCAN_RE.match(detail)
+        if match and match[1] not in derived:
+            yield aliases.get(match[1], match[1])
+
+
+def get_seq_scans(sql, params) -> set[str]:
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            return set(postgres_seq_scans(cursor.fetchone()[0][0]["Plan"]))
+        if connection.vendor == "sqlite":
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return set(sqlite_seq_scans(sql, cursor.fetchall()))
+    raise CommandError(f"EXPLAIN для {connection.vendor} не поддерживается.")
+
+
+def count_rows(table) -> int:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT COUNT(*) FROM {connection.ops.quote_name(table)}"
+        )
+        return cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = (
+        "Проверка планов запросов эндпоинтов рецептов, пользователей и "
+        "списка покупок: EXPLAIN каждого запроса и ошибка при полном "
+        "просмотре больших таблиц."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help=(
+                "Количество авторов с рецептами для временных данных, "
+                "которые удаляются после проверки."
+            ),
+        )
+        parser.add_argument(
+            "--min-rows",
+            type=int,
+            default=1000,
+            help="Таблица считается большой начиная с этого числа строк.",
+        )
+        parser.add_argument(
+            "--user",
+            help=(
+                "Email пользователя для запросов с авторизацией, "
+                "без --seed обязателен."
+            ),
+        )
+
+    def seed(self, count) -> User:
+        """Авторы с рецептами, подписками, избранным и списками покупок."""
+        user = User.objects.create(email="plans@example.com", username="plans")
+        # Проверяется фильтр по редкому тегу, общий тег наполняет
+        # таблицу связей.
+        common_tag, tag = Tag.objects.bulk_create(
+            Tag(name=name, color=color, slug=f"{name}-check")
+            for name, color in (
+                ("plans-common", "#00FF00"),
+                ("plans", "#0000FF"),
+            )
+        )
+        authors = User.objects.bulk_create(
+            User(email=f"plans{number}@example.com", username=f"plans{number}")
+            for number in range(count)
+        )
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=author,
+                name=f"Рецепт {number}",
+                text="Описание",
+                cooking_time=1,
+            )
+            for number, author in enumerate(authors)
+        )
+        Recipe.tags.through.objects.bulk_create(
+            [
+                Recipe.tags.through(recipe_id=recipe.id, tag_id=common_tag.id)
+                for recipe in recipes
+            ]
+            + [
+                Recipe.tags.through(recipe_id=recipe.id, tag_id=tag.id)
+                for recipe in recipes[::10]
+            ]
+        )
+        update_tags_mask(recipe.id for recipe in recipes)
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f"Ингредиент {number}", measurement_unit="г")
+            for number in range(count)
+        )
+        bump_data_version(REFERENCE)
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe, ingredient in zip(recipes, ingredients)
+        )
+        # Каждый автор подписан на следующего и отмечает его рецепт,
+        # пользователь проверки - на каждого десятого.
+        pairs = list(zip(authors, recipes[1:] + recipes[:1]))
+        pairs += [(user, recipe) for recipe in recipes[::10]]
+        Subscribe.objects.bulk_create(
+            Subscribe(subscriber=subscriber, author_id=recipe.author_id)
+            for subscriber, recipe in pairs
+        )
+        FeedEntry.objects.bulk_create(
+            FeedEntry(user=subscriber, recipe=recipe, pub_date=recipe.pub_date)
+            for subscriber, recipe in pairs
+        )
+        for model in (Favorite, ShoppingCart):
+            model.objects.bulk_create(
+                model(user=subscriber, recipe=recipe)
+                for subscriber, recipe in pairs
+            )
+        add_to_shopping_list(user.id, [recipe.id for recipe in recipes[::10]])
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        return user
+
+    def get_user(self, options) -> User:
+        if options["seed"]:
+            return self.seed(options["seed"])
+        if not options["user"]:
+            raise CommandError("Укажите --user или --seed.")
+        user = User.objects.filter(email=options["user"]).first()
+        if user is None:
+            raise CommandError(f"Пользователь {options['user']} не найден.")
+        return user
+
+    def collect_queries(self, url, user) -> list:
+        request = APIRequestFactory().get(url, SERVER_NAME="localhost")
+        if user is not None:
+            force_authenticate(request, user)
+        match = resolve(request.path)
+        collector = QueryCollector()
+        with connection.execute_wrapper(collector):
+            response = match.func(request, *match.args, **match.kwargs)
+            if response.streaming:
+                b"".join(response)
+            else:
+                response.render()
+        if response.status_code != 200:
+            raise CommandError(f"{url}: ответ {response.status_code}")
+        return collector.queries
+
+    def check_endpoints(self, user, min_rows) -> list[str]:
+        data = {
+            "recipe": Recipe.objects.order_by("-id").first(),
+            "tag": Tag.objects.order_by("-id").first(),
+            "ingredient": Ingredient.objects.order_by("-id").first(),
+        }
+        if None in data.values():
+            raise CommandError(
+                "Нет рецептов, тегов или ингредиентов, укажите --seed."
+            )
+        # Реестр справочников читает таблицы тегов и ингредиентов целиком
+        # один раз на процесс, а не в каждом запросе.
+        get_reference_data()
+        large = {}
+        failures = []
+        for name, get_url, authorized in ENDPOINTS:
+            queries = self.collect_queries(
+                get_url(data), user if authorized else None
+            )
+            scans = set()
+            for sql, params in queries:
+                for table in get_seq_scans(sql, params):
+                    if table not in large:
+                        large[table] = count_rows(table) >= min_rows
+                    if large[table]:
+                        scans.add(table)
+                        failures.append(f"{name}: {table}\n    {sql}")
+            if scans:
+                status = self.style.ERROR(
+                    f"полный просмотр {', '.join(sorted(scans))}"
+                )
+            else:
+                status = self.style.SUCCESS("OK")
+            self.stdout.write(f"{name}: {len(queries)} запросов, {status}")
+        return failures
+
+    def handle(self, *args, **options):
+        # Новое поколение кэша: страницы для анонимных пользователей
+        # строятся запросами, а построенные по временным данным
+        # сбрасываются после проверки.
+        bump_generation()
+        try:
+            with transaction.atomic():
+                user = self.get_user(options)
+                failures = self.check_endpoints(user, options["min_rows"])
+                # Временные данные не сохраняются.
+                transaction.set_rollback(True)
+        finally:
+            bump_generation()
+        if failures:
+            raise CommandError(
+                "Полный просмотр больших таблиц:\n" + "\n".join(failures)
+            )
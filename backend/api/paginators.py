@@ -1,6 +1,86 @@
-from rest_framework.pagination import PageNumberPagination
+from datetime import datetime
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    Cursor,
+    CursorPagination,
+    PageNumberPagination,
+)
+
+from recipes.popularity import POPULAR_ORDERING
 
 
 class CustomPaginator(PageNumberPagination):
     page_size_query_param = "limit"
     page_size = 6
+
+
+class RecipeCursorPaginator(CursorPagination):
+    """
+    Курсорная пагинация рецептов.
+
+    Страница выбирается условием по (pub_date, id) вместо OFFSET и не
+    требует COUNT, поэтому время ответа не зависит от номера страницы.
+    """
+
+    page_size_query_param = "limit"
+    page_size = 6
+    ordering = ("-pub_date", "id")
+
+    def get_ordering(self, request, queryset, view):
+        # Позиция популярных рецептов - популярность последнего рецепта,
+        # рецепты с равной популярностью пропускаются смещением.
+        if request.query_params.get("ordering") == "popular":
+            return POPULAR_ORDERING
+        return super().get_ordering(request, queryset, view)
+
+
+class FeedPaginator(CursorPagination):
+    """
+    Курсорная пагинация ленты подписок.
+
+    Страница строится функцией ленты по позиции (pub_date, id)
+    последнего рецепта предыдущей страницы, а не из queryset.
+    Переход возможен только к следующей странице.
+    """
+
+    page_size_query_param = "limit"
+    page_size = 6
+    max_page_size = 100
+
+    def paginate_feed(self, get_feed, request) -> list[int]:
+        """
+        id рецептов страницы; get_feed(position, limit) возвращает
+        позиции (pub_date, id) рецептов после position.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        position = self.parse_position(cursor.position) if cursor else None
+        rows = get_feed(position, self.page_size + 1)
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[: self.page_size]
+        return [recipe_id for _, recipe_id in self.page]
+
+    def parse_position(self, position) -> tuple[datetime, int]:
+        try:
+            pub_date, recipe_id = position.split("|")
+            return datetime.fromisoformat(pub_date), int(recipe_id)
+        except (AttributeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        pub_date, recipe_id = self.page[-1]
+        return self.encode_cursor(
+            Cursor(
+                offset=0,
+                reverse=False,
+                position=f"{pub_date.isoformat()}|{recipe_id}",
+            )
+        )
+
+    def get_previous_link(self):
+        return None
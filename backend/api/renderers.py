@@ -0,0 +1,88 @@
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+SHOPPING_LIST_FIELDS = ("name", "measurement_unit", "amount")
+
+
+def shopping_list_rows(ingredients):
+    for ingredient in ingredients:
+        yield (
+            ingredient["ingredient__name"],
+            ingredient["ingredient__measurement_unit"],
+            ingredient["sum_amount"],
+        )
+
+
+class PDFRenderer(BaseRenderer):
+    """Список покупок в pdf, формируется целиком через weasyprint."""
+
+    media_type = "application/pdf"
+    format = "pdf"
+
+
+class ShoppingListCSVRenderer(BaseRenderer):
+    """Потоковая выгрузка списка покупок в csv."""
+
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    class _Echo:
+        def write(self, value):
+            return value
+
+    def stream(self, ingredients):
+        writer = csv.writer(self._Echo())
+        yield writer.writerow(SHOPPING_LIST_FIELDS)
+        for row in shopping_list_rows(ingredients):
+            yield writer.writerow(row)
+
+
+class ShoppingListTextRenderer(BaseRenderer):
+    """Потоковая выгрузка списка покупок простым текстом."""
+
+    media_type = "text/plain"
+    format = "txt"
+    charset = "utf-8"
+
+    def stream(self, ingredients):
+        yield "Список покупок\n\n"
+        for number, (name, unit, amount) in enumerate(
+            shopping_list_rows(ingredients), start=1
+        ):
+            yield f"{number}. {name} ({unit}) — {amount}\n"
+
+
+class ShoppingListJSONRenderer(BaseRenderer):
+    """Потоковая выгрузка списка покупок в json."""
+
+    media_type = "application/json"
+    format = "json"
+    charset = "utf-8"
+
+    def stream(self, ingredients):
+        separator = "["
+        for row in shopping_list_rows(ingredients):
+            yield separator + json.dumps(
+                dict(zip(SHOPPING_LIST_FIELDS, row)), ensure_ascii=False
+            )
+            separator = ","
+        yield "[]" if separator == "[" else "]"
+
+
+class PreRenderedJSONRenderer(JSONRenderer):
+    """
+    Json, который отдаёт готовое тело ответа из атрибута json данных,
+    например списков справочников recipes.reference.JSONList.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rendered = getattr(data, "json", None)
+        if rendered is not None and (
+            self.get_indent(accepted_media_type, renderer_context or {})
+            is None
+        ):
+            return rendered
+        return super().render(data, accepted_media_type, renderer_context)
@@ -1,4 +1,5 @@
 from drf_spectacular.extensions import OpenApiViewExtension
+from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import (
     OpenApiParameter,
     OpenApiResponse,
@@ -10,10 +11,47 @@ from rest_framework import serializers
 
 from api.serializers.recipe_serializers import (
     FavoriteSerializer,
+    FavoriteShoppingSerializer,
+    RecipeIdsSerializer,
+    RecipeReadSerializer,
+    ShoppingListJobSerializer,
     ShoppingSerializer,
 )
 from api.serializers.user_serializers import SubscribeSerializer
 
+SPARSE_FIELDS_PARAMETERS = [
+    OpenApiParameter(
+        name="fields",
+        type=str,
+        required=False,
+        description="Поля ответа через запятую, остальные не передаются.",
+    ),
+    OpenApiParameter(
+        name="omit",
+        type=str,
+        required=False,
+        description="Поля через запятую, которые не нужно передавать.",
+    ),
+]
+
+
+class PantryRecipeSerializer(RecipeReadSerializer):
+    """Рецепт в подборе по продуктам."""
+
+    coverage = serializers.FloatField(
+        help_text="Доля ингредиентов рецепта, которые есть у пользователя."
+    )
+    missing_count = serializers.IntegerField(
+        help_text="Количество недостающих ингредиентов."
+    )
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = (
+            *RecipeReadSerializer.Meta.fields,
+            "coverage",
+            "missing_count",
+        )
+
 
 # ==============RECIPE=====================
 class RecipeViewSetExtension(OpenApiViewExtension):
@@ -29,7 +67,41 @@ class RecipeViewSetExtension(OpenApiViewExtension):
                 description=(
                     "Доступно любому неавторизованному пользователю. Доступна "
                     "фильтрация по избранному, автору, списку покупок и тегам."
+                    " Параметр `cursor` включает курсорную пагинацию: первая "
+                    "страница запрашивается с пустым `cursor=`, следующие по "
+                    "ссылкам `next` и `previous`, поле `count` не передаётся."
+                    " Параметр `search` ищет по названию и описанию и "
+                    "сортирует рецепты по релевантности, вместе с `cursor` "
+                    "или `ordering` он возвращает ошибку 400."
+                    " Параметр `ordering=popular` сортирует рецепты по "
+                    "популярности: добавлениям в избранное и списки покупок,"
+                    " вес которых убывает со временем. Популярность "
+                    "пересчитывается периодически."
+                    " Ответ содержит ETag: с заголовком `If-None-Match` "
+                    "неизменившаяся страница возвращается с кодом 304."
                 ),
+                parameters=[
+                    OpenApiParameter(
+                        name="cursor",
+                        type=str,
+                        required=False,
+                        description="Курсор страницы.",
+                    ),
+                    OpenApiParameter(
+                        name="search",
+                        type=str,
+                        required=False,
+                        description="Поиск по названию и описанию рецепта.",
+                    ),
+                    OpenApiParameter(
+                        name="ordering",
+                        type=str,
+                        enum=["popular"],
+                        required=False,
+                        description="Сортировка по популярности.",
+                    ),
+                    *SPARSE_FIELDS_PARAMETERS,
+                ],
                 auth=[],
             ),
             create=extend_schema(
@@ -40,8 +112,12 @@ class RecipeViewSetExtension(OpenApiViewExtension):
                 summary="Получение рецепта",
                 description=(
                     "Детальная информация о рецепте. Доступно любому "
-                    "неавторизованному пользователю."
+                    "неавторизованному пользователю. Ответ содержит ETag и "
+                    "Last-Modified: с заголовками `If-None-Match` или "
+                    "`If-Modified-Since` неизменившийся рецепт возвращается "
+                    "с кодом 304."
                 ),
+                parameters=SPARSE_FIELDS_PARAMETERS,
                 auth=[],
             ),
             update=extend_schema(
@@ -116,6 +192,170 @@ class RecipeViewSetExtension(OpenApiViewExtension):
             def shopping_cart(self, request, *args, **kwargs):
                 return super().shopping_cart(request, *args, **kwargs)
 
+            @extend_schema(
+                methods=["post"],
+                operation_id="favorite_bulk_create",
+                summary="Добавление нескольких рецептов в избранные",
+                description=(
+                    "Добавляет рецепты из списка `recipes` одной транзакцией, "
+                    "уже добавленные рецепты пропускаются. "
+                    "Доступно только авторизованному пользователю."
+                ),
+                tags=["Избранные рецепты"],
+                request=RecipeIdsSerializer,
+                responses={201: FavoriteShoppingSerializer(many=True)},
+            )
+            @extend_schema(
+                methods=["delete"],
+                operation_id="favorite_bulk_destroy",
+                summary="Удаление нескольких рецептов из избранных",
+                description=(
+                    "Удаляет рецепты из списка `recipes` одним запросом. "
+                    "Доступно только авторизованному пользователю."
+                ),
+                tags=["Избранные рецепты"],
+                request=RecipeIdsSerializer,
+                responses={
+                    204: OpenApiResponse(
+                        description="Рецепты удалены из избранных"
+                    )
+                },
+            )
+            def favorite_bulk(self, request, *args, **kwargs):
+                return super().favorite_bulk(request, *args, **kwargs)
+
+            @extend_schema(
+                methods=["post"],
+                operation_id="shopping_cart_bulk_create",
+                summary="Добавление нескольких рецептов в список покупок",
+                description=(
+                    "Добавляет рецепты из списка `recipes` одной транзакцией, "
+                    "уже добавленные рецепты пропускаются. "
+                    "Доступно только авторизованному пользователю."
+                ),
+                tags=["Список покупок"],
+                request=RecipeIdsSerializer,
+                responses={201: FavoriteShoppingSerializer(many=True)},
+            )
+            @extend_schema(
+                methods=["delete"],
+                operation_id="shopping_cart_bulk_destroy",
+                summary="Удаление нескольких рецептов из списка покупок",
+                description=(
+                    "Удаляет рецепты из списка `recipes` одним запросом. "
+                    "Доступно только авторизованному пользователю."
+                ),
+                tags=["Список покупок"],
+                request=RecipeIdsSerializer,
+                responses={
+                    204: OpenApiResponse(
+                        description="Рецепты удалены из списка покупок"
+                    )
+                },
+            )
+            def shopping_cart_bulk(self, request, *args, **kwargs):
+                return super().shopping_cart_bulk(request, *args, **kwargs)
+
+            @extend_schema(
+                summary="Лента подписок",
+                description=(
+                    "Новые рецепты авторов, на которых подписан "
+                    "пользователь, от новых к старым. Следующая страница "
+                    "запрашивается по ссылке `next`. Доступно только "
+                    "авторизованному пользователю."
+                ),
+                parameters=[
+                    OpenApiParameter(
+                        name="cursor",
+                        type=str,
+                        required=False,
+                        description="Курсор страницы.",
+                    ),
+                    OpenApiParameter(
+                        name="limit",
+                        type=int,
+                        required=False,
+                        description="Количество рецептов на странице.",
+                    ),
+                    *SPARSE_FIELDS_PARAMETERS,
+                ],
+                responses={
+                    200: inline_serializer(
+                        name="FeedResponse",
+                        fields={
+                            "next": serializers.URLField(allow_null=True),
+                            "previous": serializers.URLField(allow_null=True),
+                            "results": RecipeReadSerializer(many=True),
+                        },
+                    )
+                },
+            )
+            def feed(self, request, *args, **kwargs):
+                return super().feed(request, *args, **kwargs)
+
+            @extend_schema(
+                summary="Что приготовить из продуктов",
+                description=(
+                    "Рецепты, в которых есть хотя бы один из продуктов "
+                    "`ingredients`. Выше рецепты с большей долей имеющихся "
+                    "ингредиентов (`coverage`), затем с меньшим количеством "
+                    "недостающих (`missing_count`), затем более новые. "
+                    "Доступно любому пользователю."
+                ),
+                parameters=[
+                    OpenApiParameter(
+                        name="ingredients",
+                        type=int,
+                        many=True,
+                        required=True,
+                        description="Id ингредиентов, которые есть дома.",
+                    ),
+                    OpenApiParameter(
+                        name="page",
+                        type=int,
+                        required=False,
+                        description="Номер страницы.",
+                    ),
+                    OpenApiParameter(
+                        name="limit",
+                        type=int,
+                        required=False,
+                        description="Количество рецептов на странице.",
+                    ),
+                    *SPARSE_FIELDS_PARAMETERS,
+                ],
+                responses={
+                    200: inline_serializer(
+                        name="PantryResponse",
+                        fields={
+                            "count": serializers.IntegerField(),
+                            "next": serializers.URLField(allow_null=True),
+                            "previous": serializers.URLField(allow_null=True),
+                            "results": PantryRecipeSerializer(many=True),
+                        },
+                    )
+                },
+            )
+            def pantry(self, request, *args, **kwargs):
+                return super().pantry(request, *args, **kwargs)
+
+            @extend_schema(
+                summary="Похожие рецепты",
+                description=(
+                    "Рецепты, которые пользователи чаще всего добавляют в "
+                    "избранное и список покупок вместе с этим рецептом, "
+                    "от более похожих к менее похожим. Список обновляется "
+                    "периодически, для рецепта без совместных сохранений "
+                    "он пустой. Доступно любому пользователю."
+                ),
+                responses={
+                    200: FavoriteShoppingSerializer(many=True),
+                    404: OpenApiResponse(description="Рецепт не найден"),
+                },
+            )
+            def related(self, request, *args, **kwargs):
+                return super().related(request, *args, **kwargs)
+
         return Fixed
 
 
@@ -130,9 +370,28 @@ class ShoppingCartDownloadAPIViewExtension(OpenApiViewExtension):
             get=extend_schema(
                 summary="Скачать список покупок",
                 description=(
-                    "Скачать файл со списком покупок. "
+                    "Скачать файл со списком покупок. Формат выбирается "
+                    "заголовком `Accept` или параметром `format`. "
                     "Доступно только авторизованным пользователям."
                 ),
+                parameters=[
+                    OpenApiParameter(
+                        name="format",
+                        type=str,
+                        enum=["pdf", "csv", "txt", "json"],
+                        required=False,
+                        description="Формат файла, по умолчанию pdf.",
+                    ),
+                ],
+                responses={
+                    (200, media_type): OpenApiTypes.BINARY
+                    for media_type in (
+                        "application/pdf",
+                        "text/csv",
+                        "text/plain",
+                        "application/json",
+                    )
+                },
             ),
         )
         class Fixed(self.target_class):
@@ -141,6 +400,52 @@ class ShoppingCartDownloadAPIViewExtension(OpenApiViewExtension):
         return Fixed
 
 
+class ShoppingListJobViewSetExtension(OpenApiViewExtension):
+    target_class = "api.views.recipe_views.ShoppingListJobViewSet"
+
+    def view_replacement(self):
+        from recipes.models import ShoppingListJob
+
+        @extend_schema(tags=["Список покупок"])
+        @extend_schema_view(
+            create=extend_schema(
+                summary="Заказать формирование списка покупок",
+                description=(
+                    "Ставит в очередь задачу на формирование pdf-файла "
+                    "списка покупок. Если у пользователя уже есть "
+                    "незавершённая задача, возвращается она. "
+                    "Доступно только авторизованным пользователям."
+                ),
+                request=None,
+                responses={202: ShoppingListJobSerializer},
+            ),
+            retrieve=extend_schema(
+                summary="Статус задачи на формирование списка покупок",
+                description=(
+                    "Когда задача выполнена, в поле `download_url` "
+                    "появляется ссылка на скачивание файла."
+                ),
+            ),
+            download=extend_schema(
+                summary="Скачать сформированный список покупок",
+                description=(
+                    "Возвращает pdf-файл выполненной задачи. Пока задача "
+                    "не выполнена, возвращается `HTTP_409_CONFLICT`."
+                ),
+                responses={
+                    (200, "application/pdf"): OpenApiTypes.BINARY,
+                    409: OpenApiResponse(
+                        description="Список покупок ещё не готов"
+                    ),
+                },
+            ),
+        )
+        class Fixed(self.target_class):
+            queryset = ShoppingListJob.objects.none()
+
+        return Fixed
+
+
 class TagViewSetExtension(OpenApiViewExtension):
     target_class = "api.views.recipe_views.TagViewSet"
 
@@ -203,6 +508,7 @@ class CustomUserViewSetExtension(OpenApiViewExtension):
             list=extend_schema(
                 summary="Список пользователей",
                 description="Получение списка пользователей",
+                parameters=SPARSE_FIELDS_PARAMETERS,
             ),
             create=extend_schema(
                 summary="Регистрация пользователя",
@@ -211,6 +517,7 @@ class CustomUserViewSetExtension(OpenApiViewExtension):
             retrieve=extend_schema(
                 summary="Получение пользователя",
                 description="Получение определенного пользователя по id",
+                parameters=SPARSE_FIELDS_PARAMETERS,
             ),
             update=extend_schema(
                 summary="Обновление данных пользователя",
@@ -343,6 +650,7 @@ class CustomUserViewSetExtension(OpenApiViewExtension):
                 description="Получение профиля пользователя.",
                 tags=["Пользователи"],
                 operation_id="me_get",
+                parameters=SPARSE_FIELDS_PARAMETERS,
             )
             @extend_schema(
                 methods=["put"],
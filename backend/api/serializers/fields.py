@@ -0,0 +1,59 @@
+from drf_spectacular.utils import extend_schema_field
+from rest_framework import serializers
+
+from recipes.images import FORMATS, is_ready
+from recipes.models import Recipe
+
+
+def get_image_url(name, request) -> str | None:
+    """Ссылка на изображение так же, как её строит ImageField в DRF."""
+    if not name:
+        return None
+    url = Recipe._meta.get_field("image").storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def get_image_srcset(variants, image_name, request) -> dict | None:
+    """
+    Значения srcset уменьшенных копий изображения по форматам или None,
+    пока копии текущего изображения не построены.
+    """
+    if not is_ready(variants, image_name):
+        return None
+    return {
+        key: ", ".join(
+            f"{get_image_url(name, request)} {width}w"
+            for name, width in zip(variants[key], variants["widths"])
+        )
+        for key in FORMATS
+    }
+
+
+@extend_schema_field(
+    {
+        "type": "object",
+        "nullable": True,
+        "description": (
+            "Уменьшенные копии изображения в формате атрибута srcset. "
+            "Пока копии не построены - null, используется image."
+        ),
+        "properties": {
+            key: {"type": "string", "example": f"http://foodgram/a.{key} 320w"}
+            for key in FORMATS
+        },
+    }
+)
+class ImageSrcsetField(serializers.Field):
+    """Копии изображения рецепта для атрибута srcset."""
+
+    def __init__(self, **kwargs):
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        return get_image_srcset(
+            recipe.image_variants,
+            recipe.image.name,
+            self.context.get("request"),
+        )
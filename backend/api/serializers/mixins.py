@@ -0,0 +1,54 @@
+from functools import cached_property
+
+from rest_framework import serializers
+
+
+def split_param(value) -> set[str]:
+    return {name.strip() for name in (value or "").split(",") if name.strip()}
+
+
+def get_requested_fields(request, available) -> list[str]:
+    """
+    Поля ответа из параметров ?fields= и ?omit= в порядке объявления.
+
+    Без параметров возвращаются все поля, неизвестные имена игнорируются.
+    """
+    if request is None:
+        return list(available)
+    params = getattr(request, "query_params", request.GET)
+    fields = split_param(params.get("fields"))
+    omit = split_param(params.get("omit"))
+    return [
+        name
+        for name in available
+        if (not fields or name in fields) and name not in omit
+    ]
+
+
+class SparseFieldsMixin:
+    """
+    Ограничение полей ответа параметрами ?fields= и ?omit=.
+
+    Действует только на корневой сериализатор ответа, вложенные
+    сериализаторы отдаются целиком.
+    """
+
+    @property
+    def is_response_root(self) -> bool:
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    @cached_property
+    def _readable_fields(self):
+        fields = list(super()._readable_fields)
+        if not self.is_response_root:
+            return fields
+        requested = set(
+            get_requested_fields(
+                self.context.get("request"),
+                [field.field_name for field in fields],
+            )
+        )
+        return [field for field in fields if field.field_name in requested]
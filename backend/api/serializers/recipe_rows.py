@@ -0,0 +1,216 @@
+"""
+Быстрая сериализация рецептов для чтения.
+
+Строит тот же JSON, что и RecipeReadSerializer, из строк .values() и
+словарей, без полей DRF. Эквивалентность ответов проверяется тестами,
+скорость сравнивается командой bench_recipe_serializers.
+
+Теги и ингредиенты берутся из реестра справочников по id без
+соединения с их таблицами, теги рецепта восстанавливаются по его
+маске tags_mask.
+"""
+
+from collections import defaultdict
+
+from api.cache import (
+    COUNTER_FIELDS,
+    add_recipe_counters,
+    get_recipe_counters,
+    get_saved_recipe_ids,
+)
+from api.serializers.fields import get_image_srcset, get_image_url
+from api.serializers.mixins import get_requested_fields
+from api.serializers.recipe_serializers import RecipeReadSerializer
+from recipes.models import IngredientRecipe, Recipe
+from recipes.reference import get_reference_data
+
+RECIPE_FIELDS = RecipeReadSerializer.Meta.fields
+AUTHOR_FIELDS = ("id", "email", "username", "first_name", "last_name")
+FLAGS = ("is_favorited", "is_in_shopping_cart")
+# Поля ответа, которые строятся отдельными запросами или из кэша.
+RELATED = ("tags", "ingredients", *FLAGS)
+
+
+def recipe_rows(queryset, fields=RECIPE_FIELDS):
+    """
+    Строки рецептов с автором одним запросом, одинаковые для всех
+    пользователей.
+
+    Выбираются только колонки полей fields, а также id, pub_date и
+    popularity, нужные для курсорной пагинации, и updated_at для ETag.
+    """
+    columns = ["id", "pub_date", "popularity", "updated_at"]
+    for name in fields:
+        if name == "author":
+            columns.extend(f"author__{field}" for field in AUTHOR_FIELDS)
+        elif name == "tags":
+            columns.append("tags_mask")
+        elif name == "image_srcset":
+            columns.extend(
+                column
+                for column in ("image", "image_variants")
+                if column not in columns
+            )
+        elif name not in RELATED and name not in columns:
+            columns.append(name)
+    return queryset.prefetch_related(None).values(*columns)
+
+
+def get_tag_ids(rows, reference) -> dict[int, list[int]]:
+    """
+    Id тегов рецептов по маске, а если у каких-то тегов id не
+    помещается в маску - по таблице связей.
+    """
+    tag_ids = defaultdict(list)
+    if not reference.tags_in_mask:
+        links = Recipe.tags.through.objects.filter(
+            recipe_id__in=[row["id"] for row in rows]
+        ).values_list("recipe_id", "tag_id")
+        for recipe_id, tag_id in links:
+            tag_ids[recipe_id].append(tag_id)
+        return tag_ids
+    for row in rows:
+        mask = row["tags_mask"]
+        while mask:
+            bit = mask & -mask
+            tag_ids[row["id"]].append(bit.bit_length())
+            mask ^= bit
+    return tag_ids
+
+
+def get_tags(rows, reference) -> dict[int, list[dict]]:
+    tag_ids = get_tag_ids(rows, reference)
+    tags = reference.get_tags(
+        {tag_id for ids in tag_ids.values() for tag_id in ids}
+    )
+    return {
+        recipe_id: reference.sort_tags(
+            tags[tag_id] for tag_id in ids if tag_id in tags
+        )
+        for recipe_id, ids in tag_ids.items()
+    }
+
+
+def get_ingredients(recipe_ids, reference) -> dict[int, list[dict]]:
+    rows = list(
+        IngredientRecipe.objects.filter(recipe_id__in=recipe_ids)
+        .order_by("id")
+        .values_list("recipe_id", "ingredient_id", "amount")
+    )
+    found = reference.get_ingredients(
+        {ingredient_id for _, ingredient_id, _ in rows} - {None}
+    )
+    ingredients = defaultdict(list)
+    for recipe_id, ingredient_id, amount in rows:
+        if ingredient_id not in found:
+            # DRF пропускает поля с источником через пустую связь.
+            ingredients[recipe_id].append({"amount": amount})
+            continue
+        ingredients[recipe_id].append(
+            {**found[ingredient_id], "amount": amount}
+        )
+    return ingredients
+
+
+def get_tags_and_ingredients(rows, fields) -> tuple[dict, dict]:
+    """Теги и ингредиенты рецептов, если эти поля запрошены."""
+    tags, ingredients = {}, {}
+    if rows and ("tags" in fields or "ingredients" in fields):
+        reference = get_reference_data()
+        if "tags" in fields:
+            tags = get_tags(rows, reference)
+        if "ingredients" in fields:
+            ingredients = get_ingredients(
+                [row["id"] for row in rows], reference
+            )
+    return tags, ingredients
+
+
+def serialize_recipes(rows, request, flags=True) -> list[dict]:
+    """
+    Представление рецептов, совпадающее с RecipeReadSerializer,
+    с учётом параметров ?fields= и ?omit=.
+
+    При flags=False флаги пользователя не заполняются, и представление
+    одинаково для всех пользователей.
+    """
+    fields = get_requested_fields(request, RECIPE_FIELDS)
+    rows = list(rows)
+    recipe_ids = [row["id"] for row in rows]
+    tags, ingredients = get_tags_and_ingredients(rows, fields)
+    recipes = []
+    for row in rows:
+        data = {}
+        for name in fields:
+            if name == "tags":
+                data[name] = tags.get(row["id"], [])
+            elif name == "ingredients":
+                data[name] = ingredients.get(row["id"], [])
+            elif name == "author":
+                data[name] = {
+                    **{
+                        field: row[f"author__{field}"]
+                        for field in AUTHOR_FIELDS
+                    },
+                    "is_subscribed": False,
+                }
+            elif name in FLAGS:
+                data[name] = False
+            elif name == "image":
+                data[name] = get_image_url(row[name], request)
+            elif name == "image_srcset":
+                data[name] = get_image_srcset(
+                    row["image_variants"], row["image"], request
+                )
+            else:
+                data[name] = row[name]
+        recipes.append(data)
+    if flags:
+        set_flags(recipes, recipe_ids, request)
+    return recipes
+
+
+def set_flags(recipes, recipe_ids, request):
+    """
+    Флаги is_favorited и is_in_shopping_cart из множеств id рецептов
+    пользователя в кэше, без запросов к избранному и спискам покупок.
+    """
+    if request is None or not request.user.is_authenticated:
+        return
+    saved = get_saved_recipe_ids(request.user.id)
+    for data, recipe_id in zip(recipes, recipe_ids):
+        for flag in FLAGS:
+            if flag in data:
+                data[flag] = recipe_id in saved[flag]
+
+
+def get_counters_version(recipes) -> list[list[int]]:
+    """Счётчики рецептов в представлении, входящие в ETag страницы."""
+    return [
+        [data[name] for name in COUNTER_FIELDS if name in data]
+        for data in recipes
+    ]
+
+
+def cache_counters(recipes, recipe_ids):
+    """Сохранение в кэш счётчиков только что прочитанных рецептов."""
+    for data, recipe_id in zip(recipes, recipe_ids):
+        if all(name in data for name in COUNTER_FIELDS):
+            add_recipe_counters(
+                recipe_id, [data[name] for name in COUNTER_FIELDS]
+            )
+
+
+def set_counters(recipes, recipe_ids):
+    """
+    Счётчики рецептов сохранённой страницы из кэша по рецептам: при
+    добавлении в избранное и список покупок страницы не сбрасываются.
+    """
+    if not any(name in data for data in recipes for name in COUNTER_FIELDS):
+        return
+    counters = get_recipe_counters(recipe_ids)
+    for data, recipe_id in zip(recipes, recipe_ids):
+        if recipe_id in counters:
+            for name, value in zip(COUNTER_FIELDS, counters[recipe_id]):
+                if name in data:
+                    data[name] = value
@@ -1,15 +1,27 @@
+from django.db import transaction
+from django.urls import reverse
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
+from api.cache import SAVED_MODELS, get_saved_recipe_ids
+from api.serializers.fields import ImageSrcsetField
+from api.serializers.mixins import SparseFieldsMixin
 from api.serializers.user_serializers import CustomUserSerializer
+from recipes.counters import change_recipes_count
+from recipes.feed import fan_out_recipe
 from recipes.models import (
     Favorite,
     Ingredient,
     IngredientRecipe,
     Recipe,
     ShoppingCart,
+    ShoppingListJob,
     Tag,
 )
+from recipes.shopping_list import (
+    change_recipe_in_shopping_lists,
+    get_recipe_amounts,
+)
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -42,19 +54,18 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "measurement_unit", "amount")
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализатор просмотра рецептов."""
 
     image = Base64ImageField()
+    image_srcset = ImageSrcsetField()
     author = CustomUserSerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
     ingredients = IngredientRecipeSerializer(
         many=True, source="recipe_ingredients"
     )
-    is_favorited = serializers.ReadOnlyField(read_only=True, default=False)
-    is_in_shopping_cart = serializers.ReadOnlyField(
-        read_only=True, default=False
-    )
+    is_favorited = serializers.SerializerMethodField()
+    is_in_shopping_cart = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -65,12 +76,32 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             "ingredients",
             "is_favorited",
             "is_in_shopping_cart",
+            "favorites_count",
+            "in_carts_count",
             "name",
             "image",
+            "image_srcset",
             "text",
             "cooking_time",
         )
 
+    def get_saved_recipe_ids(self) -> dict[str, frozenset[int]]:
+        """Id рецептов пользователя, одни на все рецепты в контексте."""
+        if "saved_recipe_ids" not in self.context:
+            request = self.context.get("request")
+            self.context["saved_recipe_ids"] = (
+                get_saved_recipe_ids(request.user.id)
+                if request is not None and request.user.is_authenticated
+                else dict.fromkeys(SAVED_MODELS, frozenset())
+            )
+        return self.context["saved_recipe_ids"]
+
+    def get_is_favorited(self, recipe) -> bool:
+        return recipe.id in self.get_saved_recipe_ids()["is_favorited"]
+
+    def get_is_in_shopping_cart(self, recipe) -> bool:
+        return recipe.id in self.get_saved_recipe_ids()["is_in_shopping_cart"]
+
 
 # =============== Create Recipe ===============================
 
@@ -131,23 +162,31 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             for ingredient in ingredients
         )
 
+    @transaction.atomic
     def create(self, validated_data: dict):
         tags = validated_data.pop("tags")
         ingredients = validated_data.pop("ingredients")
         author = self.context.get("request").user
         recipe = Recipe.objects.create(author=author, **validated_data)
+        change_recipes_count(author.id, 1)
         recipe.tags.set(tags)
         self.create_ingredients(ingredients, recipe)
+        fan_out_recipe(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop("tags", None)
         ingredients = validated_data.pop("ingredients", None)
         if tags is not None:
             instance.tags.set(tags)
         if ingredients is not None:
+            old_amounts = get_recipe_amounts([instance.id])
             instance.ingredients.clear()
             self.create_ingredients(ingredients, instance)
+            change_recipe_in_shopping_lists(
+                instance.id, old_amounts, get_recipe_amounts([instance.id])
+            )
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
@@ -168,6 +207,43 @@ class FavoriteShoppingSerializer(serializers.ModelSerializer):
         read_only_fields = ("recipe", "user")
 
 
+class PantrySerializer(serializers.Serializer):
+    """Сериализатор продуктов для подбора рецептов."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100,
+    )
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Сериализатор списка рецептов для массовых операций."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100,
+    )
+
+    def validate_recipes(self, value: list[int]) -> list[Recipe]:
+        recipe_ids = list(dict.fromkeys(value))
+        recipes = Recipe.objects.filter(id__in=recipe_ids).only(
+            "id", "name", "image", "cooking_time"
+        )
+        recipes = {recipe.id: recipe for recipe in recipes}
+        missing = [
+            str(recipe_id)
+            for recipe_id in recipe_ids
+            if recipe_id not in recipes
+        ]
+        if missing:
+            raise serializers.ValidationError(
+                f"Рецепты не найдены: {', '.join(missing)}."
+            )
+        return [recipes[recipe_id] for recipe_id in recipe_ids]
+
+
 class FavoriteSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(source="recipe.id", read_only=True)
     name = serializers.ReadOnlyField(source="recipe.name")
@@ -200,3 +276,27 @@ class ShoppingSerializer(FavoriteSerializer):
             "recipe": {"write_only": True},
             "user": {"write_only": True},
         }
+
+
+class ShoppingListJobSerializer(serializers.ModelSerializer):
+    """Сериализатор задачи на формирование списка покупок."""
+
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ShoppingListJob
+        fields = (
+            "id",
+            "status",
+            "error",
+            "created",
+            "finished",
+            "download_url",
+        )
+
+    def get_download_url(self, obj) -> str | None:
+        """Ссылка на скачивание готового файла."""
+        if obj.status != ShoppingListJob.Status.DONE:
+            return None
+        url = reverse("api:shopping_list_jobs-download", args=[obj.id])
+        return self.context["request"].build_absolute_uri(url)
@@ -3,11 +3,13 @@ from drf_extra_fields.fields import Base64ImageField
 from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 
+from api.serializers.fields import ImageSrcsetField
+from api.serializers.mixins import SparseFieldsMixin
 from recipes.models import Recipe
 from users.models import Subscribe, User
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(SparseFieldsMixin, UserSerializer):
     """Сериализатор пользователя."""
 
     is_subscribed = serializers.BooleanField(read_only=True, default=False)
@@ -34,10 +36,11 @@ class CustomUserCreateSerializer(UserCreateSerializer):
 
 class RecipeForSubscribeSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
+    image_srcset = ImageSrcsetField()
 
     class Meta:
         model = Recipe
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "image_srcset", "cooking_time")
 
 
 class SubscribeSerializer(serializers.ModelSerializer):
@@ -51,7 +54,10 @@ class SubscribeSerializer(serializers.ModelSerializer):
         many=True, source="author.recipes", read_only=True
     )
     is_subscribed = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(read_only=True)
+    recipes_count = serializers.ReadOnlyField(source="author.recipes_count")
+    subscribers_count = serializers.ReadOnlyField(
+        source="author.subscribers_count"
+    )
 
     class Meta:
         model = Subscribe
@@ -65,6 +71,7 @@ class SubscribeSerializer(serializers.ModelSerializer):
             "author",
             "is_subscribed",
             "recipes_count",
+            "subscribers_count",
         )
         extra_kwargs = {
             "author": {"write_only": True},
@@ -0,0 +1,55 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from api.cache import (
+    bump_generation,
+    invalidate_saved_recipe_ids,
+    refresh_recipe_counters,
+)
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    Tag,
+    counters_changed,
+    recipes_updated,
+    saved_recipes_deleted,
+)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver(recipes_updated, sender=Recipe)
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipes_changed(sender, **kwargs):
+    # Поколение меняется после фиксации транзакции, чтобы параллельный
+    # запрос не сохранил в кэш ещё не изменённые данные под новым ключом.
+    transaction.on_commit(bump_generation)
+
+
+@receiver(counters_changed, sender=Recipe)
+def counters_updated(sender, recipe_ids, **kwargs):
+    # Страницы списка не сбрасываются: счётчики подставляются в них из
+    # кэша по рецептам при каждом ответе.
+    transaction.on_commit(partial(refresh_recipe_counters, recipe_ids))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def saved_recipes_changed(sender, instance, **kwargs):
+    invalidate_saved_recipe_ids(instance.user_id, sender)
+
+
+@receiver(saved_recipes_deleted, sender=Favorite)
+@receiver(saved_recipes_deleted, sender=ShoppingCart)
+def saved_recipes_removed(sender, user_ids, **kwargs):
+    for user_id in user_ids:
+        invalidate_saved_recipe_ids(user_id, sender)
@@ -5,6 +5,7 @@ from .views.recipe_views import (
     IngredientViewSet,
     RecipeViewSet,
     ShoppingCartDownloadAPIView,
+    ShoppingListJobViewSet,
     TagViewSet,
 )
 from api.views.user_views import CustomUserViewSet
@@ -16,6 +17,11 @@ router.register("recipes", RecipeViewSet, basename="recipes")
 router.register("tags", TagViewSet, basename="tags")
 router.register("ingredients", IngredientViewSet, basename="ingredients")
 router.register("users", CustomUserViewSet, basename="users")
+router.register(
+    "recipes/download_shopping_cart/jobs",
+    ShoppingListJobViewSet,
+    basename="shopping_list_jobs",
+)
 
 urlpatterns = [
     path(
@@ -1,69 +1,176 @@
-import weasyprint
 from django.conf import settings
-from django.db.models import Exists, OuterRef, Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.template.loader import render_to_string
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import status, viewsets
+from rest_framework import generics, mixins, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from ..filters import RecipeFilter, SearchIngredientsFilter
-from ..paginators import CustomPaginator
+from ..cache import (
+    get_cached_recipes,
+    invalidate_saved_recipe_ids,
+    set_cached_recipes,
+)
+from ..conditional import (
+    get_not_modified,
+    get_page_etag,
+    get_user_etag,
+    get_validator_headers,
+    make_etag,
+)
+from ..exceptions import ShoppingListUnavailable
+from ..filters import (
+    RecipeFilter,
+    RecipeSearchFilter,
+    SearchIngredientsFilter,
+)
+from ..paginators import (
+    CustomPaginator,
+    FeedPaginator,
+    RecipeCursorPaginator,
+)
+from ..renderers import (
+    PDFRenderer,
+    PreRenderedJSONRenderer,
+    ShoppingListCSVRenderer,
+    ShoppingListJSONRenderer,
+    ShoppingListTextRenderer,
+)
 from ..serializers.recipe_serializers import (
     FavoriteSerializer,
+    FavoriteShoppingSerializer,
     IngredientSerializer,
+    PantrySerializer,
     RecipeCreateSerializer,
+    RecipeIdsSerializer,
     RecipeReadSerializer,
+    ShoppingListJobSerializer,
     ShoppingSerializer,
     TagSerializer,
 )
+from ..serializers.mixins import get_requested_fields
+from ..serializers.recipe_rows import (
+    cache_counters,
+    get_counters_version,
+    recipe_rows,
+    serialize_recipes,
+    set_counters,
+    set_flags,
+)
 from api.permissions import IsAuthorOrReadOnly
+from recipes.counters import (
+    change_favorites_count,
+    change_in_carts_count,
+    change_recipes_count,
+)
+from recipes.feed import get_feed
 from recipes.models import (
     Favorite,
     Ingredient,
-    IngredientRecipe,
     Recipe,
+    RelatedRecipe,
     ShoppingCart,
+    ShoppingListJob,
     Tag,
 )
+from recipes.pantry import search_pantry
+from recipes.pdf_pool import RenderPoolBusy, RenderTimeout
+from recipes.reference import REFERENCE, get_reference_data
+from recipes.shopping_list import (
+    add_to_shopping_list,
+    get_shopping_list,
+    get_shopping_list_pdf,
+    remove_from_shopping_list,
+)
+from users.models import User
+
+# Колонки рецепта, не загружаемые, если не запрошено ни одно поле,
+# которое из них строится.
+DEFERRABLE_FIELDS = {
+    "name": ("name",),
+    "image": ("image", "image_srcset"),
+    "image_variants": ("image_srcset",),
+    "text": ("text",),
+    "cooking_time": ("cooking_time",),
+}
+# Фильтры, с которыми список рецептов зависит от пользователя.
+USER_FILTERS = ("is_favorited", "is_in_shopping_cart")
+
+
+class UserLockMixin:
+    def lock_user(self):
+        """
+        Блокировка строки пользователя упорядочивает его параллельные
+        изменения избранного, списка покупок и задач списка покупок:
+        проверка существующих строк и изменения выполняются после
+        предыдущего запроса.
+        """
+        User.objects.select_for_update().filter(
+            id=self.request.user.id
+        ).exists()
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(UserLockMixin, viewsets.ModelViewSet):
     """Класс представления рецептов."""
 
     queryset = Recipe.objects.all()
     serializer_class = RecipeCreateSerializer
     pagination_class = CustomPaginator
     permission_classes = (IsAuthorOrReadOnly,)
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (DjangoFilterBackend, RecipeSearchFilter)
     filterset_class = RecipeFilter
+    lookup_value_regex = r"\d+"
+
+    def get_requested_fields(self) -> list[str]:
+        """Поля рецепта, запрошенные параметрами ?fields= и ?omit=."""
+        fields = RecipeReadSerializer.Meta.fields
+        if self.request.method != "GET":
+            return list(fields)
+        return get_requested_fields(self.request, fields)
 
     def get_queryset(self):
+        """
+        Связанные объекты и колонки выбираются только для запрошенных
+        полей. Флаги пользователя берутся из кэша, поэтому запрос
+        одинаков для всех пользователей.
+        """
         queryset = super().get_queryset()
-        # queryset = queryset.annotate()
-        if self.request.user.is_authenticated:
-            is_in_shopping_cart_subquery = Exists(
-                ShoppingCart.objects.filter(
-                    recipe_id=OuterRef("id"), user=self.request.user
-                )
+        fields = self.get_requested_fields()
+        if "author" in fields:
+            queryset = queryset.select_related("author")
+        if "ingredients" in fields:
+            queryset = queryset.prefetch_related(
+                "recipe_ingredients__ingredient"
             )
-            queryset = queryset.annotate(
-                is_in_shopping_cart=is_in_shopping_cart_subquery
+        if "tags" in fields:
+            queryset = queryset.prefetch_related("tags")
+        return queryset.defer(
+            *(
+                column
+                for column, names in DEFERRABLE_FIELDS.items()
+                if not set(names) & set(fields)
             )
-            queryset = queryset.annotate(
-                is_favorited=Exists(
-                    Favorite.objects.filter(
-                        recipe_id=OuterRef("id"), user=self.request.user
-                    )
-                )
-            )
-        queryset = queryset.select_related("author")
-        queryset = queryset.prefetch_related("recipe_ingredients", "tags")
-        return queryset
+        )
+
+    @property
+    def paginator(self):
+        """Курсорная пагинация включается параметром cursor в запросе."""
+        if not hasattr(self, "_paginator"):
+            cursor_param = RecipeCursorPaginator.cursor_query_param
+            if cursor_param in self.request.query_params:
+                self._paginator = RecipeCursorPaginator()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        change_recipes_count(instance.author_id, -1)
+        super().perform_destroy(instance)
 
     def get_serializer_class(self):
         if self.request.method == "GET":
@@ -83,10 +190,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
             serializer = FavoriteSerializer(
                 data={"recipe": recipe.id, "user": user.id}
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with transaction.atomic():
+                self.lock_user()
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+                change_favorites_count([recipe.id], 1)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        get_object_or_404(Favorite, recipe=recipe, user=user).delete()
+        with transaction.atomic():
+            self.lock_user()
+            favorite = get_object_or_404(Favorite, recipe=recipe, user=user)
+            deleted, _ = favorite.delete()
+            change_favorites_count([recipe.id], -deleted)
         return Response(
             {"message": "Рецепт удален из избранных"},
             status=status.HTTP_204_NO_CONTENT,
@@ -105,56 +219,444 @@ class RecipeViewSet(viewsets.ModelViewSet):
             serializer = ShoppingSerializer(
                 data={"recipe": recipe.id, "user": user.id}
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with transaction.atomic():
+                self.lock_user()
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+                change_in_carts_count([recipe.id], 1)
+                add_to_shopping_list(user.id, [recipe.id])
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        get_object_or_404(ShoppingCart, recipe=recipe, user=user).delete()
+        with transaction.atomic():
+            self.lock_user()
+            cart = get_object_or_404(ShoppingCart, recipe=recipe, user=user)
+            deleted, _ = cart.delete()
+            change_in_carts_count([recipe.id], -deleted)
+            remove_from_shopping_list(user.id, [recipe.id])
         return Response(
             {"message": "Рецепт удален из списка покупок"},
             status=status.HTTP_204_NO_CONTENT,
         )
 
+    def change_recipes_bulk(self, model) -> tuple[list[Recipe], list[int]]:
+        """
+        Массовое добавление или удаление рецептов в списке пользователя.
+
+        Возвращает рецепты из запроса и id рецептов, которые действительно
+        были добавлены или удалены.
+        """
+        serializer = RecipeIdsSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        recipes = serializer.validated_data["recipes"]
+        user = self.request.user
+        self.lock_user()
+        existing = set(
+            model.objects.filter(user=user, recipe__in=recipes).values_list(
+                "recipe_id", flat=True
+            )
+        )
+        if self.request.method == "POST":
+            changed = [
+                recipe.id for recipe in recipes if recipe.id not in existing
+            ]
+            model.objects.bulk_create(
+                (
+                    model(user=user, recipe_id=recipe_id)
+                    for recipe_id in changed
+                ),
+                ignore_conflicts=True,
+            )
+        else:
+            changed = list(existing)
+            model.objects.filter(user=user, recipe_id__in=changed).delete()
+        # bulk_create и delete() без обработчиков сигналов модели не
+        # сбрасывают кэш id рецептов пользователя.
+        invalidate_saved_recipe_ids(user.id, model)
+        return recipes, changed
+
+    @action(
+        methods=["post", "delete"],
+        detail=False,
+        url_path="favorite",
+        url_name="favorite-bulk",
+        permission_classes=(IsAuthenticated,),
+    )
+    @transaction.atomic
+    def favorite_bulk(self, request):
+        """Массовое управление избранными рецептами."""
+        recipes, changed = self.change_recipes_bulk(Favorite)
+        if request.method == "POST":
+            change_favorites_count(changed, 1)
+            serializer = FavoriteShoppingSerializer(
+                recipes, many=True, context={"request": request}
+            )
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        change_favorites_count(changed, -1)
+        return Response(
+            {"message": "Рецепты удалены из избранных"},
+            status=status.HTTP_204_NO_CONTENT,
+        )
+
+    @action(
+        methods=["post", "delete"],
+        detail=False,
+        url_path="shopping_cart",
+        url_name="shopping-cart-bulk",
+        permission_classes=(IsAuthenticated,),
+    )
+    @transaction.atomic
+    def shopping_cart_bulk(self, request):
+        """Массовое управление списком покупок."""
+        recipes, changed = self.change_recipes_bulk(ShoppingCart)
+        if request.method == "POST":
+            change_in_carts_count(changed, 1)
+            add_to_shopping_list(request.user.id, changed)
+            serializer = FavoriteShoppingSerializer(
+                recipes, many=True, context={"request": request}
+            )
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        change_in_carts_count(changed, -1)
+        remove_from_shopping_list(request.user.id, changed)
+        return Response(
+            {"message": "Рецепты удалены из списка покупок"},
+            status=status.HTTP_204_NO_CONTENT,
+        )
+
+    @action(
+        methods=["get"],
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+    )
+    def feed(self, request):
+        """Новые рецепты авторов, на которых подписан пользователь."""
+        paginator = FeedPaginator()
+        recipe_ids = paginator.paginate_feed(
+            lambda position, limit: get_feed(request.user.id, position, limit),
+            request,
+        )
+        rows = {
+            row["id"]: row
+            for row in recipe_rows(
+                self.get_queryset().filter(id__in=recipe_ids),
+                self.get_requested_fields(),
+            )
+        }
+        # Рецепт мог быть удалён после чтения ленты.
+        page = [
+            rows[recipe_id] for recipe_id in recipe_ids if recipe_id in rows
+        ]
+        return paginator.get_paginated_response(
+            serialize_recipes(page, request)
+        )
+
+    @action(methods=["get"], detail=False)
+    def pantry(self, request):
+        """
+        Рецепты, которые можно приготовить из продуктов пользователя.
+
+        Рецепты ранжируются по индексу ингредиентов в памяти процесса,
+        из базы читается только страница ответа.
+        """
+        serializer = PantrySerializer(
+            data={"ingredients": request.query_params.getlist("ingredients")}
+        )
+        serializer.is_valid(raise_exception=True)
+        paginator = CustomPaginator()
+        matches = paginator.paginate_queryset(
+            search_pantry(serializer.validated_data["ingredients"]),
+            request,
+            view=self,
+        )
+        rows = {
+            row["id"]: row
+            for row in recipe_rows(
+                self.get_queryset().filter(
+                    id__in=[recipe_id for recipe_id, *_ in matches]
+                ),
+                self.get_requested_fields(),
+            )
+        }
+        # Рецепт мог быть удалён после обновления индекса.
+        matches = [match for match in matches if match[0] in rows]
+        recipes = serialize_recipes(
+            [rows[recipe_id] for recipe_id, *_ in matches], request
+        )
+        for data, (_, coverage, missing) in zip(recipes, matches):
+            data["coverage"] = coverage
+            data["missing_count"] = missing
+        return paginator.get_paginated_response(recipes)
+
+    @action(methods=["get"], detail=True)
+    def related(self, request, pk=None):
+        """
+        Рецепты, которые сохраняют вместе с этим рецептом.
+
+        Соседи заранее построены командой build_related_recipes и
+        читаются одним запросом по индексу. Наличие рецепта проверяется,
+        только если соседей нет.
+        """
+        related = list(
+            RelatedRecipe.objects.filter(recipe_id=pk)
+            .select_related("related")
+            .order_by("-score", "related_id")[: settings.RELATED_RECIPES_LIMIT]
+        )
+        if not related and not Recipe.objects.filter(pk=pk).exists():
+            raise Http404
+        serializer = FavoriteShoppingSerializer(
+            [item.related for item in related],
+            many=True,
+            context={"request": request},
+        )
+        return Response(serializer.data)
+
+    def list(self, request, *args, **kwargs):
+        """
+        Список рецептов строится из строк .values() без полей DRF.
+
+        Страницы без фильтров по избранному и списку покупок одинаковы
+        для всех пользователей и отдаются из кэша, флаги пользователя
+        подставляются из множеств id его рецептов, а счётчики - из кэша
+        счётчиков рецептов. Если ETag из
+        If-None-Match совпадает с ETag выбранной страницы, возвращается
+        304 без сериализации.
+        """
+        shared = not any(name in request.query_params for name in USER_FILTERS)
+        if shared:
+            cached = get_cached_recipes(request)
+            if cached is not None:
+                page_etag, data, recipe_ids = cached
+                set_counters(data["results"], recipe_ids)
+                etag = get_user_etag(
+                    request,
+                    make_etag(
+                        request,
+                        page_etag,
+                        get_counters_version(data["results"]),
+                    ),
+                )
+                not_modified = get_not_modified(request, etag)
+                if not_modified is not None:
+                    return not_modified
+                set_flags(data["results"], recipe_ids, request)
+                return Response(data, headers=get_validator_headers(etag))
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(
+            recipe_rows(queryset, self.get_requested_fields())
+        )
+        page_etag = get_page_etag(request, page, self.paginator)
+        # ETag совпадает с ETag той же страницы из кэша.
+        etag = get_user_etag(
+            request,
+            make_etag(request, page_etag, get_counters_version(page)),
+        )
+        not_modified = get_not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        recipes = serialize_recipes(page, request, flags=False)
+        response = self.get_paginated_response(recipes)
+        recipe_ids = [row["id"] for row in page]
+        if shared:
+            set_cached_recipes(request, page_etag, response.data, recipe_ids)
+            cache_counters(recipes, recipe_ids)
+        # Флаги заполняются после сохранения страницы в кэш.
+        set_flags(recipes, recipe_ids, request)
+        response["ETag"] = etag
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Рецепт строится из строки .values() без полей DRF.
+
+        ETag и Last-Modified берутся из updated_at строки рецепта, при
+        совпадении с заголовками запроса теги и ингредиенты не
+        загружаются.
+        """
+        queryset = recipe_rows(
+            self.filter_queryset(self.get_queryset()),
+            self.get_requested_fields(),
+        )
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = generics.get_object_or_404(
+            queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        self.check_object_permissions(request, row)
+        etag = get_user_etag(request, make_etag(request, row["updated_at"]))
+        not_modified = get_not_modified(request, etag, row["updated_at"])
+        if not_modified is not None:
+            return not_modified
+        return Response(
+            serialize_recipes([row], request)[0],
+            headers=get_validator_headers(etag, row["updated_at"]),
+        )
+
+
+class ReferenceViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Справочник, который отдаётся из реестра в памяти процесса без
+    запросов к его таблице. ETag ответа строится по версии реестра.
+
+    items_attr и list_attr - атрибуты ReferenceData со словарём
+    элементов по id и списком для ответа.
+    """
+
+    permission_classes = (AllowAny,)
+    renderer_classes = (PreRenderedJSONRenderer, BrowsableAPIRenderer)
+    lookup_value_regex = r"\d+"
+    items_attr = None
+    list_attr = None
+
+    def get_reference_list(self, reference) -> list[dict]:
+        return getattr(reference, self.list_attr)
+
+    def get_reference_response(self, reference, data):
+        etag = make_etag(self.request, REFERENCE, reference.version)
+        not_modified = get_not_modified(self.request, etag)
+        if not_modified is not None:
+            return not_modified
+        return Response(data, headers=get_validator_headers(etag))
+
+    def list(self, request, *args, **kwargs):
+        reference = get_reference_data()
+        return self.get_reference_response(
+            reference, self.get_reference_list(reference)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        reference = get_reference_data()
+        item = getattr(reference, self.items_attr).get(int(kwargs["pk"]))
+        if item is None:
+            raise Http404
+        return self.get_reference_response(reference, item)
+
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ReferenceViewSet):
     """Класс представления тегов."""
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
-    permission_classes = (AllowAny,)
+    items_attr = "tags"
+    list_attr = "tag_list"
+
 
+class IngredientViewSet(ReferenceViewSet):
+    """
+    Класс представления ингредиентов.
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
-    """Класс представления ингредиентов."""
+    При поиске ингредиенты, начинающиеся с запроса, идут раньше
+    совпадений по подстроке.
+    """
 
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    permission_classes = (AllowAny,)
     filter_backends = (SearchIngredientsFilter,)
     search_fields = ("^name",)
+    items_attr = "ingredients"
+    list_attr = "ingredient_list"
+
+    def get_reference_list(self, reference) -> list[dict]:
+        query = self.request.query_params.get(
+            SearchIngredientsFilter.search_param, ""
+        ).strip()
+        if not query:
+            return super().get_reference_list(reference)
+        return reference.ingredient_index.search(query)
 
 
 class ShoppingCartDownloadAPIView(APIView):
-    """Скачать список покупок."""
+    """
+    Скачать список покупок.
+
+    Формат выбирается по заголовку Accept или параметру `?format=`:
+    pdf (по умолчанию), csv, txt или json. Все форматы, кроме pdf,
+    отдаются потоком без загрузки всего списка в память.
+    """
 
     permission_classes = (IsAuthenticated,)
+    renderer_classes = (
+        PDFRenderer,
+        ShoppingListCSVRenderer,
+        ShoppingListTextRenderer,
+        ShoppingListJSONRenderer,
+    )
+
+    def handle_exception(self, exc):
+        # Ошибки отдаются в json независимо от запрошенного формата.
+        self.request.accepted_renderer = JSONRenderer()
+        self.request.accepted_media_type = JSONRenderer.media_type
+        return super().handle_exception(exc)
 
     def get(self, request):
-        ingredients = (
-            IngredientRecipe.objects.filter(
-                recipe__shopping__user=request.user
+        renderer = request.accepted_renderer
+        if renderer.format == PDFRenderer.format:
+            try:
+                pdf = get_shopping_list_pdf(request.user.id)
+            except (RenderPoolBusy, RenderTimeout):
+                raise ShoppingListUnavailable
+            response = HttpResponse(pdf, content_type=PDFRenderer.media_type)
+        else:
+            ingredients = get_shopping_list(request.user).iterator()
+            content_type = f"{renderer.media_type}; charset={renderer.charset}"
+            response = StreamingHttpResponse(
+                renderer.stream(ingredients), content_type=content_type
             )
-            .values("ingredient__name", "ingredient__measurement_unit")
-            .annotate(sum_amount=Sum("amount"))
+        response["Content-Disposition"] = (
+            f"attachment; filename=shortlist.{renderer.format}"
         )
-        html = render_to_string(
-            "shopping_cart.html", {"ingredients": ingredients}
+        return response
+
+
+class ShoppingListJobViewSet(
+    UserLockMixin,
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
+):
+    """Фоновое формирование списка покупок."""
+
+    serializer_class = ShoppingListJobSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        queryset = ShoppingListJob.objects.filter(user=self.request.user)
+        return queryset.defer("file")
+
+    def create(self, request, *args, **kwargs):
+        """
+        Постановка задачи в очередь.
+
+        Если у пользователя уже есть незавершённая задача, возвращается она.
+        Проверка и создание выполняются под блокировкой пользователя,
+        чтобы параллельные запросы не создали две задачи.
+        """
+        with transaction.atomic():
+            self.lock_user()
+            job = (
+                self.get_queryset()
+                .filter(
+                    status__in=(
+                        ShoppingListJob.Status.PENDING,
+                        ShoppingListJob.Status.PROCESSING,
+                    )
+                )
+                .first()
+            )
+            if job is None:
+                job = ShoppingListJob.objects.create(user=request.user)
+        serializer = self.get_serializer(job)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    @action(methods=["get"], detail=True)
+    def download(self, request, pk=None):
+        """Скачивание готового файла."""
+        job = get_object_or_404(
+            ShoppingListJob.objects.filter(user=request.user), pk=pk
         )
-        response = HttpResponse(content_type="application/pdf")
-        response["Content-Disposition"] = "attachment; filename=shortlist.pdf"
-        weasyprint.HTML(string=html).write_pdf(
-            response,
-            stylesheets=[
-                weasyprint.CSS(f"{settings.STATICFILES_DIRS[0]}/css/pdf.css")
-            ],
+        if job.status != ShoppingListJob.Status.DONE:
+            return Response(
+                {"message": "Список покупок ещё не готов"},
+                status=status.HTTP_409_CONFLICT,
+            )
+        response = HttpResponse(
+            bytes(job.file), content_type="application/pdf"
         )
+        response["Content-Disposition"] = "attachment; filename=shortlist.pdf"
         return response
@@ -1,4 +1,5 @@
-from django.db.models import Count, Exists, OuterRef
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status
@@ -12,6 +13,8 @@ from api.serializers.user_serializers import (
     CustomUserSerializer,
     SubscribeSerializer,
 )
+from recipes.counters import change_subscribers_count
+from recipes.feed import add_author_to_feed, remove_author_from_feed
 from users.models import Subscribe, User
 
 
@@ -50,11 +53,18 @@ class CustomUserViewSet(UserViewSet):
                 context={"request": request},
             )
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
+                change_subscribers_count(id, 1)
+                add_author_to_feed(subscriber.id, id)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        get_object_or_404(
+        subscribe = get_object_or_404(
             Subscribe, subscriber=subscriber, author__id=id
-        ).delete()
+        )
+        with transaction.atomic():
+            deleted, _ = subscribe.delete()
+            change_subscribers_count(id, -deleted)
+            remove_author_from_feed(subscriber.id, id)
         return Response(
             {"message": "Подписка удалена"}, status=status.HTTP_204_NO_CONTENT
         )
@@ -67,8 +77,8 @@ class CustomUserViewSet(UserViewSet):
         subscriber = request.user
         subscribe = (
             Subscribe.objects.filter(subscriber=subscriber)
+            .select_related("author")
             .prefetch_related("author__recipes")
-            .annotate(recipes_count=Count("author__recipes"))
         ).order_by("author__email")
         page = self.paginate_queryset(subscribe)
         serializer = SubscribeSerializer(
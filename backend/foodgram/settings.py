@@ -162,6 +162,81 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 
+# Кэш общий для всех процессов gunicorn и обработчиков. Версии кэша
+# списка рецептов меняются через cache.add и cache.incr, которые должны
+# быть атомарными между процессами, поэтому используется Redis: в
+# файловом кэше параллельные incr теряют изменения
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_URL", default="redis://redis:6379/0"),
+    }
+}
+
+if os.getenv("DB") == "sqlite":
+    # Сервер разработки работает в одном процессе
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Время хранения страниц списка рецептов для анонимных пользователей
+RECIPES_CACHE_TIMEOUT = 10 * 60
+# Время хранения id рецептов в избранном и списке покупок пользователя
+SAVED_RECIPES_CACHE_TIMEOUT = 60 * 60
+
+# Рецепты авторов, у которых подписчиков больше этого числа, не
+# рассылаются по лентам подписчиков, а читаются при запросе ленты
+FEED_FANOUT_LIMIT = int(os.getenv("FEED_FANOUT_LIMIT", default=1000))
+# Количество последних рецептов автора, добавляемых в ленту при подписке
+FEED_BACKFILL = 50
+
+# Если у выбранных тегов меньше связей с рецептами, фильтр по тегам
+# выбирает рецепты по индексу таблицы связей, иначе проверяет маску тегов
+TAGS_MASK_MIN_LINKS = 1000
+
+# Количество похожих рецептов, сохраняемых и отдаваемых для рецепта
+RELATED_RECIPES_LIMIT = 10
+
+# Период полураспада веса добавления в избранное или список покупок в
+# популярности рецепта, в днях. После изменения популярность нужно
+# пересчитать командой update_popularity --all
+POPULARITY_HALF_LIFE_DAYS = float(
+    os.getenv("POPULARITY_HALF_LIFE_DAYS", default=7)
+)
+
+# Ширины уменьшенных копий изображений рецептов в пикселях: карточка в
+# списке, она же для экранов с двойной плотностью и страница рецепта.
+# Копии в WebP и JPEG строит обработчик image_variants_worker
+RECIPE_IMAGE_VARIANTS = {"card": 320, "retina": 640, "detail": 960}
+RECIPE_IMAGE_QUALITY = 80
+# Файлы изображений называются по sha256 содержимого и общие у рецептов.
+# Файл, записанный позже этого числа секунд назад, не удаляется: такой
+# же мог быть загружен в ещё не зафиксированной транзакции.
+MEDIA_RELEASE_GRACE = 5 * 60
+
+# Пул процессов для формирования pdf-файлов, PROCESSES=0 отключает пул
+PDF_RENDER_POOL = {
+    "PROCESSES": int(os.getenv("PDF_RENDER_PROCESSES", default=2)),
+    "MAX_QUEUE": int(os.getenv("PDF_RENDER_MAX_QUEUE", default=8)),
+    "TIMEOUT": 30,
+    "MAX_TASKS_PER_CHILD": 100,
+    "MAX_MEMORY": 512 * 1024 * 1024,
+}
+
+# Кэш pdf-файлов списков покупок. Каталог должен быть общим у web и
+# shopping_list_worker: изменения списков покупок сбрасывают ссылки
+# пользователей на файлы в web, а фоновые задачи читают их в обработчике
+SHOPPING_LIST_CACHE = {
+    "DIR": os.getenv(
+        "SHOPPING_LIST_CACHE_DIR",
+        default=os.path.join(BASE_DIR, "cache", "shopping_lists"),
+    ),
+    "MAX_SIZE": 100 * 1024 * 1024,
+    "MAX_AGE": 7 * 24 * 60 * 60,
+}
+
 # Документация
 
 with open(f"{BASE_DIR}/api_description.md", encoding="utf-8") as file:
@@ -1,16 +1,32 @@
 from django.contrib import admin
 
-from .models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from .models import (
+    Favorite, Ingredient, Recipe, ShoppingCart, ShoppingListJob, Tag,
+    saved_recipes_deleted
+)
+from .shopping_list import (
+    change_recipe_in_shopping_lists, get_recipe_amounts,
+    rebuild_shopping_list
+)
 
 EMPTY = '-пусто-'
 
 
+class SavedRecipesAdmin(admin.ModelAdmin):
+    """Массовое удаление избранного и списков покупок с сигналом."""
+
+    def delete_queryset(self, request, queryset):
+        user_ids = set(queryset.values_list('user_id', flat=True))
+        super().delete_queryset(request, queryset)
+        saved_recipes_deleted.send(sender=self.model, user_ids=user_ids)
+
+
 class IngredientsInLine(admin.TabularInline):
     model = Recipe.ingredients.through
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(SavedRecipesAdmin):
     list_display = ['id', 'user', 'recipe']
     search_fields = ['user__username', 'user__email']
     empty_value_display = EMPTY
@@ -26,22 +42,65 @@ class IngredientAdmin(admin.ModelAdmin):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ['id', 'name', 'author', 'favorites']
+    list_display = [
+        'id', 'name', 'author', 'favorites_count', 'in_carts_count'
+    ]
     search_fields = ['name', 'author__username']
     list_filter = ['tags', 'author', 'name']
     empty_value_display = EMPTY
     inlines = (IngredientsInLine,)
 
-    def favorites(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+    def save_related(self, request, form, formsets, change):
+        # Ингредиенты из формы попадают в сводные списки покупок так же,
+        # как при изменении рецепта через API.
+        recipe_id = form.instance.id
+        old_amounts = get_recipe_amounts([recipe_id]) if change else {}
+        super().save_related(request, form, formsets, change)
+        if change:
+            change_recipe_in_shopping_lists(
+                recipe_id, old_amounts, get_recipe_amounts([recipe_id])
+            )
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(SavedRecipesAdmin):
+    """Сводные списки покупок затронутых пользователей пересчитываются."""
+
     list_display = ['id', 'user', 'recipe']
     search_fields = ['user__username', 'user__email']
     empty_value_display = EMPTY
 
+    def save_model(self, request, obj, form, change):
+        user_ids = {obj.user_id}
+        if change:
+            user_ids.update(
+                ShoppingCart.objects.filter(pk=obj.pk).values_list(
+                    'user_id', flat=True
+                )
+            )
+        super().save_model(request, obj, form, change)
+        for user_id in user_ids:
+            rebuild_shopping_list(user_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        rebuild_shopping_list(obj.user_id)
+
+    def delete_queryset(self, request, queryset):
+        user_ids = set(queryset.values_list('user_id', flat=True))
+        super().delete_queryset(request, queryset)
+        for user_id in user_ids:
+            rebuild_shopping_list(user_id)
+
+
+@admin.register(ShoppingListJob)
+class ShoppingListJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'status', 'created', 'finished']
+    list_filter = ['status']
+    search_fields = ['user__username', 'user__email']
+    exclude = ['file']
+    empty_value_display = EMPTY
+
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
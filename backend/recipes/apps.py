@@ -1,5 +1,27 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def restore_search(sender, using, **kwargs):
+    """
+    Восстановление структур поиска после migrate: SQLite пересоздаёт
+    таблицу рецептов при изменении колонок вместе с её триггерами.
+    """
+    from django.db.migrations.recorder import MigrationRecorder
+
+    from recipes.search import install_search
+
+    connection = connections[using]
+    applied = MigrationRecorder(connection).applied_migrations()
+    if ('recipes', '0010_recipe_search') in applied:
+        install_search(connection)
 
 
 class RecipesConfig(AppConfig):
     name = 'recipes'
+
+    def ready(self):
+        import recipes.signals  # noqa: F401
+
+        post_migrate.connect(restore_search, sender=self)
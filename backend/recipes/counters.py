@@ -0,0 +1,79 @@
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from recipes.models import Favorite, Recipe, ShoppingCart, counters_changed
+from users.models import Subscribe, User
+
+# Счётчик: (модель со счётчиком, поле, модель строк, поле связи).
+COUNTERS = (
+    (Recipe, "favorites_count", Favorite, "recipe"),
+    (Recipe, "in_carts_count", ShoppingCart, "recipe"),
+    (User, "recipes_count", Recipe, "author"),
+    (User, "subscribers_count", Subscribe, "author"),
+)
+
+
+def count_rows(model, field):
+    """Подзапрос с количеством строк model, ссылающихся на объект."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(total=Count("*"))
+            .values("total")
+        ),
+        0,
+    )
+
+
+def change_counter(model, field, ids, delta: int):
+    """Атомарное изменение счётчика на delta у объектов с данными id."""
+    ids = list(ids)
+    if ids and delta:
+        values = {field: F(field) + delta}
+        if model is Recipe:
+            # Счётчики рецепта входят в ответ API и меняют его ETag, а
+            # избранное и списки покупок - его популярность.
+            values["updated_at"] = values["activity_at"] = timezone.now()
+        model.objects.filter(id__in=ids).update(**values)
+        if model is Recipe:
+            counters_changed.send(sender=Recipe, recipe_ids=ids)
+
+
+def change_favorites_count(recipe_ids, delta: int):
+    change_counter(Recipe, "favorites_count", recipe_ids, delta)
+
+
+def change_in_carts_count(recipe_ids, delta: int):
+    change_counter(Recipe, "in_carts_count", recipe_ids, delta)
+
+
+def change_recipes_count(user_id, delta: int):
+    change_counter(User, "recipes_count", [user_id], delta)
+
+
+def change_subscribers_count(user_id, delta: int):
+    change_counter(User, "subscribers_count", [user_id], delta)
+
+
+def reconcile_counters(check=False) -> dict[str, list[int]]:
+    """
+    Сверка счётчиков с фактическим количеством строк.
+
+    Возвращает id объектов с расхождениями для каждого счётчика,
+    при check=False расхождения исправляются.
+    """
+    drifted = {}
+    for model, field, rows_model, rows_field in COUNTERS:
+        queryset = model.objects.annotate(
+            actual=count_rows(rows_model, rows_field)
+        ).filter(~Q(**{field: F("actual")}))
+        ids = list(queryset.values_list("id", flat=True))
+        if ids and not check:
+            model.objects.filter(id__in=ids).update(
+                **{field: count_rows(rows_model, rows_field)}
+            )
+        drifted[f"{model._meta.model_name}.{field}"] = ids
+    return drifted
@@ -0,0 +1,199 @@
+"""
+Лента рецептов авторов, на которых подписан пользователь.
+
+Рецепт при публикации записывается в FeedEntry каждого подписчика
+автора, поэтому страница ленты читается по индексу (user, pub_date)
+за время, зависящее только от размера страницы. Исключение - авторы
+с подписчиками больше FEED_FANOUT_LIMIT: рассылка их рецептов слишком
+дорога, и при чтении ленты их рецепты выбираются из таблицы рецептов
+по индексу (author, pub_date) и сливаются с записями ленты.
+"""
+
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import OuterRef, Q
+
+from recipes.models import FeedEntry, Recipe
+from users.models import Subscribe, User
+
+
+def is_fanout_author(author_id) -> bool:
+    """Рецепты автора рассылаются по лентам подписчиков."""
+    return User.objects.filter(
+        id=author_id, subscribers_count__lte=settings.FEED_FANOUT_LIMIT
+    ).exists()
+
+
+def fan_out_recipe(recipe):
+    """Добавление нового рецепта в ленты подписчиков автора."""
+    if not is_fanout_author(recipe.author_id):
+        return
+    subscriber_ids = Subscribe.objects.filter(
+        author_id=recipe.author_id
+    ).values_list("subscriber_id", flat=True)
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(
+                user_id=user_id, recipe_id=recipe.id, pub_date=recipe.pub_date
+            )
+            for user_id in subscriber_ids.iterator()
+        ),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_feeds(user_ids, author_id):
+    """Последние рецепты автора в лентах пользователей user_ids."""
+    recipes = list(
+        Recipe.objects.filter(author_id=author_id)
+        .order_by("-pub_date", "id")
+        .values_list("id", "pub_date")[: settings.FEED_BACKFILL]
+    )
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for user_id in user_ids
+            for recipe_id, pub_date in recipes
+        ),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def get_subscribers_count(author_id) -> int:
+    return User.objects.values_list("subscribers_count", flat=True).get(
+        id=author_id
+    )
+
+
+def add_author_to_feed(user_id, author_id):
+    """
+    Последние рецепты автора в ленте нового подписчика.
+
+    Вызывается после увеличения счётчика подписчиков. Если автор только
+    что превысил FEED_FANOUT_LIMIT, его рецепты удаляются из всех лент:
+    новые рецепты больше не рассылаются, и лента читает их напрямую.
+    """
+    subscribers_count = get_subscribers_count(author_id)
+    if subscribers_count == settings.FEED_FANOUT_LIMIT + 1:
+        FeedEntry.objects.filter(recipe__author_id=author_id).delete()
+    if subscribers_count > settings.FEED_FANOUT_LIMIT:
+        return
+    backfill_feeds([user_id], author_id)
+
+
+def remove_author_from_feed(user_id, author_id):
+    """
+    Удаление рецептов автора из ленты бывшего подписчика.
+
+    Вызывается после уменьшения счётчика подписчиков. Если автор
+    вернулся к рассылке, ленты оставшихся подписчиков заполняются его
+    последними рецептами, которые до этого читались напрямую.
+    """
+    FeedEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id
+    ).delete()
+    if get_subscribers_count(author_id) == settings.FEED_FANOUT_LIMIT:
+        backfill_feeds(
+            Subscribe.objects.filter(author_id=author_id)
+            .values_list("subscriber_id", flat=True)
+            .iterator(),
+            author_id,
+        )
+
+
+def after_position(position, date_field, id_field) -> Q:
+    """Условие для строк после позиции (pub_date, id) в порядке ленты."""
+    pub_date, recipe_id = position
+    return Q(**{f"{date_field}__lt": pub_date}) | Q(
+        **{date_field: pub_date, f"{id_field}__gt": recipe_id}
+    )
+
+
+def get_feed(user_id, position=None, limit=10) -> list[tuple]:
+    """
+    Позиции (pub_date, id) рецептов ленты после position, от новых
+    к старым, не больше limit.
+    """
+    entries = FeedEntry.objects.filter(user_id=user_id)
+    # Подписки на авторов без рассылки: обычно их единицы.
+    direct = Recipe.objects.filter(
+        author__in=Subscribe.objects.filter(
+            subscriber_id=user_id,
+            author__subscribers_count__gt=settings.FEED_FANOUT_LIMIT,
+        ).values("author_id")
+    )
+    if position is not None:
+        entries = entries.filter(
+            after_position(position, "pub_date", "recipe_id")
+        )
+        direct = direct.filter(after_position(position, "pub_date", "id"))
+    entries = entries.order_by("-pub_date", "recipe_id").values_list(
+        "pub_date", "recipe_id"
+    )
+    direct = direct.order_by("-pub_date", "id").values_list("pub_date", "id")
+    fetch = limit
+    while True:
+        sources = [list(entries[:fetch]), list(direct[:fetch])]
+        # Первые fetch строк слияния верны, даже если источник обрезан.
+        # После изменения FEED_FANOUT_LIMIT рецепт может быть в обоих
+        # источниках, пока ленты не сверены rebuild_feeds: повторы
+        # пропускаются, и недостающие строки дочитываются.
+        merged = heapq.merge(
+            *sources, key=lambda row: (-row[0].timestamp(), row[1])
+        )
+        feed = []
+        for row in islice(merged, fetch):
+            if not feed or feed[-1] != row:
+                feed.append(row)
+        if len(feed) >= limit or all(
+            len(source) < fetch for source in sources
+        ):
+            return feed[:limit]
+        fetch += limit - len(feed)
+
+
+def rebuild_feeds(check=False) -> dict[str, int]:
+    """
+    Сверка лент с подписками.
+
+    Лента каждого подписчика автора с рассылкой должна содержать
+    последние FEED_BACKFILL рецептов автора, записей от авторов без
+    подписки и без рассылки в ней быть не должно. Возвращает
+    количество недостающих и лишних записей, при check=False
+    расхождения исправляются.
+    """
+    subscriptions = Subscribe.objects.filter(
+        author__subscribers_count__lte=settings.FEED_FANOUT_LIMIT
+    ).values_list("subscriber_id", "author_id")
+    missing = []
+    for user_id, author_id in subscriptions.iterator():
+        recipes = Recipe.objects.filter(author_id=author_id).order_by(
+            "-pub_date", "id"
+        )[: settings.FEED_BACKFILL]
+        existing = set(
+            FeedEntry.objects.filter(
+                user_id=user_id, recipe__author_id=author_id
+            ).values_list("recipe_id", flat=True)
+        )
+        missing.extend(
+            FeedEntry(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for recipe_id, pub_date in recipes.values_list("id", "pub_date")
+            if recipe_id not in existing
+        )
+    extra = FeedEntry.objects.exclude(
+        recipe__author__in=Subscribe.objects.filter(
+            subscriber_id=OuterRef("user_id"),
+            author__subscribers_count__lte=settings.FEED_FANOUT_LIMIT,
+        ).values("author_id")
+    )
+    extra_count = extra.count()
+    if not check:
+        FeedEntry.objects.bulk_create(
+            missing, batch_size=1000, ignore_conflicts=True
+        )
+        extra.delete()
+    return {"missing": len(missing), "extra": extra_count}
@@ -0,0 +1,215 @@
+"""
+Уменьшенные копии изображений рецептов в WebP и JPEG.
+
+Сохранение рецепта с новым изображением отмечает его в
+image_changed_at, обработчик image_variants_worker строит копии
+ширинами из RECIPE_IMAGE_VARIANTS и записывает их в image_variants
+вместе с именем исходного файла:
+
+    {"source": "recipes/images/<sha256>.png", "widths": [320, 640],
+     "webp": ["recipes/variants/<sha256>_png-320-q80.webp", ...],
+     "jpeg": ["recipes/variants/<sha256>_png-320-q80.jpg", ...]}
+
+Пока source не совпадает с текущим изображением, API отдаёт только
+оригинал. Имена копий определяются исходным файлом и параметрами
+сжатия, поэтому копии общие у рецептов с одинаковым изображением, не
+меняются под своим именем и удаляются вместе с исходным файлом, когда
+на него перестают ссылаться рецепты. Файлы, которые не удалось удалить
+сразу, удаляет периодически запускаемая команда release_unused_images.
+"""
+
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe, recipes_updated
+
+VARIANTS_DIR = "recipes/variants"
+# Формат в image_variants: (формат Pillow, расширение файла).
+FORMATS = {"webp": ("WEBP", "webp"), "jpeg": ("JPEG", "jpg")}
+# Ошибки чтения файла, после которых рецепт остаётся с оригиналом.
+IMAGE_ERRORS = (OSError, ValueError, Image.DecompressionBombError)
+
+
+def get_storage():
+    return Recipe._meta.get_field("image").storage
+
+
+def is_ready(variants, image_name) -> bool:
+    """Копии построены для текущего изображения рецепта."""
+    return bool(image_name) and variants.get("source") == image_name
+
+
+def variant_stem(source) -> str:
+    return PurePosixPath(source).name.replace(".", "_")
+
+
+def variant_name(source, width, extension) -> str:
+    stem = variant_stem(source)
+    quality = settings.RECIPE_IMAGE_QUALITY
+    return f"{VARIANTS_DIR}/{stem}-{width}-q{quality}.{extension}"
+
+
+def get_widths(width) -> list[int]:
+    """Ширины копий без увеличения изображения."""
+    return sorted(
+        {min(size, width) for size in settings.RECIPE_IMAGE_VARIANTS.values()}
+    )
+
+
+def encode(image, image_format) -> bytes:
+    if image_format == "JPEG" and image.mode != "RGB":
+        # В JPEG нет прозрачности, фон делается белым.
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    output = BytesIO()
+    image.save(
+        output,
+        format=image_format,
+        quality=settings.RECIPE_IMAGE_QUALITY,
+        optimize=image_format == "JPEG",
+    )
+    return output.getvalue()
+
+
+def open_image(file) -> Image.Image:
+    """Изображение в RGB или RGBA с учётом поворота из EXIF."""
+    image = Image.open(file)
+    # JPEG декодируется сразу в уменьшенном масштабе, если обе стороны
+    # остаются не меньше самой широкой копии: после поворота из EXIF
+    # ширина может стать высотой.
+    largest = max(settings.RECIPE_IMAGE_VARIANTS.values())
+    image.draft("RGB", (largest, largest))
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (
+        "transparency" in image.info
+    )
+    return image.convert("RGBA" if has_alpha else "RGB")
+
+
+def build_variants(source) -> dict:
+    """Построение и сохранение копий изображения source."""
+    storage = get_storage()
+    with storage.open(source) as file:
+        image = open_image(file)
+    widths = get_widths(image.width)
+    variants = {"source": source, "widths": widths}
+    for key, (image_format, extension) in FORMATS.items():
+        variants[key] = []
+        for width in widths:
+            name = variant_name(source, width, extension)
+            # Копию уже построил рецепт с тем же изображением.
+            if not storage.exists(name):
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize(
+                    (width, height), Image.Resampling.LANCZOS
+                )
+                storage.save_derived(
+                    name, ContentFile(encode(resized, image_format))
+                )
+            variants[key].append(name)
+    return variants
+
+
+def variant_files(variants) -> set[str]:
+    return {name for key in FORMATS for name in variants.get(key, ())}
+
+
+def release_image(source, variants):
+    """
+    Удаление изображения и его копий, если на изображение больше не
+    ссылается ни один рецепт.
+
+    Недавно записанное изображение остаётся: такое же могло быть
+    загружено в ещё не зафиксированной транзакции, его удалит
+    release_unused_images. Копии удаляются в любом случае, недостающие
+    копии обработчик построит заново.
+    """
+    if not source or Recipe.objects.filter(image=source).exists():
+        return
+    storage = get_storage()
+    for name in variant_files(variants):
+        storage.delete(name)
+    if not storage.is_recent(source):
+        storage.delete(source)
+
+
+def release_unused_images(check=False) -> list[str]:
+    """
+    Удаление изображений и копий, на которые не ссылается ни один
+    рецепт и которые записаны раньше MEDIA_RELEASE_GRACE.
+
+    Копия относится к изображению по началу имени, поэтому копии
+    изображения, для которого обработчик ещё не записал результат, не
+    удаляются. Возвращает имена ненужных файлов, при check=True файлы
+    только находятся.
+    """
+    storage = get_storage()
+    images = set(
+        Recipe.objects.exclude(image__isnull=True)
+        .exclude(image="")
+        .values_list("image", flat=True)
+    )
+    stems = {variant_stem(name) for name in images}
+    unused = []
+    for directory in (Recipe._meta.get_field("image").upload_to, VARIANTS_DIR):
+        try:
+            _, files = storage.listdir(directory)
+        except FileNotFoundError:
+            continue
+        for filename in files:
+            name = f"{directory}/{filename}"
+            if directory == VARIANTS_DIR:
+                used = filename.rsplit("-", 2)[0] in stems
+            else:
+                used = name in images
+            if not used and not storage.is_recent(name):
+                unused.append(name)
+    if not check:
+        for name in unused:
+            storage.delete(name)
+    return sorted(unused)
+
+
+def update_image_variants(recipe) -> bool:
+    """
+    Копии изображения рецепта из строки с id, image и image_variants.
+
+    Результат записывается, только если изображение не изменилось за
+    время обработки, иначе рецепт остаётся отмеченным для следующей
+    обработки. Возвращает False, если файл не удалось прочитать: рецепт
+    остаётся с оригиналом.
+    """
+    source = recipe["image"]
+    built = True
+    try:
+        variants = build_variants(source) if source else {}
+    except IMAGE_ERRORS:
+        variants = {}
+        built = False
+    updated = Recipe.objects.filter(id=recipe["id"], image=source).update(
+        image_variants=variants,
+        image_changed_at=None,
+        updated_at=timezone.now(),
+    )
+    if updated:
+        recipes_updated.send(sender=Recipe)
+    else:
+        # Изображение заменено: оно и копии удаляются, если их не
+        # использует другой рецепт.
+        release_image(source, variants)
+    return built
+
+
+def get_pending(batch_size) -> list[dict]:
+    """Самые давние рецепты с изображениями без копий."""
+    return list(
+        Recipe.objects.filter(image_changed_at__isnull=False)
+        .order_by("image_changed_at")
+        .values("id", "image", "image_variants")[:batch_size]
+    )
@@ -0,0 +1,85 @@
+"""
+Индекс ингредиентов в памяти процесса для автодополнения.
+
+Справочник ингредиентов небольшой и почти не меняется, поэтому каждый
+процесс держит отсортированный список названий в нижнем регистре и
+ищет префикс двоичным поиском. Индекс входит в реестр справочников
+recipes.reference и пересобирается вместе с ним.
+"""
+
+import bisect
+
+from django.db.models import F
+
+from recipes.models import DataVersion
+
+
+def get_data_version(name) -> int:
+    return (
+        DataVersion.objects.filter(name=name)
+        .values_list("version", flat=True)
+        .first()
+        or 0
+    )
+
+
+def bump_data_version(name):
+    """Новая версия данных, процессы пересоберут свои индексы."""
+    updated = DataVersion.objects.filter(name=name).update(
+        version=F("version") + 1
+    )
+    if not updated:
+        DataVersion.objects.get_or_create(name=name, defaults={"version": 1})
+
+
+class IngredientIndex:
+    """Отсортированные по названию ингредиенты с поиском по префиксу."""
+
+    def __init__(self, ingredients, version=0):
+        self.version = version
+        self.ingredients = sorted(
+            ingredients, key=lambda item: (item["name"].lower(), item["id"])
+        )
+        self.keys = [item["name"].lower() for item in self.ingredients]
+        # Все названия одной строкой: поиск подстроки идёт через str.find
+        # вместо проверки каждого названия.
+        self.text = "\n".join(self.keys)
+        self.offsets = []
+        offset = 0
+        for key in self.keys:
+            self.offsets.append(offset)
+            offset += len(key) + 1
+
+    def prefix_range(self, prefix) -> range:
+        start = bisect.bisect_left(self.keys, prefix)
+        # Символ с максимальным кодом замыкает все строки с префиксом.
+        end = bisect.bisect_left(self.keys, prefix + "\U0010ffff", start)
+        return range(start, end)
+
+    def substring_indexes(self, query):
+        """Номера названий, содержащих запрос, по возрастанию."""
+        if "\n" in query:
+            return
+        position = self.text.find(query)
+        while position != -1:
+            index = bisect.bisect_right(self.offsets, position) - 1
+            yield index
+            if index + 1 == len(self.offsets):
+                return
+            position = self.text.find(query, self.offsets[index + 1])
+
+    def search(self, query) -> list[dict]:
+        """
+        Ингредиенты, в названии которых есть запрос.
+
+        Сначала идут названия, начинающиеся с запроса, затем остальные.
+        """
+        query = query.lower()
+        if not query:
+            return list(self.ingredients)
+        prefix = self.prefix_range(query)
+        return [self.ingredients[index] for index in prefix] + [
+            self.ingredients[index]
+            for index in self.substring_indexes(query)
+            if index not in prefix
+        ]
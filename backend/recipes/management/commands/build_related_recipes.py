@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from recipes.related import build_related_recipes
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересборка похожих рецептов по совместному добавлению в "
+        "избранное и список покупок."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=settings.RELATED_RECIPES_LIMIT,
+            help="Количество похожих рецептов для каждого рецепта.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=10000,
+            help=(
+                "Количество пользователей, сохранения которых читаются "
+                "одним запросом."
+            ),
+        )
+        parser.add_argument(
+            "--min-common",
+            type=int,
+            default=1,
+            help=(
+                "Минимальное количество пользователей, сохранивших оба "
+                "рецепта."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        built = build_related_recipes(
+            options["top"], options["chunk_size"], options["min_common"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Похожие рецепты построены: рецептов {built['recipes']}, "
+                f"записей {built['related']}."
+            )
+        )
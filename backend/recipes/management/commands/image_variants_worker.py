@@ -0,0 +1,51 @@
+import time
+
+from django.core.management import BaseCommand
+
+from recipes.images import get_pending, update_image_variants
+
+
+class Command(BaseCommand):
+    help = (
+        "Построение уменьшенных копий изображений рецептов в WebP и JPEG "
+        "для рецептов с новыми изображениями."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Обработать отмеченные рецепты и завершить работу.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=1.0,
+            help="Пауза между опросами, когда нет рецептов, в секундах.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=20,
+            help="Количество рецептов, выбираемых за один запрос.",
+        )
+
+    def handle(self, *args, **options):
+        # Несколько обработчиков могут взять один рецепт: имена копий
+        # зависят только от исходного файла, и запись результата
+        # условна, поэтому повтор лишь выполняет работу дважды.
+        while True:
+            recipes = get_pending(options["batch_size"])
+            if not recipes:
+                if options["once"]:
+                    break
+                time.sleep(options["sleep"])
+                continue
+            for recipe in recipes:
+                if update_image_variants(recipe):
+                    self.stdout.write(f"Рецепт {recipe['id']}: готово")
+                else:
+                    self.stderr.write(
+                        f"Рецепт {recipe['id']}: не удалось прочитать "
+                        f"изображение {recipe['image']}"
+                    )
@@ -3,7 +3,9 @@ import csv
 from django.conf import settings
 from django.core.management import BaseCommand
 
+from recipes.ingredient_index import bump_data_version
 from recipes.models import Ingredient, Tag
+from recipes.reference import REFERENCE
 
 
 class Command(BaseCommand):
@@ -32,3 +34,5 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         self.load_tags()
         self.load_ingredients()
+        # bulk_create и delete() без сигналов не меняют версию справочников.
+        bump_data_version(REFERENCE)
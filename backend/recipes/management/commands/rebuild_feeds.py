@@ -0,0 +1,30 @@
+from django.core.management import BaseCommand, CommandError
+
+from recipes.feed import rebuild_feeds
+
+
+class Command(BaseCommand):
+    help = (
+        "Проверка и восстановление лент подписок: последние рецепты "
+        "авторов из подписок и отсутствие записей без подписки."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только найти расхождения, не исправляя их.",
+        )
+
+    def handle(self, *args, **options):
+        drifted = rebuild_feeds(options["check"])
+        if not any(drifted.values()):
+            self.stdout.write(self.style.SUCCESS("Расхождений не найдено."))
+            return
+        summary = (
+            f"недостающих записей: {drifted['missing']}, "
+            f"лишних записей: {drifted['extra']}"
+        )
+        if options["check"]:
+            raise CommandError(f"Ленты расходятся с подписками: {summary}")
+        self.stdout.write(self.style.SUCCESS(f"Ленты исправлены: {summary}"))
@@ -0,0 +1,43 @@
+from django.core.management import BaseCommand, CommandError
+
+from recipes.models import ShoppingCart, ShoppingListItem
+from recipes.shopping_list import compute_shopping_list, rebuild_shopping_list
+
+
+class Command(BaseCommand):
+    help = "Проверка и восстановление сводных списков покупок."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только найти расхождения, не исправляя их.",
+        )
+
+    def handle(self, *args, **options):
+        user_ids = set(
+            ShoppingCart.objects.values_list("user_id", flat=True)
+        ) | set(ShoppingListItem.objects.values_list("user_id", flat=True))
+        drifted = []
+        for user_id in sorted(user_ids):
+            stored = dict(
+                ShoppingListItem.objects.filter(user_id=user_id).values_list(
+                    "ingredient_id", "amount"
+                )
+            )
+            if stored == compute_shopping_list(user_id):
+                continue
+            drifted.append(user_id)
+            if not options["check"]:
+                rebuild_shopping_list(user_id)
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Расхождений не найдено."))
+        elif options["check"]:
+            raise CommandError(
+                "Сводные списки покупок расходятся у пользователей: "
+                + ", ".join(map(str, drifted))
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f"Восстановлено списков: {len(drifted)}")
+            )
@@ -0,0 +1,38 @@
+from django.core.management import BaseCommand, CommandError
+
+from recipes.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = "Проверка и восстановление счётчиков рецептов и пользователей."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только найти расхождения, не исправляя их.",
+        )
+
+    def handle(self, *args, **options):
+        drifted = {
+            counter: ids
+            for counter, ids in reconcile_counters(options["check"]).items()
+            if ids
+        }
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Расхождений не найдено."))
+        elif options["check"]:
+            raise CommandError(
+                "Счётчики расходятся: "
+                + "; ".join(
+                    f"{counter}: {', '.join(map(str, ids))}"
+                    for counter, ids in drifted.items()
+                )
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    "Восстановлено счётчиков: "
+                    f"{sum(map(len, drifted.values()))}"
+                )
+            )
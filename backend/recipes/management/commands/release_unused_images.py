@@ -0,0 +1,26 @@
+from django.core.management import BaseCommand
+
+from recipes.images import release_unused_images
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаление изображений рецептов и их копий, на которые не "
+        "ссылается ни один рецепт. Запускается периодически."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только найти ненужные файлы, не удаляя их.",
+        )
+
+    def handle(self, *args, **options):
+        unused = release_unused_images(options["check"])
+        if options["check"]:
+            for name in unused:
+                self.stdout.write(name)
+        self.stdout.write(
+            self.style.SUCCESS(f"Ненужных файлов: {len(unused)}.")
+        )
@@ -0,0 +1,100 @@
+import time
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from recipes.models import ShoppingListJob
+from recipes.shopping_list import get_shopping_list_pdf
+
+Status = ShoppingListJob.Status
+
+
+class Command(BaseCommand):
+    help = "Обработка очереди задач на формирование списков покупок."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Обработать задачи в очереди и завершить работу.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=1.0,
+            help="Пауза между опросами пустой очереди, в секундах.",
+        )
+        parser.add_argument(
+            "--stale-timeout",
+            type=int,
+            default=300,
+            help=(
+                "Через сколько секунд зависшая задача возвращается "
+                "в очередь."
+            ),
+        )
+        parser.add_argument(
+            "--ttl",
+            type=int,
+            default=24 * 60 * 60,
+            help="Сколько секунд хранить завершённые задачи.",
+        )
+
+    def requeue_stale(self, timeout):
+        """Возврат в очередь задач, обработчик которых не завершился."""
+        ShoppingListJob.objects.filter(
+            status=Status.PROCESSING,
+            started__lt=timezone.now() - timedelta(seconds=timeout),
+        ).update(status=Status.PENDING, started=None)
+
+    def delete_expired(self, ttl):
+        ShoppingListJob.objects.filter(
+            status__in=(Status.DONE, Status.FAILED),
+            finished__lt=timezone.now() - timedelta(seconds=ttl),
+        ).delete()
+
+    def claim(self):
+        """
+        Захват самой старой задачи из очереди.
+
+        Задача переводится в статус processing условным UPDATE, поэтому
+        несколько обработчиков могут безопасно работать с одной очередью.
+        """
+        pending = (
+            ShoppingListJob.objects.filter(status=Status.PENDING)
+            .order_by("created")
+            .values_list("id", flat=True)
+        )
+        for job_id in pending[:10]:
+            claimed = ShoppingListJob.objects.filter(
+                id=job_id, status=Status.PENDING
+            ).update(status=Status.PROCESSING, started=timezone.now())
+            if claimed:
+                return ShoppingListJob.objects.defer("file").get(id=job_id)
+        return None
+
+    def process(self, job):
+        try:
+            job.file = get_shopping_list_pdf(job.user_id)
+        except Exception as error:
+            job.file = None
+            job.status = Status.FAILED
+            job.error = str(error)
+        else:
+            job.status = Status.DONE
+        job.finished = timezone.now()
+        job.save(update_fields=("status", "file", "error", "finished"))
+
+    def handle(self, *args, **options):
+        while True:
+            self.requeue_stale(options["stale_timeout"])
+            job = self.claim()
+            if job is None:
+                if options["once"]:
+                    break
+                self.delete_expired(options["ttl"])
+                time.sleep(options["sleep"])
+                continue
+            self.process(job)
+            self.stdout.write(f"Задача {job.id}: {job.status}")
@@ -0,0 +1,32 @@
+from django.core.management import BaseCommand
+
+from recipes.popularity import update_popularity
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчёт популярности рецептов, у которых изменилось избранное "
+        "или списки покупок. Запускается периодически."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help=(
+                "Пересчитать все рецепты, например после изменения "
+                "POPULARITY_HALF_LIFE_DAYS."
+            ),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Количество рецептов, пересчитываемых одной транзакцией.",
+        )
+
+    def handle(self, *args, **options):
+        updated = update_popularity(options["all"], options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Популярность пересчитана: {updated}.")
+        )
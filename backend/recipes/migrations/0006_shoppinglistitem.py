@@ -0,0 +1,82 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_shopping_lists(apps, schema_editor):
+    IngredientRecipe = apps.get_model("recipes", "IngredientRecipe")
+    ShoppingListItem = apps.get_model("recipes", "ShoppingListItem")
+    rows = (
+        IngredientRecipe.objects.filter(ingredient__isnull=False)
+        .values("recipe__shopping__user_id", "ingredient_id")
+        .annotate(total=Sum("amount"))
+        .filter(recipe__shopping__user_id__isnull=False)
+    )
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(
+                user_id=row["recipe__shopping__user_id"],
+                ingredient_id=row["ingredient_id"],
+                amount=row["total"],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0005_shoppinglistjob"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ShoppingListItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("amount", models.IntegerField(default=0, verbose_name="Количество")),
+                (
+                    "ingredient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shopping_list_items",
+                        to="recipes.ingredient",
+                        verbose_name="Ингредиент",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shopping_list_items",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Ингредиент списка покупок",
+                "verbose_name_plural": "Ингредиенты списков покупок",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "ingredient"), name="unique_user_ingredient"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
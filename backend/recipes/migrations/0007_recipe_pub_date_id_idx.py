@@ -0,0 +1,21 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0006_shoppinglistitem"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["-pub_date", "id"], name="recipe_pub_date_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:29
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_rows(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(total=Count("*"))
+            .values("total")
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model("recipes", "Recipe")
+    Favorite = apps.get_model("recipes", "Favorite")
+    ShoppingCart = apps.get_model("recipes", "ShoppingCart")
+    User = apps.get_model("users", "User")
+    Recipe.objects.update(
+        favorites_count=count_rows(Favorite, "recipe"),
+        in_carts_count=count_rows(ShoppingCart, "recipe"),
+    )
+    User.objects.update(recipes_count=count_rows(Recipe, "author"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0007_recipe_pub_date_id_idx"),
+        ("users", "0004_user_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="favorites_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="В избранном"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="in_carts_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="В списках покупок"
+            ),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:39
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+MASK_WIDTH = 63
+
+
+def fill_tags_mask(apps, schema_editor):
+    Recipe = apps.get_model("recipes", "Recipe")
+    masks = defaultdict(int)
+    rows = Recipe.tags.through.objects.filter(
+        tag_id__lte=MASK_WIDTH
+    ).values_list("recipe_id", "tag_id")
+    for recipe_id, tag_id in rows.iterator():
+        masks[recipe_id] |= 1 << (tag_id - 1)
+    recipes = [
+        Recipe(id=recipe_id, tags_mask=mask)
+        for recipe_id, mask in masks.items()
+    ]
+    Recipe.objects.bulk_update(recipes, ["tags_mask"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0008_recipe_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="tags_mask",
+            field=models.BigIntegerField(
+                default=0,
+                editable=False,
+                help_text="Бит tag.id - 1 для тегов с id не больше 63.",
+                verbose_name="Битовая маска тегов",
+            ),
+        ),
+        migrations.RunPython(fill_tags_mask, migrations.RunPython.noop),
+    ]
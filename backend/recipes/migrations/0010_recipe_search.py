@@ -0,0 +1,91 @@
+from django.db import migrations
+
+# SQL повторяет recipes.search на момент создания миграции и не должен
+# меняться вместе с этим модулем.
+POSTGRES_INSTALL = (
+    """
+    ALTER TABLE recipes_recipe ADD COLUMN IF NOT EXISTS search_vector
+    tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian', coalesce(name, '')), 'A')
+        || setweight(to_tsvector('russian', coalesce(text, '')), 'B')
+    ) STORED
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS recipe_search_vector_idx
+    ON recipes_recipe USING GIN (search_vector)
+    """,
+)
+POSTGRES_UNINSTALL = (
+    "DROP INDEX IF EXISTS recipe_search_vector_idx",
+    "ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector",
+)
+SQLITE_INSTALL = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts USING fts5(
+        name, text, content='recipes_recipe', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_ai
+    AFTER INSERT ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_ad
+    AFTER DELETE ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts(
+            recipes_recipe_fts, rowid, name, text
+        ) VALUES ('delete', old.id, old.name, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_au
+    AFTER UPDATE OF name, text ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts(
+            recipes_recipe_fts, rowid, name, text
+        ) VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO recipes_recipe_fts(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    "INSERT INTO recipes_recipe_fts(recipes_recipe_fts) VALUES ('rebuild')",
+)
+SQLITE_UNINSTALL = (
+    "DROP TRIGGER IF EXISTS recipes_recipe_fts_ai",
+    "DROP TRIGGER IF EXISTS recipes_recipe_fts_ad",
+    "DROP TRIGGER IF EXISTS recipes_recipe_fts_au",
+    "DROP TABLE IF EXISTS recipes_recipe_fts",
+)
+
+
+def execute(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(statement)
+
+
+def install(apps, schema_editor):
+    execute(
+        schema_editor,
+        {"postgresql": POSTGRES_INSTALL, "sqlite": SQLITE_INSTALL},
+    )
+
+
+def uninstall(apps, schema_editor):
+    execute(
+        schema_editor,
+        {"postgresql": POSTGRES_UNINSTALL, "sqlite": SQLITE_UNINSTALL},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0009_recipe_tags_mask"),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
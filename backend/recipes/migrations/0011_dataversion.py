@@ -0,0 +1,37 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0010_recipe_search"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DataVersion",
+            fields=[
+                (
+                    "name",
+                    models.CharField(
+                        max_length=50,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="Данные",
+                    ),
+                ),
+                (
+                    "version",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Версия"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Версия данных",
+                "verbose_name_plural": "Версии данных",
+            },
+        ),
+    ]
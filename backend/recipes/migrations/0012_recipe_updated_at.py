@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-18 03:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def fill_updated_at(apps, schema_editor):
+    Recipe = apps.get_model("recipes", "Recipe")
+    Recipe.objects.update(updated_at=models.F("pub_date"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0011_dataversion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                help_text=(
+                    "Меняется при любом изменении данных рецепта в ответе "
+                    "API, по ней строятся ETag и Last-Modified."
+                ),
+                verbose_name="Дата изменения",
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0012_recipe_updated_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["author", "-pub_date", "id"],
+                name="recipe_author_pub_date_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_feeds(apps, schema_editor):
+    FeedEntry = apps.get_model("recipes", "FeedEntry")
+    Recipe = apps.get_model("recipes", "Recipe")
+    Subscribe = apps.get_model("users", "Subscribe")
+    subscriptions = Subscribe.objects.filter(
+        author__subscribers_count__lte=settings.FEED_FANOUT_LIMIT
+    ).values_list("subscriber_id", "author_id")
+    for user_id, author_id in subscriptions.iterator():
+        recipes = Recipe.objects.filter(author_id=author_id).order_by(
+            "-pub_date", "id"
+        )[: settings.FEED_BACKFILL]
+        FeedEntry.objects.bulk_create(
+            FeedEntry(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for recipe_id, pub_date in recipes.values_list("id", "pub_date")
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0013_recipe_author_pub_date_idx"),
+        ("users", "0005_subscribe_subscriber_idx"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FeedEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "pub_date",
+                    models.DateTimeField(
+                        verbose_name="Дата публикации рецепта"
+                    ),
+                ),
+                (
+                    "recipe",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="feed_entries",
+                        to="recipes.recipe",
+                        verbose_name="Рецепт",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="feed_entries",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Запись ленты",
+                "verbose_name_plural": "Записи ленты",
+                "ordering": ["-pub_date", "recipe"],
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-pub_date", "recipe"],
+                        name="feed_entry_user_pub_date_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "recipe"), name="unique_feed_entry"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
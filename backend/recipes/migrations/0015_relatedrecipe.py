@@ -0,0 +1,64 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0014_feedentry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RelatedRecipe",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("score", models.FloatField(verbose_name="Сходство")),
+                (
+                    "recipe",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="related_recipes",
+                        to="recipes.recipe",
+                        verbose_name="Рецепт",
+                    ),
+                ),
+                (
+                    "related",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="recipes.recipe",
+                        verbose_name="Похожий рецепт",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Похожий рецепт",
+                "verbose_name_plural": "Похожие рецепты",
+                "ordering": ["recipe", "-score", "related"],
+                "indexes": [
+                    models.Index(
+                        fields=["recipe", "-score", "related"],
+                        name="related_recipe_score_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("recipe", "related"),
+                        name="unique_related_recipe",
+                    )
+                ],
+            },
+        ),
+    ]
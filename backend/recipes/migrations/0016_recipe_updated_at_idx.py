@@ -0,0 +1,21 @@
+# Generated by Django 5.1.4 on 2026-10-18 03:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0015_relatedrecipe"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["updated_at"], name="recipe_updated_at_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.1.4 on 2026-10-18 04:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def mark_saved_recipes(apps, schema_editor):
+    """Рецепты в избранном и списках покупок ждут расчёта популярности."""
+    Recipe = apps.get_model("recipes", "Recipe")
+    Recipe.objects.filter(
+        models.Q(in_favorite__isnull=False) | models.Q(shopping__isnull=False)
+    ).update(activity_at=django.utils.timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0016_recipe_updated_at_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="favorite",
+            name="created",
+            field=models.DateTimeField(
+                auto_now_add=True,
+                default=django.utils.timezone.now,
+                verbose_name="Дата добавления",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="shoppingcart",
+            name="created",
+            field=models.DateTimeField(
+                auto_now_add=True,
+                default=django.utils.timezone.now,
+                verbose_name="Дата добавления",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="activity_at",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text=(
+                    "Время изменения избранного или списков покупок, ещё "
+                    "не учтённого в популярности."
+                ),
+                null=True,
+                verbose_name="Изменение популярности",
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="popularity",
+            field=models.FloatField(
+                default=0,
+                editable=False,
+                help_text=(
+                    "Сумма весов добавлений в избранное и списки покупок, "
+                    "убывающих со временем, в логарифмической шкале. "
+                    "Пересчитывается командой update_popularity."
+                ),
+                verbose_name="Популярность",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["-popularity", "-pub_date", "id"],
+                name="recipe_popularity_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                condition=models.Q(("activity_at__isnull", False)),
+                fields=["activity_at"],
+                name="recipe_activity_at_idx",
+            ),
+        ),
+        migrations.RunPython(mark_saved_recipes, migrations.RunPython.noop),
+    ]
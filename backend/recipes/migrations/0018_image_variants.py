@@ -0,0 +1,59 @@
+# Generated by Django 5.1.4 on 2026-10-18 03:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def mark_recipe_images(apps, schema_editor):
+    """Изображения рецептов ждут построения уменьшенных копий."""
+    Recipe = apps.get_model("recipes", "Recipe")
+    Recipe.objects.exclude(image__isnull=True).exclude(image="").update(
+        image_changed_at=django.utils.timezone.now()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0017_popularity"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="image_changed_at",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text=(
+                    "Время изменения изображения, для которого ещё не "
+                    "построены уменьшенные копии."
+                ),
+                null=True,
+                verbose_name="Изменение изображения",
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="image_variants",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                help_text=(
+                    "Имена копий в WebP и JPEG и исходного файла, для "
+                    "которого они построены."
+                ),
+                verbose_name="Уменьшенные копии изображения",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                condition=models.Q(("image_changed_at__isnull", False)),
+                fields=["image_changed_at"],
+                name="recipe_image_changed_at_idx",
+            ),
+        ),
+        migrations.RunPython(mark_recipe_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-18 03:28
+
+import recipes.storage
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0018_image_variants"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="recipe",
+            name="image",
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                storage=recipes.storage.HashedFileSystemStorage(),
+                upload_to="recipes/images",
+                verbose_name="Изображение",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(fields=["image"], name="recipe_image_idx"),
+        ),
+    ]
@@ -1,9 +1,24 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.dispatch import Signal
+
+from recipes.storage import HashedFileSystemStorage
 
 User = get_user_model()
 
+# Рецепты изменены через update(), который не отправляет сигналов
+# модели: счётчики и отметки изменения входят в ответ API.
+recipes_updated = Signal()
+# Изменены только счётчики избранного и списков покупок рецептов
+# recipe_ids: сохранённые страницы списка рецептов остаются верными.
+counters_changed = Signal()
+# Из избранного или списков покупок пользователей user_ids удалены
+# рецепты. У Favorite и ShoppingCart нет обработчиков post_delete, чтобы
+# массовое удаление не выбирало строки по одной, поэтому удаление
+# запросом сопровождается этим сигналом явно.
+saved_recipes_deleted = Signal()
+
 
 class Tag(models.Model):
     """Модель Тегов."""
@@ -57,6 +72,7 @@ class Recipe(models.Model):
     text = models.TextField(verbose_name="Описание рецепта")
     image = models.ImageField(
         upload_to="recipes/images",
+        storage=HashedFileSystemStorage(),
         null=True,
         blank=True,
         verbose_name="Изображение",
@@ -78,11 +94,102 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         auto_now_add=True, verbose_name="Дата публикации"
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Дата изменения",
+        help_text=(
+            "Меняется при любом изменении данных рецепта в ответе API, "
+            "по ней строятся ETag и Last-Modified."
+        ),
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="В избранном"
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="В списках покупок"
+    )
+    popularity = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name="Популярность",
+        help_text=(
+            "Сумма весов добавлений в избранное и списки покупок, "
+            "убывающих со временем, в логарифмической шкале. "
+            "Пересчитывается командой update_popularity."
+        ),
+    )
+    activity_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Изменение популярности",
+        help_text=(
+            "Время изменения избранного или списков покупок, ещё не "
+            "учтённого в популярности."
+        ),
+    )
+    tags_mask = models.BigIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="Битовая маска тегов",
+        help_text="Бит tag.id - 1 для тегов с id не больше 63.",
+    )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name="Уменьшенные копии изображения",
+        help_text=(
+            "Имена копий в WebP и JPEG и исходного файла, для которого "
+            "они построены."
+        ),
+    )
+    image_changed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Изменение изображения",
+        help_text=(
+            "Время изменения изображения, для которого ещё не построены "
+            "уменьшенные копии."
+        ),
+    )
 
     class Meta:
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
         ordering = ["-pub_date"]
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "id"], name="recipe_pub_date_id_idx"
+            ),
+            # Рецепты автора: фильтр ?author= и рецепты в подписках.
+            models.Index(
+                fields=["author", "-pub_date", "id"],
+                name="recipe_author_pub_date_idx",
+            ),
+            # Рецепты, изменённые после обновления индекса продуктов.
+            models.Index(fields=["updated_at"], name="recipe_updated_at_idx"),
+            # Сортировка ?ordering=popular.
+            models.Index(
+                fields=["-popularity", "-pub_date", "id"],
+                name="recipe_popularity_idx",
+            ),
+            # Рецепты, популярность которых нужно пересчитать.
+            models.Index(
+                fields=["activity_at"],
+                condition=models.Q(activity_at__isnull=False),
+                name="recipe_activity_at_idx",
+            ),
+            # Рецепты, для изображений которых нужно построить копии.
+            models.Index(
+                fields=["image_changed_at"],
+                condition=models.Q(image_changed_at__isnull=False),
+                name="recipe_image_changed_at_idx",
+            ),
+            # Рецепты с тем же файлом изображения перед его удалением.
+            models.Index(fields=["image"], name="recipe_image_idx"),
+        ]
 
     def __str__(self):
         return self.name
@@ -128,7 +235,21 @@ class IngredientRecipe(models.Model):
         return f"{self.recipe}: {self.amount} {self.ingredient}"
 
 
-class Favorite(models.Model):
+class SavedRecipe(models.Model):
+    """Общая часть избранного и списка покупок."""
+
+    class Meta:
+        abstract = True
+
+    def delete(self, *args, **kwargs):
+        deleted = super().delete(*args, **kwargs)
+        saved_recipes_deleted.send(
+            sender=self.__class__, user_ids=[self.user_id]
+        )
+        return deleted
+
+
+class Favorite(SavedRecipe):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, verbose_name="Пользователь"
     )
@@ -138,6 +259,9 @@ class Favorite(models.Model):
         related_name="in_favorite",
         verbose_name="Рецепт",
     )
+    created = models.DateTimeField(
+        auto_now_add=True, verbose_name="Дата добавления"
+    )
 
     class Meta:
         verbose_name = "Избранный рецепт"
@@ -153,7 +277,7 @@ class Favorite(models.Model):
         return f"{self.user} - {self.recipe}"
 
 
-class ShoppingCart(models.Model):
+class ShoppingCart(SavedRecipe):
     """Модель списка покупок."""
 
     user = models.ForeignKey(
@@ -168,6 +292,9 @@ class ShoppingCart(models.Model):
         related_name="shopping",
         verbose_name="Рецепт",
     )
+    created = models.DateTimeField(
+        auto_now_add=True, verbose_name="Дата добавления"
+    )
 
     class Meta:
         verbose_name = "Список покупок"
@@ -181,3 +308,195 @@ class ShoppingCart(models.Model):
                 name="unique_recipe_shopping",
             ),
         )
+
+
+class ShoppingListItem(models.Model):
+    """
+    Сводное количество ингредиента в списке покупок пользователя.
+
+    Поддерживается при добавлении и удалении рецептов из списка покупок,
+    при изменении ингредиентов рецептов и при удалении рецептов, в том
+    числе каскадном, а также в админке. Изменения в обход этих путей,
+    например запросы update() и delete() из shell, исправляет команда
+    rebuild_shopping_lists.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_list_items",
+        verbose_name="Пользователь",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="shopping_list_items",
+        verbose_name="Ингредиент",
+    )
+    amount = models.IntegerField(default=0, verbose_name="Количество")
+
+    class Meta:
+        verbose_name = "Ингредиент списка покупок"
+        verbose_name_plural = "Ингредиенты списков покупок"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "ingredient"], name="unique_user_ingredient"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user}: {self.amount} {self.ingredient}"
+
+
+class ShoppingListJob(models.Model):
+    """Задача на фоновое формирование pdf-файла списка покупок."""
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "В очереди"
+        PROCESSING = "processing", "Выполняется"
+        DONE = "done", "Готово"
+        FAILED = "failed", "Ошибка"
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_list_jobs",
+        verbose_name="Пользователь",
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.PENDING,
+        verbose_name="Статус",
+    )
+    file = models.BinaryField(null=True, verbose_name="Файл")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    created = models.DateTimeField(
+        auto_now_add=True, verbose_name="Дата создания"
+    )
+    started = models.DateTimeField(
+        null=True, blank=True, verbose_name="Дата начала обработки"
+    )
+    finished = models.DateTimeField(
+        null=True, blank=True, verbose_name="Дата завершения"
+    )
+
+    class Meta:
+        verbose_name = "Задача списка покупок"
+        verbose_name_plural = "Задачи списка покупок"
+        ordering = ["-created"]
+        indexes = [
+            models.Index(
+                fields=["status", "created"], name="shopping_job_status_idx"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user}: {self.get_status_display()}"
+
+
+class DataVersion(models.Model):
+    """
+    Версия редко меняющихся справочных данных.
+
+    Увеличивается при каждом изменении данных, процессы сравнивают её
+    со своей копией, чтобы пересобрать кэши в памяти.
+    """
+
+    name = models.CharField(
+        max_length=50, primary_key=True, verbose_name="Данные"
+    )
+    version = models.PositiveBigIntegerField(default=0, verbose_name="Версия")
+
+    class Meta:
+        verbose_name = "Версия данных"
+        verbose_name_plural = "Версии данных"
+
+    def __str__(self):
+        return f"{self.name}: {self.version}"
+
+
+class FeedEntry(models.Model):
+    """
+    Рецепт в ленте подписок пользователя.
+
+    Строки добавляются при публикации рецепта всем подписчикам автора,
+    кроме авторов с очень большим числом подписчиков: их рецепты
+    читаются в ленту напрямую из таблицы рецептов.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="feed_entries",
+        verbose_name="Пользователь",
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="feed_entries",
+        verbose_name="Рецепт",
+    )
+    pub_date = models.DateTimeField(verbose_name="Дата публикации рецепта")
+
+    class Meta:
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Записи ленты"
+        ordering = ["-pub_date", "recipe"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "recipe"], name="unique_feed_entry"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "recipe"],
+                name="feed_entry_user_pub_date_idx",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user}: {self.recipe}"
+
+
+class RelatedRecipe(models.Model):
+    """
+    Рецепт, который часто сохраняют вместе с другим.
+
+    Таблица пересобирается командой build_related_recipes: для каждого
+    рецепта хранятся ближайшие соседи по совместному добавлению в
+    избранное и список покупок.
+    """
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="related_recipes",
+        verbose_name="Рецепт",
+    )
+    related = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Похожий рецепт",
+    )
+    score = models.FloatField(verbose_name="Сходство")
+
+    class Meta:
+        verbose_name = "Похожий рецепт"
+        verbose_name_plural = "Похожие рецепты"
+        ordering = ["recipe", "-score", "related"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["recipe", "related"], name="unique_related_recipe"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["recipe", "-score", "related"],
+                name="related_recipe_score_idx",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.recipe} -> {self.related}"
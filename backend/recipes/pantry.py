@@ -0,0 +1,224 @@
+"""
+Подбор рецептов по продуктам, которые есть у пользователя.
+
+Каждый процесс держит инвертированный индекс ингредиентов: для
+ингредиента - отсортированный массив позиций рецептов, в которых он
+есть, для рецепта - количество его строк IngredientRecipe. Покрытие
+рецептов набором продуктов считается одним np.bincount по массивам
+выбранных ингредиентов, без запросов к рецептам всей базы.
+
+Индекс дополняется рецептами, у которых updated_at новее последнего
+обновления: updated_at меняется при любом изменении ингредиентов
+рецепта. Удаление рецепта меняет версию данных "pantry", и индекс
+строится заново. Запросы к базе выполняются без блокировки индекса,
+блокировка нужна только для изменения массивов и поиска.
+"""
+
+import threading
+from datetime import timedelta
+
+import numpy as np
+
+from recipes.ingredient_index import get_data_version
+from recipes.models import IngredientRecipe, Recipe
+
+PANTRY = "pantry"
+# Рецепты, изменённые незадолго до прошлого обновления, читаются снова:
+# транзакция могла записать updated_at раньше, чем стала видна.
+REFRESH_OVERLAP = timedelta(minutes=1)
+
+
+class PantryIndex:
+    """Позиции рецептов по ингредиентам и ранжирование по покрытию."""
+
+    def __init__(self, version=0):
+        self.version = version
+        self.updated_at = None
+        self.positions = {}
+        self.recipe_ids = np.zeros(0, dtype=np.int64)
+        self.totals = np.zeros(0, dtype=np.int64)
+        self.ingredients = []
+        self.postings = {}
+        self.recipe_updated_at = {}
+
+    @classmethod
+    def build(cls, version):
+        index = cls(version)
+        index.apply(*get_changes(None))
+        return index
+
+    def apply(self, changed, ingredients):
+        """
+        Применение изменений, прочитанных get_changes.
+
+        Изменения из параллельных запросов применяются в любом порядке:
+        рецепт заменяется, только если его updated_at новее загруженного.
+        """
+        if not changed:
+            return
+        if self.updated_at is None:
+            self.load(ingredients)
+            self.recipe_updated_at = dict(changed)
+            self.updated_at = max(changed.values())
+            return
+        newer = {
+            recipe_id: updated_at
+            for recipe_id, updated_at in changed.items()
+            if recipe_id not in self.recipe_updated_at
+            or updated_at > self.recipe_updated_at[recipe_id]
+        }
+        self.update({recipe_id: ingredients[recipe_id] for recipe_id in newer})
+        self.recipe_updated_at.update(newer)
+        self.updated_at = max(self.updated_at, *changed.values())
+
+    def load(self, ingredients):
+        """Построение индекса по ингредиентам всех рецептов."""
+        self.recipe_ids = np.array(sorted(ingredients), dtype=np.int64)
+        recipe_ids = self.recipe_ids.tolist()
+        self.positions = {
+            recipe_id: position
+            for position, recipe_id in enumerate(recipe_ids)
+        }
+        self.ingredients = [
+            tuple(ingredients[recipe_id]) for recipe_id in recipe_ids
+        ]
+        self.totals = np.array(
+            [len(items) for items in self.ingredients], dtype=np.int64
+        )
+        pairs = np.array(
+            [
+                (ingredient_id, position)
+                for position, items in enumerate(self.ingredients)
+                for ingredient_id in items
+                if ingredient_id is not None
+            ],
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+        ingredient_ids, starts = np.unique(pairs[:, 0], return_index=True)
+        self.postings = dict(
+            zip(ingredient_ids.tolist(), np.split(pairs[:, 1], starts[1:]))
+        )
+
+    def update(self, ingredients):
+        """Замена ингредиентов изменённых и добавление новых рецептов."""
+        new_ids = [
+            recipe_id
+            for recipe_id in ingredients
+            if recipe_id not in self.positions
+        ]
+        if new_ids:
+            start = len(self.ingredients)
+            self.positions.update(
+                zip(new_ids, range(start, start + len(new_ids)))
+            )
+            self.recipe_ids = np.concatenate(
+                (self.recipe_ids, np.array(new_ids, dtype=np.int64))
+            )
+            self.totals = np.concatenate(
+                (self.totals, np.zeros(len(new_ids), dtype=np.int64))
+            )
+            self.ingredients.extend(() for _ in new_ids)
+        for recipe_id, ingredient_ids in ingredients.items():
+            position = self.positions[recipe_id]
+            old = set(self.ingredients[position]) - {None}
+            new = set(ingredient_ids) - {None}
+            for ingredient_id in old - new:
+                posting = self.postings[ingredient_id]
+                self.postings[ingredient_id] = np.delete(
+                    posting, np.searchsorted(posting, position)
+                )
+            for ingredient_id in new - old:
+                posting = self.postings.get(
+                    ingredient_id, np.zeros(0, dtype=np.int64)
+                )
+                self.postings[ingredient_id] = np.insert(
+                    posting, np.searchsorted(posting, position), position
+                )
+            self.ingredients[position] = tuple(ingredient_ids)
+            self.totals[position] = len(ingredient_ids)
+
+    def search(self, ingredient_ids) -> list[tuple[int, float, int]]:
+        """
+        Рецепты, в которых есть хотя бы один из продуктов, с долей
+        имеющихся ингредиентов и количеством недостающих.
+
+        Выше рецепты с большей долей, затем с меньшим количеством
+        недостающих ингредиентов, затем более новые.
+        """
+        postings = [
+            self.postings[ingredient_id]
+            for ingredient_id in set(ingredient_ids)
+            if ingredient_id in self.postings
+        ]
+        if not postings:
+            return []
+        counts = np.bincount(
+            np.concatenate(postings), minlength=len(self.totals)
+        )
+        matched = np.flatnonzero(counts)
+        recipe_ids = self.recipe_ids[matched]
+        totals = self.totals[matched]
+        coverage = counts[matched] / totals
+        missing = totals - counts[matched]
+        order = np.lexsort((-recipe_ids, missing, -coverage))
+        return list(
+            zip(
+                recipe_ids[order].tolist(),
+                coverage[order].tolist(),
+                missing[order].tolist(),
+            )
+        )
+
+
+def get_changes(updated_at) -> tuple[dict, dict]:
+    """
+    updated_at и ингредиенты рецептов, изменённых после updated_at, или
+    всех рецептов, если updated_at не задан.
+    """
+    recipes = Recipe.objects.order_by()
+    rows = IngredientRecipe.objects.filter(recipe__isnull=False)
+    if updated_at is not None:
+        since = updated_at - REFRESH_OVERLAP
+        recipes = recipes.filter(updated_at__gte=since)
+        rows = rows.filter(recipe__updated_at__gte=since)
+    changed = dict(recipes.values_list("id", "updated_at"))
+    if not changed:
+        return {}, {}
+    ingredients = {recipe_id: [] for recipe_id in changed}
+    for recipe_id, ingredient_id in rows.values_list(
+        "recipe_id", "ingredient_id"
+    ):
+        # Рецепт, изменённый между запросами, загрузится при следующем
+        # обновлении вместе со своим updated_at.
+        if recipe_id in ingredients:
+            ingredients[recipe_id].append(ingredient_id)
+    return changed, ingredients
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def search_pantry(ingredient_ids) -> list[tuple[int, float, int]]:
+    """
+    Поиск рецептов по продуктам в индексе текущей версии.
+
+    Изменения читаются из базы без блокировки, массивы индекса
+    меняются на месте под блокировкой вместе с поиском.
+    """
+    global _index
+    version = get_data_version(PANTRY)
+    index = _index
+    if index is None or index.version != version:
+        index = PantryIndex.build(version)
+        with _lock:
+            # Параллельный запрос мог построить индекс новее.
+            if _index is None or _index.version < version:
+                _index = index
+            index = _index
+            return index.search(ingredient_ids)
+    changes = get_changes(index.updated_at)
+    with _lock:
+        index.apply(*changes)
+        return index.search(ingredient_ids)
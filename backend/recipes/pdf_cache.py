@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.template.loader import get_template
+
+
+def _files_digest(paths) -> bytes:
+    """Хэш содержимого файлов, влияющих на вид pdf-файла."""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(Path(path).read_bytes())
+    return digest.digest()
+
+
+class ShoppingListPDFCache:
+    """
+    Дисковый кэш pdf-файлов списков покупок.
+
+    Файлы называются по хэшу сводного списка ингредиентов, таблицы стилей
+    и шаблона, поэтому одинаковые списки разных пользователей хранятся
+    в одном файле. Для каждого пользователя хранится ссылка на ключ его
+    последнего списка: повторное скачивание не обращается ни к БД,
+    ни к weasyprint, пока ссылка не сброшена изменением списка покупок.
+    """
+
+    def __init__(self, directory, max_size, max_age, sources):
+        self.files_dir = Path(directory) / "files"
+        self.refs_dir = Path(directory) / "refs"
+        self.max_size = max_size
+        self.max_age = max_age
+        self.sources = sources
+
+    def make_key(self, ingredients) -> str:
+        digest = hashlib.sha256(_files_digest(self.sources))
+        digest.update(
+            json.dumps(list(ingredients), ensure_ascii=False).encode()
+        )
+        return digest.hexdigest()
+
+    def _file_path(self, key) -> Path:
+        return self.files_dir / f"{key}.pdf"
+
+    def _ref_path(self, user_id) -> Path:
+        return self.refs_dir / str(user_id)
+
+    @staticmethod
+    def _write(path: Path, content: bytes):
+        """Атомарная запись файла, безопасная для нескольких процессов."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent)
+        with os.fdopen(fd, "wb") as file:
+            file.write(content)
+        os.replace(tmp_name, path)
+
+    def get_by_key(self, key) -> bytes | None:
+        path = self._file_path(key)
+        try:
+            content = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        # Время изменения служит временем последнего обращения при вытеснении.
+        path.touch()
+        return content
+
+    def get(self, user_id) -> bytes | None:
+        try:
+            key = self._ref_path(user_id).read_text()
+        except FileNotFoundError:
+            return None
+        return self.get_by_key(key)
+
+    def set(self, user_id, key, content: bytes):
+        if not self._file_path(key).exists():
+            self._write(self._file_path(key), content)
+            self.evict()
+        self._write(self._ref_path(user_id), key.encode())
+
+    def invalidate(self, *user_ids):
+        for user_id in user_ids:
+            self._ref_path(user_id).unlink(missing_ok=True)
+
+    def evict(self):
+        """Удаление устаревших файлов и самых старых сверх лимита размера."""
+        deadline = time.time() - self.max_age
+        files = []
+        for entry in os.scandir(self.files_dir):
+            stat = entry.stat()
+            if stat.st_mtime < deadline:
+                Path(entry.path).unlink(missing_ok=True)
+            else:
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total_size <= self.max_size:
+                break
+            Path(path).unlink(missing_ok=True)
+            total_size -= size
+
+
+def get_pdf_cache() -> ShoppingListPDFCache:
+    options = settings.SHOPPING_LIST_CACHE
+    return ShoppingListPDFCache(
+        directory=options["DIR"],
+        max_size=options["MAX_SIZE"],
+        max_age=options["MAX_AGE"],
+        sources=(
+            f"{settings.STATICFILES_DIRS[0]}/css/pdf.css",
+            get_template("shopping_cart.html").origin.name,
+        ),
+    )
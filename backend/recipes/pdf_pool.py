@@ -0,0 +1,212 @@
+import logging
+import multiprocessing
+import resource
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Состояние процесса-обработчика, создаётся один раз при его запуске.
+_stylesheet = None
+_font_config = None
+
+
+class RenderPoolBusy(Exception):
+    """Очередь пула переполнена."""
+
+
+class RenderTimeout(Exception):
+    """pdf-файл не сформирован за отведённое время."""
+
+
+def _init_worker(stylesheet_path, max_memory):
+    """Загрузка weasyprint, шрифтов и таблицы стилей при старте процесса."""
+    global _stylesheet, _font_config
+    if max_memory:
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
+    import weasyprint
+    from weasyprint.text.fonts import FontConfiguration
+
+    _font_config = FontConfiguration()
+    _stylesheet = weasyprint.CSS(
+        filename=stylesheet_path, font_config=_font_config
+    )
+
+
+def _render(html):
+    import weasyprint
+
+    started = time.perf_counter()
+    pdf = weasyprint.HTML(string=html).write_pdf(
+        stylesheets=[_stylesheet], font_config=_font_config
+    )
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pdf, time.perf_counter() - started, max_rss
+
+
+class PDFRenderPool:
+    """
+    Пул долгоживущих процессов для формирования pdf-файлов.
+
+    Процессы запускаются при первом обращении и заранее загружают шрифты
+    и таблицу стилей. Число задач в работе ограничено размером пула и
+    очереди: сверх лимита запрос сразу отклоняется. Процессы
+    перезапускаются после max_tasks_per_child задач, что ограничивает рост
+    их памяти, а max_memory задаёт жёсткий лимит адресного пространства.
+
+    Если процесс завершился аварийно, multiprocessing.Pool запускает
+    новый, но задача процесса не завершается никогда. Поэтому задача
+    занимает место в очереди не дольше timeout, а когда таких потерянных
+    задач не меньше, чем процессов, пул перезапускается.
+    """
+
+    def __init__(
+        self,
+        processes,
+        max_queue,
+        timeout,
+        max_tasks_per_child,
+        stylesheet,
+        max_memory=None,
+    ):
+        self.processes = processes
+        self.capacity = processes + max_queue
+        self.timeout = timeout
+        self.max_tasks_per_child = max_tasks_per_child
+        self.stylesheet = stylesheet
+        self.max_memory = max_memory
+        self._pool = None
+        self._lock = threading.Lock()
+        # Задачи в работе: AsyncResult и время постановки в очередь.
+        self._tasks = {}
+        # Задачи, не завершившиеся за timeout.
+        self._lost = []
+        self.stats = {
+            "rendered": 0,
+            "failed": 0,
+            "rejected": 0,
+            "timeouts": 0,
+            "lost": 0,
+            "restarts": 0,
+            "render_time": 0.0,
+            "max_render_time": 0.0,
+            "max_rss_kb": 0,
+        }
+
+    def _create_pool(self):
+        # spawn не наследует открытые соединения с БД и потоки.
+        context = multiprocessing.get_context("spawn")
+        return context.Pool(
+            self.processes,
+            initializer=_init_worker,
+            initargs=(self.stylesheet, self.max_memory),
+            maxtasksperchild=self.max_tasks_per_child,
+        )
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.stats[name] += value
+
+    def _done(self, result):
+        pdf, render_time, max_rss = result
+        with self._lock:
+            self.stats["rendered"] += 1
+            self.stats["render_time"] += render_time
+            self.stats["max_render_time"] = max(
+                self.stats["max_render_time"], render_time
+            )
+            self.stats["max_rss_kb"] = max(self.stats["max_rss_kb"], max_rss)
+        logger.info(
+            "pdf rendered in %.3fs, worker max rss %d KB", render_time, max_rss
+        )
+
+    def _failed(self, error):
+        self._count("failed")
+        logger.error("pdf rendering failed: %s", error)
+
+    def _reclaim(self):
+        """
+        Освобождение мест завершённых и потерянных задач. Возвращает
+        пул для остановки, если он перезапускается. Вызывается под
+        блокировкой.
+        """
+        now = time.monotonic()
+        for result, started in list(self._tasks.items()):
+            if result.ready():
+                del self._tasks[result]
+            elif now - started > self.timeout:
+                del self._tasks[result]
+                self._lost.append(result)
+                self.stats["lost"] += 1
+        self._lost = [result for result in self._lost if not result.ready()]
+        if self._pool is None or len(self._lost) < self.processes:
+            return None
+        # Все процессы могли зависнуть или погибнуть вместе с задачами.
+        logger.error(
+            "pdf render pool restarted: %d lost tasks", len(self._lost)
+        )
+        self.stats["restarts"] += 1
+        pool, self._pool, self._lost = self._pool, None, []
+        return pool
+
+    def _submit(self, func, args):
+        with self._lock:
+            stopped = self._reclaim()
+            if len(self._tasks) >= self.capacity:
+                self.stats["rejected"] += 1
+                result = None
+            else:
+                if self._pool is None:
+                    self._pool = self._create_pool()
+                result = self._pool.apply_async(
+                    func,
+                    args,
+                    callback=self._done,
+                    error_callback=self._failed,
+                )
+                self._tasks[result] = time.monotonic()
+        if stopped is not None:
+            # terminate ждёт поток результатов, который берёт блокировку
+            # в _done и _failed.
+            stopped.terminate()
+        return result
+
+    def render(self, html) -> bytes:
+        result = self._submit(_render, (html,))
+        if result is None:
+            raise RenderPoolBusy("Очередь формирования pdf-файлов заполнена")
+        try:
+            pdf, _, _ = result.get(self.timeout)
+        except multiprocessing.TimeoutError:
+            # Задача занимает место, пока не завершится или не истечёт
+            # timeout с момента постановки в очередь.
+            self._count("timeouts")
+            raise RenderTimeout(f"pdf-файл не сформирован за {self.timeout} с")
+        return pdf
+
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool() -> PDFRenderPool | None:
+    """Пул процесса или None, если пул отключён в настройках."""
+    global _render_pool
+    options = settings.PDF_RENDER_POOL
+    if not options["PROCESSES"]:
+        return None
+    if _render_pool is None:
+        # Первые параллельные запросы не должны создать два пула.
+        with _render_pool_lock:
+            if _render_pool is None:
+                _render_pool = PDFRenderPool(
+                    processes=options["PROCESSES"],
+                    max_queue=options["MAX_QUEUE"],
+                    timeout=options["TIMEOUT"],
+                    max_tasks_per_child=options["MAX_TASKS_PER_CHILD"],
+                    max_memory=options["MAX_MEMORY"],
+                    stylesheet=f"{settings.STATICFILES_DIRS[0]}/css/pdf.css",
+                )
+    return _render_pool
@@ -0,0 +1,112 @@
+"""
+Популярность рецептов для сортировки ?ordering=popular.
+
+Каждое добавление рецепта в избранное или список покупок весит
+2 ** ((t - EPOCH) / T), где t - время добавления, T - период
+полураспада. Отношение таких весов совпадает с отношением весов,
+убывающих от текущего момента, поэтому порядок рецептов не меняется
+со временем сам по себе, и пересчитывать нужно только рецепты с новой
+активностью. Чтобы веса не переполняли float, хранится
+log2(1 + сумма весов).
+
+Изменения избранного и списков покупок отмечают рецепт в activity_at,
+команда update_popularity пересчитывает отмеченные рецепты и снимает
+отметку. Новая популярность попадает в сохранённые страницы списка
+рецептов по истечении RECIPES_CACHE_TIMEOUT.
+"""
+
+import operator
+from datetime import datetime, timezone
+from functools import reduce
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+# Порядок популярных рецептов, по нему построен индекс
+# recipe_popularity_idx.
+POPULAR_ORDERING = ("-popularity", "-pub_date", "id")
+
+
+def get_popularity(recipe_ids) -> dict[int, float]:
+    """Популярность рецептов по текущему избранному и спискам покупок."""
+    rows = (
+        Favorite.objects.filter(recipe_id__in=recipe_ids)
+        .order_by()
+        .values_list("recipe_id", "created")
+        .union(
+            ShoppingCart.objects.filter(recipe_id__in=recipe_ids)
+            .order_by()
+            .values_list("recipe_id", "created"),
+            all=True,
+        )
+    )
+    popularity = dict.fromkeys(recipe_ids, 0.0)
+    rows = list(rows)
+    if not rows:
+        return popularity
+    half_life = settings.POPULARITY_HALF_LIFE_DAYS * 24 * 60 * 60
+    ids = np.array([recipe_id for recipe_id, _ in rows], dtype=np.int64)
+    exponents = np.array(
+        [(created - EPOCH).total_seconds() / half_life for _, created in rows]
+    )
+    order = np.argsort(ids, kind="stable")
+    ids, exponents = ids[order], exponents[order]
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    counts = np.diff(np.r_[starts, len(ids)])
+    # log2 суммы весов рецепта через наибольший показатель, чтобы
+    # степени двойки не переполнялись.
+    largest = np.maximum.reduceat(exponents, starts)
+    sums = np.add.reduceat(
+        np.exp2(exponents - np.repeat(largest, counts)), starts
+    )
+    scores = np.logaddexp2(0, largest + np.log2(sums))
+    popularity.update(zip(ids[starts].tolist(), scores.tolist()))
+    return popularity
+
+
+def update_popularity(all_recipes=False, batch_size=1000) -> int:
+    """
+    Пересчёт популярности отмеченных рецептов, при all_recipes - всех.
+
+    Отметка снимается, только если она не изменилась за время расчёта,
+    иначе рецепт будет пересчитан при следующем запуске. Возвращает
+    количество пересчитанных рецептов.
+    """
+    recipes = Recipe.objects.order_by("id")
+    if not all_recipes:
+        recipes = recipes.filter(activity_at__isnull=False)
+    updated = 0
+    last_id = 0
+    while True:
+        batch = list(
+            recipes.filter(id__gt=last_id).values_list("id", "activity_at")[
+                :batch_size
+            ]
+        )
+        if not batch:
+            return updated
+        last_id = batch[-1][0]
+        popularity = get_popularity([recipe_id for recipe_id, _ in batch])
+        with transaction.atomic():
+            Recipe.objects.bulk_update(
+                [
+                    Recipe(id=recipe_id, popularity=score)
+                    for recipe_id, score in popularity.items()
+                ],
+                ["popularity"],
+            )
+            marked = [
+                Q(id=recipe_id, activity_at=activity_at)
+                for recipe_id, activity_at in batch
+                if activity_at is not None
+            ]
+            if marked:
+                Recipe.objects.filter(reduce(operator.or_, marked)).update(
+                    activity_at=None
+                )
+        updated += len(batch)
@@ -0,0 +1,126 @@
+"""
+Реестр справочников тегов и ингредиентов в памяти процесса.
+
+Теги и ингредиенты меняются только через админку и команду load_data,
+поэтому каждый процесс держит их копию: словари по id для ответов
+рецептов, готовые тела ответов списков в json и индекс поиска
+ингредиентов. Реестр строится заново, когда меняется версия данных
+"reference" в DataVersion: её увеличивают сигналы сохранения и удаления
+тегов и ингредиентов и загрузка данных.
+
+Запись, созданная после построения реестра в ещё не зафиксированной
+транзакции, может встретиться в рецепте раньше новой версии, поэтому
+отсутствующие в реестре id дочитываются из базы.
+"""
+
+import json
+import threading
+
+from recipes.ingredient_index import IngredientIndex, get_data_version
+from recipes.models import Ingredient, Tag
+from recipes.tags_mask import MASK_WIDTH
+
+REFERENCE = "reference"
+TAG_FIELDS = ("id", "name", "color", "slug")
+INGREDIENT_FIELDS = ("id", "name", "measurement_unit")
+
+
+class JSONList(list):
+    """
+    Список вместе с готовым телом ответа.
+
+    Тело совпадает с выводом JSONRenderer по умолчанию: компактные
+    разделители и символы без экранирования.
+    """
+
+    def __init__(self, items=()):
+        super().__init__(items)
+        self.json = json.dumps(
+            self, ensure_ascii=False, separators=(",", ":")
+        ).encode()
+
+
+class ReferenceData:
+    """Теги и ингредиенты одной версии справочников."""
+
+    def __init__(self, tags, ingredients, version=0):
+        self.version = version
+        self.tag_list = JSONList(sorted(tags, key=self.tag_key))
+        self.tags = {tag["id"]: tag for tag in self.tag_list}
+        self.ingredient_index = IngredientIndex(ingredients, version)
+        self.ingredient_list = JSONList(self.ingredient_index.ingredients)
+        self.ingredients = {
+            ingredient["id"]: ingredient for ingredient in self.ingredient_list
+        }
+        # Теги рецептов можно восстановить по маске, если все id
+        # помещаются в неё.
+        self.tags_in_mask = all(
+            0 < tag_id <= MASK_WIDTH for tag_id in self.tags
+        )
+
+    @classmethod
+    def build(cls, version):
+        return cls(
+            Tag.objects.values(*TAG_FIELDS),
+            Ingredient.objects.values(*INGREDIENT_FIELDS),
+            version,
+        )
+
+    @staticmethod
+    def tag_key(tag):
+        # Порядок тегов в ответах, как у Tag.Meta.ordering.
+        return tag["name"], tag["id"]
+
+    def get_tags(self, tag_ids) -> dict[int, dict]:
+        """Теги по id, отсутствующие в реестре читаются из базы."""
+        tags = {
+            tag_id: self.tags[tag_id]
+            for tag_id in tag_ids
+            if tag_id in self.tags
+        }
+        missing = set(tag_ids) - tags.keys()
+        if missing:
+            tags.update(
+                (tag["id"], tag)
+                for tag in Tag.objects.filter(id__in=missing).values(
+                    *TAG_FIELDS
+                )
+            )
+        return tags
+
+    def get_ingredients(self, ingredient_ids) -> dict[int, dict]:
+        """Ингредиенты по id, отсутствующие в реестре читаются из базы."""
+        ingredients = {
+            ingredient_id: self.ingredients[ingredient_id]
+            for ingredient_id in ingredient_ids
+            if ingredient_id in self.ingredients
+        }
+        missing = set(ingredient_ids) - ingredients.keys()
+        if missing:
+            ingredients.update(
+                (ingredient["id"], ingredient)
+                for ingredient in Ingredient.objects.filter(
+                    id__in=missing
+                ).values(*INGREDIENT_FIELDS)
+            )
+        return ingredients
+
+    def sort_tags(self, tags) -> list[dict]:
+        return sorted(tags, key=self.tag_key)
+
+
+_reference = None
+_lock = threading.Lock()
+
+
+def get_reference_data() -> ReferenceData:
+    """Реестр текущей версии справочников, при необходимости пересобранный."""
+    global _reference
+    version = get_data_version(REFERENCE)
+    reference = _reference
+    if reference is None or reference.version != version:
+        with _lock:
+            if _reference is None or _reference.version != version:
+                _reference = ReferenceData.build(version)
+            reference = _reference
+    return reference
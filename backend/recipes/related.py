@@ -0,0 +1,129 @@
+"""
+Похожие рецепты по совместному сохранению.
+
+Пользователь "сохранил" рецепт, если тот есть в его избранном или списке
+покупок. Из сохранений строится разреженная матрица пользователь x
+рецепт X, совместные сохранения рецептов - произведение X.T @ X, а
+сходство рецептов i и j - косинус C[i, j] / sqrt(C[i, i] * C[j, j]).
+Для каждого рецепта в RelatedRecipe записываются top_k самых похожих,
+поэтому запрос похожих рецептов читает строки по индексу.
+
+Сохранения читаются порциями пользователей: в памяти одновременно
+находятся строки одной порции и накопленная матрица рецепт x рецепт,
+размер которой не зависит от количества пользователей и сохранений.
+"""
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from scipy import sparse
+
+from recipes.models import Favorite, Recipe, RelatedRecipe, ShoppingCart
+from users.models import User
+
+
+def user_id_ranges(chunk_size):
+    """Границы (первый, последний) id порций пользователей по возрастанию."""
+    last_id = 0
+    while True:
+        user_ids = list(
+            User.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", flat=True)[:chunk_size]
+        )
+        if not user_ids:
+            return
+        yield user_ids[0], user_ids[-1]
+        last_id = user_ids[-1]
+
+
+def get_saved_pairs(first_id, last_id) -> np.ndarray:
+    """Пары (пользователь, рецепт) из избранного и списков покупок."""
+    users = {"user_id__gte": first_id, "user_id__lte": last_id}
+    pairs = (
+        Favorite.objects.filter(**users)
+        .order_by()
+        .values_list("user_id", "recipe_id")
+        .union(
+            ShoppingCart.objects.filter(**users)
+            .order_by()
+            .values_list("user_id", "recipe_id")
+        )
+    )
+    return np.array(list(pairs), dtype=np.int64).reshape(-1, 2)
+
+
+def get_cooccurrence(recipe_ids, chunk_size) -> sparse.csr_matrix:
+    """
+    Матрица совместных сохранений рецептов, на диагонали - количество
+    пользователей, сохранивших рецепт.
+    """
+    size = len(recipe_ids)
+    cooccurrence = sparse.csr_matrix((size, size), dtype=np.int64)
+    for first_id, last_id in user_id_ranges(chunk_size):
+        pairs = get_saved_pairs(first_id, last_id)
+        cols = np.searchsorted(recipe_ids, pairs[:, 1])
+        # Рецепты, которых не было при выборке id, пропускаются.
+        known = cols < size
+        known[known] = recipe_ids[cols[known]] == pairs[known, 1]
+        pairs, cols = pairs[known], cols[known]
+        if not len(pairs):
+            continue
+        users, rows = np.unique(pairs[:, 0], return_inverse=True)
+        saved = sparse.csr_matrix(
+            (np.ones(len(pairs), dtype=np.int64), (rows, cols)),
+            shape=(len(users), size),
+        )
+        cooccurrence += saved.T @ saved
+    return cooccurrence
+
+
+def get_top_neighbours(cooccurrence, top_k, min_common=1):
+    """
+    Строки, столбцы и сходство top_k соседей каждого рецепта.
+
+    При равном сходстве выше сосед с меньшим номером столбца.
+    """
+    counts = cooccurrence.diagonal().astype(np.float64)
+    matrix = cooccurrence.tocoo()
+    keep = (matrix.row != matrix.col) & (matrix.data >= min_common)
+    rows, cols = matrix.row[keep], matrix.col[keep]
+    scores = matrix.data[keep] / np.sqrt(counts[rows] * counts[cols])
+    order = np.lexsort((cols, -scores, rows))
+    rows, cols, scores = rows[order], cols[order], scores[order]
+    # Место соседа в строке: номер элемента минус начало его строки.
+    starts = np.searchsorted(rows, rows)
+    top = np.arange(len(rows)) - starts < top_k
+    return rows[top], cols[top], scores[top]
+
+
+def build_related_recipes(top_k=None, chunk_size=10000, min_common=1):
+    """
+    Пересборка таблицы похожих рецептов.
+
+    Возвращает количество рецептов с соседями и количество записей.
+    """
+    top_k = top_k or settings.RELATED_RECIPES_LIMIT
+    recipe_ids = np.array(
+        list(Recipe.objects.order_by("id").values_list("id", flat=True)),
+        dtype=np.int64,
+    )
+    rows, cols, scores = get_top_neighbours(
+        get_cooccurrence(recipe_ids, chunk_size), top_k, min_common
+    )
+    with transaction.atomic():
+        RelatedRecipe.objects.all().delete()
+        RelatedRecipe.objects.bulk_create(
+            (
+                RelatedRecipe(
+                    recipe_id=recipe_id, related_id=related_id, score=score
+                )
+                for recipe_id, related_id, score in zip(
+                    recipe_ids[rows].tolist(),
+                    recipe_ids[cols].tolist(),
+                    scores.tolist(),
+                )
+            ),
+            batch_size=1000,
+        )
+    return {"recipes": len(np.unique(rows)), "related": len(rows)}
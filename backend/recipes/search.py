@@ -0,0 +1,170 @@
+"""
+Полнотекстовый поиск рецептов по названию и описанию.
+
+На Postgres поиск идёт по генерируемой колонке search_vector с русской
+морфологией и GIN-индексом. На SQLite используется FTS5-таблица
+recipes_recipe_fts, которая поддерживается триггерами. Обе структуры
+создаются вне моделей Django: миграцией и повторно после каждого
+migrate, так как SQLite пересоздаёт таблицу рецептов при изменении
+колонок и теряет её триггеры.
+"""
+
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+WORD_RE = re.compile(r"\w+")
+
+POSTGRES_INSTALL = (
+    """
+    ALTER TABLE recipes_recipe ADD COLUMN IF NOT EXISTS search_vector
+    tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian', coalesce(name, '')), 'A')
+        || setweight(to_tsvector('russian', coalesce(text, '')), 'B')
+    ) STORED
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS recipe_search_vector_idx
+    ON recipes_recipe USING GIN (search_vector)
+    """,
+)
+POSTGRES_UNINSTALL = (
+    "DROP INDEX IF EXISTS recipe_search_vector_idx",
+    "ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector",
+)
+
+SQLITE_TRIGGERS = (
+    "recipes_recipe_fts_ai",
+    "recipes_recipe_fts_ad",
+    "recipes_recipe_fts_au",
+)
+SQLITE_INSTALL = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts USING fts5(
+        name, text, content='recipes_recipe', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_ai
+    AFTER INSERT ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_ad
+    AFTER DELETE ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts(
+            recipes_recipe_fts, rowid, name, text
+        ) VALUES ('delete', old.id, old.name, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_au
+    AFTER UPDATE OF name, text ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts(
+            recipes_recipe_fts, rowid, name, text
+        ) VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO recipes_recipe_fts(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    "INSERT INTO recipes_recipe_fts(recipes_recipe_fts) VALUES ('rebuild')",
+)
+SQLITE_UNINSTALL = (
+    *(f"DROP TRIGGER IF EXISTS {name}" for name in SQLITE_TRIGGERS),
+    "DROP TABLE IF EXISTS recipes_recipe_fts",
+)
+
+
+def install_search(connection):
+    """Создание структур поиска, если их ещё нет."""
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            for statement in POSTGRES_INSTALL:
+                cursor.execute(statement)
+        elif connection.vendor == "sqlite":
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master "
+                "WHERE type = 'trigger' AND tbl_name = 'recipes_recipe' "
+                "AND name LIKE 'recipes_recipe_fts_%'"
+            )
+            if cursor.fetchone()[0] == len(SQLITE_TRIGGERS):
+                return
+            # Индекс перестраивается целиком: пока триггеров не было,
+            # изменения рецептов в него не попадали.
+            for statement in SQLITE_INSTALL:
+                cursor.execute(statement)
+
+
+def uninstall_search(connection):
+    statements = {
+        "postgresql": POSTGRES_UNINSTALL,
+        "sqlite": SQLITE_UNINSTALL,
+    }.get(connection.vendor, ())
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def get_match_expression(query) -> str:
+    """
+    Запрос FTS5 из слов поисковой строки.
+
+    Каждое слово ищется как префикс: у FTS5 нет русской морфологии,
+    и префикс покрывает большую часть словоформ.
+    """
+    return " ".join(f'"{word}"*' for word in WORD_RE.findall(query))
+
+
+def search_recipes(queryset, query):
+    """Рецепты, подходящие под запрос, от самых релевантных."""
+    vendor = connections[queryset.db].vendor
+    if vendor == "postgresql":
+        tsquery = "websearch_to_tsquery('russian', %s)"
+        return (
+            queryset.alias(
+                search_match=RawSQL(
+                    f'"recipes_recipe"."search_vector" @@ {tsquery}',
+                    (query,),
+                    output_field=BooleanField(),
+                ),
+                search_rank=RawSQL(
+                    'ts_rank_cd("recipes_recipe"."search_vector", '
+                    f"{tsquery})",
+                    (query,),
+                    output_field=FloatField(),
+                ),
+            )
+            .filter(search_match=True)
+            .order_by("-search_rank", "-pub_date", "id")
+        )
+    if vendor == "sqlite":
+        match = get_match_expression(query)
+        if not match:
+            return queryset.none()
+        return (
+            queryset.alias(
+                # bm25 возвращает меньшие значения для лучших совпадений,
+                # совпадения в названии весят больше, чем в описании.
+                search_rank=RawSQL(
+                    "SELECT bm25(recipes_recipe_fts, 10.0, 1.0) "
+                    "FROM recipes_recipe_fts WHERE recipes_recipe_fts "
+                    'MATCH %s AND rowid = "recipes_recipe"."id"',
+                    (match,),
+                    output_field=FloatField(),
+                )
+            )
+            .filter(
+                id__in=RawSQL(
+                    "SELECT rowid FROM recipes_recipe_fts "
+                    "WHERE recipes_recipe_fts MATCH %s",
+                    (match,),
+                )
+            )
+            .order_by("search_rank", "-pub_date", "id")
+        )
+    return queryset.filter(Q(name__icontains=query) | Q(text__icontains=query))
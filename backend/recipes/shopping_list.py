@@ -0,0 +1,150 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.template.loader import render_to_string
+
+from recipes.models import IngredientRecipe, ShoppingCart, ShoppingListItem
+from recipes.pdf_cache import get_pdf_cache
+from recipes.pdf_pool import get_render_pool
+
+
+def get_shopping_list(user):
+    """Сводный список ингредиентов из списка покупок пользователя."""
+    return (
+        ShoppingListItem.objects.filter(user=user)
+        .values(
+            "ingredient__name",
+            "ingredient__measurement_unit",
+            sum_amount=F("amount"),
+        )
+        .order_by("ingredient__name", "ingredient__measurement_unit")
+    )
+
+
+def get_recipe_amounts(recipe_ids) -> dict[int, int]:
+    """Суммарное количество каждого ингредиента в рецептах."""
+    return dict(
+        IngredientRecipe.objects.filter(
+            recipe_id__in=recipe_ids, ingredient__isnull=False
+        )
+        .values("ingredient_id")
+        .annotate(total=Sum("amount"))
+        .values_list("ingredient_id", "total")
+    )
+
+
+def compute_shopping_list(user) -> dict[int, int]:
+    """Сводный список покупок, посчитанный по рецептам в списке."""
+    return get_recipe_amounts(
+        ShoppingCart.objects.filter(user=user).values("recipe_id")
+    )
+
+
+@transaction.atomic
+def change_shopping_lists(user_ids, amounts: dict[int, int]):
+    """
+    Изменение сводных списков покупок пользователей.
+
+    amounts содержит изменение количества для каждого ингредиента,
+    строки с нулевым количеством удаляются.
+    """
+    user_ids = list(user_ids)
+    amounts = {key: value for key, value in amounts.items() if value}
+    if not user_ids or not amounts:
+        return
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id)
+            for user_id in user_ids
+            for ingredient_id, amount in amounts.items()
+            if amount > 0
+        ),
+        ignore_conflicts=True,
+    )
+    items = ShoppingListItem.objects.filter(user_id__in=user_ids)
+    items.filter(ingredient_id__in=amounts).update(
+        amount=F("amount")
+        + Case(
+            *(
+                When(ingredient_id=ingredient_id, then=Value(amount))
+                for ingredient_id, amount in amounts.items()
+            ),
+            default=Value(0),
+        )
+    )
+    items.filter(amount__lte=0).delete()
+    transaction.on_commit(lambda: get_pdf_cache().invalidate(*user_ids))
+
+
+def add_to_shopping_list(user_id, recipe_ids):
+    change_shopping_lists([user_id], get_recipe_amounts(recipe_ids))
+
+
+def remove_from_shopping_list(user_id, recipe_ids):
+    amounts = get_recipe_amounts(recipe_ids)
+    change_shopping_lists(
+        [user_id], {key: -value for key, value in amounts.items()}
+    )
+
+
+def change_recipe_in_shopping_lists(recipe_id, old_amounts, new_amounts):
+    """Перенос изменения ингредиентов рецепта в списки покупок."""
+    amounts = {
+        ingredient_id: new_amounts.get(ingredient_id, 0)
+        - old_amounts.get(ingredient_id, 0)
+        for ingredient_id in old_amounts.keys() | new_amounts.keys()
+    }
+    change_shopping_lists(
+        ShoppingCart.objects.filter(recipe_id=recipe_id).values_list(
+            "user_id", flat=True
+        ),
+        amounts,
+    )
+
+
+@transaction.atomic
+def rebuild_shopping_list(user_id):
+    ShoppingListItem.objects.filter(user_id=user_id).delete()
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(
+            user_id=user_id, ingredient_id=ingredient_id, amount=amount
+        )
+        for ingredient_id, amount in compute_shopping_list(user_id).items()
+    )
+    transaction.on_commit(lambda: get_pdf_cache().invalidate(user_id))
+
+
+def render_shopping_list_pdf(ingredients) -> bytes:
+    """
+    Формирование pdf-файла списка покупок.
+
+    Если в настройках включён пул процессов, файл формируется в нём,
+    иначе в текущем процессе.
+    """
+    html = render_to_string("shopping_cart.html", {"ingredients": ingredients})
+    pool = get_render_pool()
+    if pool is not None:
+        return pool.render(html)
+    # weasyprint нужен только для pdf, остальные форматы его не загружают.
+    import weasyprint
+
+    return weasyprint.HTML(string=html).write_pdf(
+        stylesheets=[
+            weasyprint.CSS(f"{settings.STATICFILES_DIRS[0]}/css/pdf.css")
+        ],
+    )
+
+
+def get_shopping_list_pdf(user_id) -> bytes:
+    """pdf-файл списка покупок пользователя с учётом кэша."""
+    cache = get_pdf_cache()
+    content = cache.get(user_id)
+    if content is not None:
+        return content
+    ingredients = list(get_shopping_list(user_id))
+    key = cache.make_key(ingredients)
+    content = cache.get_by_key(key)
+    if content is None:
+        content = render_shopping_list_pdf(ingredients)
+    cache.set(user_id, key, content)
+    return content
@@ -0,0 +1,215 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes.models import (
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+    recipes_updated,
+)
+from recipes.images import is_ready, release_image
+from recipes.ingredient_index import bump_data_version
+from recipes.pantry import PANTRY
+from recipes.reference import REFERENCE
+from recipes.pdf_cache import get_pdf_cache
+from recipes.shopping_list import (
+    change_recipe_in_shopping_lists,
+    get_recipe_amounts,
+)
+from recipes.tags_mask import remove_tag_from_masks, update_tags_mask
+from users.models import User
+
+# Поля автора, которые входят в представление рецепта.
+AUTHOR_FIELDS = ("email", "username", "first_name", "last_name")
+
+
+def invalidate_shopping_lists(**filters):
+    """Сброс кэша pdf-файлов у владельцев подходящих списков покупок."""
+    user_ids = (
+        ShoppingCart.objects.filter(**filters)
+        .values_list("user_id", flat=True)
+        .distinct()
+    )
+    get_pdf_cache().invalidate(*user_ids)
+
+
+def touch_recipes(**filters):
+    """
+    Отметка изменения подходящих рецептов.
+
+    Нужна, когда представление рецепта меняется без его сохранения:
+    при правке тегов, ингредиентов или автора.
+    """
+    Recipe.objects.filter(**filters).update(updated_at=timezone.now())
+    recipes_updated.send(sender=Recipe)
+
+
+def release_recipe_image(image, variants):
+    """Освобождение изображения рецепта после фиксации транзакции."""
+    if image:
+        transaction.on_commit(partial(release_image, image, variants))
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_saving(sender, instance, raw, update_fields, **kwargs):
+    # Копии нового изображения строит обработчик image_variants_worker.
+    if (
+        instance.image
+        and not is_ready(instance.image_variants, instance.image.name)
+        and instance.image_changed_at is None
+    ):
+        instance.image_changed_at = timezone.now()
+    # Имя нового файла известно только после сохранения, прежнее
+    # изображение сравнивается с ним в post_save.
+    if (
+        not raw
+        and instance.pk is not None
+        and (update_fields is None or "image" in update_fields)
+    ):
+        instance._old_image = (
+            Recipe.objects.filter(pk=instance.pk)
+            .values("image", "image_variants")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_changed(sender, instance, created, **kwargs):
+    old = instance.__dict__.pop("_old_image", None)
+    if old is not None and old["image"] != instance.image.name:
+        release_recipe_image(old["image"], old["image_variants"])
+    # При редактировании через API ингредиенты создаются через bulk_create
+    # без сигналов, но до сохранения самого рецепта.
+    if not created:
+        invalidate_shopping_lists(recipe=instance)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    # Рецепт удаляется и каскадом вместе с автором, а строки списков
+    # покупок удаляются без сигналов, поэтому сводные списки обновляются
+    # здесь, пока ингредиенты и списки ещё есть.
+    change_recipe_in_shopping_lists(
+        instance.id, get_recipe_amounts([instance.id]), {}
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    release_recipe_image(instance.image.name, instance.image_variants)
+    # Индекс продуктов дополняется только изменёнными рецептами.
+    bump_data_version(PANTRY)
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    invalidate_shopping_lists(recipe_id=instance.recipe_id)
+    touch_recipes(id=instance.recipe_id)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_shopping_lists(
+            recipe__recipe_ingredients__ingredient=instance
+        )
+        touch_recipes(recipe_ingredients__ingredient=instance)
+
+
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_deleting(sender, instance, **kwargs):
+    # Строки сводных списков удаляются каскадом, pdf-файлы - нет.
+    user_ids = list(
+        ShoppingListItem.objects.filter(ingredient=instance).values_list(
+            "user_id", flat=True
+        )
+    )
+    transaction.on_commit(lambda: get_pdf_cache().invalidate(*user_ids))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear" and reverse:
+        # После очистки со стороны тега список рецептов уже не получить.
+        instance._cleared_recipe_ids = list(
+            instance.recipes.values_list("id", flat=True)
+        )
+    elif action in ("post_add", "post_remove", "post_clear"):
+        if not reverse:
+            # Маска обновляется и в объекте, чтобы последующий save()
+            # не записал старое значение.
+            masks = update_tags_mask([instance.id])
+            instance.tags_mask = masks.get(instance.id, 0)
+            touch_recipes(id=instance.id)
+        elif action == "post_clear":
+            recipe_ids = instance.__dict__.pop("_cleared_recipe_ids", [])
+            update_tags_mask(recipe_ids)
+            touch_recipes(id__in=recipe_ids)
+        else:
+            update_tags_mask(pk_set)
+            touch_recipes(id__in=pk_set)
+
+
+@receiver(post_save, sender=Tag)
+def tag_changed(sender, instance, created, **kwargs):
+    if not created:
+        touch_recipes(tags=instance)
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleting(sender, instance, **kwargs):
+    # После удаления тега связи с рецептами уже удалены.
+    touch_recipes(tags=instance)
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    remove_tag_from_masks(instance.id)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+def reference_changed(sender, **kwargs):
+    bump_data_version(REFERENCE)
+
+
+@receiver(pre_save, sender=User)
+def author_saving(sender, instance, raw, update_fields, **kwargs):
+    # Вход пользователя сохраняет только last_login, а save() без
+    # update_fields - все поля, поэтому прежние значения полей автора
+    # сравниваются с новыми в post_save.
+    if (
+        raw
+        or instance.pk is None
+        or (
+            update_fields is not None
+            and not set(update_fields) & set(AUTHOR_FIELDS)
+        )
+    ):
+        return
+    instance._old_author = (
+        User.objects.filter(pk=instance.pk).values(*AUTHOR_FIELDS).first()
+    )
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, **kwargs):
+    old = instance.__dict__.pop("_old_author", None)
+    if old is None or all(
+        old[field] == getattr(instance, field) for field in AUTHOR_FIELDS
+    ):
+        return
+    touch_recipes(author=instance)
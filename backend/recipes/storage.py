@@ -0,0 +1,71 @@
+"""
+Хранилище файлов с именами по содержимому.
+
+Файл сохраняется под sha256 своего содержимого в каталоге и с
+расширением переданного имени, поэтому одинаковые изображения хранятся
+один раз, а файл под данным именем никогда не меняется: gateway отдаёт
+такие файлы с Cache-Control: immutable. Производные файлы, например
+уменьшенные копии, сохраняются через save_derived под именами, которые
+уже определены содержимым исходного файла.
+
+Общий файл удаляется, только когда на него не ссылается ни один рецепт
+(recipes.images.release_image). Между проверкой ссылок и удалением может
+завершиться загрузка такого же файла, поэтому повторная запись
+обновляет время изменения файла, а недавно записанные файлы не
+удаляются: их позже удаляет команда release_unused_images.
+"""
+
+import hashlib
+import os
+import posixpath
+import time
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class HashedFileSystemStorage(FileSystemStorage):
+    """Файловое хранилище с именами по sha256 содержимого."""
+
+    def get_content_name(self, name, content) -> str:
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest.hexdigest() + extension)
+
+    def _save(self, name, content):
+        return self.write(self.get_content_name(name, content), content)
+
+    def save_derived(self, name, content) -> str:
+        """Сохранение файла под именем name без хеширования содержимого."""
+        return self.write(name, content)
+
+    def write(self, name, content) -> str:
+        try:
+            # Такой файл уже есть: он не перезаписывается, а только
+            # отмечается как используемый.
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            pass
+        else:
+            return name
+        # Файл записывается под временным именем и переименовывается,
+        # поэтому под итоговым именем не бывает частично записанного
+        # файла, а параллельная запись того же содержимого безопасна.
+        temporary = super()._save(f"{name}.{uuid.uuid4().hex}.tmp", content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+    def is_recent(self, name) -> bool:
+        try:
+            modified = os.path.getmtime(self.path(name))
+        except FileNotFoundError:
+            return False
+        return time.time() - modified < settings.MEDIA_RELEASE_GRACE
@@ -0,0 +1,82 @@
+"""
+Битовая маска тегов рецепта.
+
+Тег с id N соответствует биту N - 1 в Recipe.tags_mask. Старший бит
+BigIntegerField знаковый, поэтому в маску помещаются теги с id от 1
+до 63, для остальных фильтрация выполняется через таблицу связей.
+
+Условие на маску не использует индекс, и рецепты проверяются по одному
+в порядке страницы. Это быстро, когда тегом отмечена заметная часть
+рецептов, а для редких тегов рецепты выбираются по индексу таблицы
+связей.
+"""
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Case, F, Value, When
+
+from recipes.models import Recipe
+
+MASK_WIDTH = 63
+
+
+def tags_mask(tag_ids) -> int | None:
+    """Маска для тегов или None, если какой-то тег в неё не помещается."""
+    mask = 0
+    for tag_id in tag_ids:
+        if not 0 < tag_id <= MASK_WIDTH:
+            return None
+        mask |= 1 << (tag_id - 1)
+    return mask
+
+
+def update_tags_mask(recipe_ids) -> dict[int, int]:
+    """Пересчёт масок рецептов по таблице связей с тегами."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return {}
+    masks = defaultdict(int)
+    rows = Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids, tag_id__lte=MASK_WIDTH
+    ).values_list("recipe_id", "tag_id")
+    for recipe_id, tag_id in rows:
+        masks[recipe_id] |= 1 << (tag_id - 1)
+    Recipe.objects.filter(id__in=recipe_ids).update(
+        tags_mask=Case(
+            *(
+                When(id=recipe_id, then=Value(mask))
+                for recipe_id, mask in masks.items()
+            ),
+            default=Value(0),
+        )
+    )
+    return masks
+
+
+def remove_tag_from_masks(tag_id):
+    """Сброс бита удалённого тега у всех рецептов."""
+    mask = tags_mask([tag_id])
+    if mask:
+        Recipe.objects.alias(tag_bit=F("tags_mask").bitand(mask)).exclude(
+            tag_bit=0
+        ).update(tags_mask=F("tags_mask") - mask)
+
+
+def filter_by_tags(queryset, tags):
+    """
+    Рецепты хотя бы с одним из тегов, без повторов и DISTINCT.
+
+    Если у тегов меньше TAGS_MASK_MIN_LINKS связей с рецептами, рецепты
+    выбираются подзапросом IN по индексу таблицы связей, иначе
+    проверяется маска. Количество связей считается не дальше порога.
+    """
+    tag_ids = [tag.id for tag in tags]
+    mask = tags_mask(tag_ids)
+    links = Recipe.tags.through.objects.filter(tag_id__in=tag_ids)
+    limit = settings.TAGS_MASK_MIN_LINKS
+    if mask is None or links[:limit].count() < limit:
+        return queryset.filter(id__in=links.values("recipe_id"))
+    return queryset.alias(selected_tags=F("tags_mask").bitand(mask)).exclude(
+        selected_tags=0
+    )
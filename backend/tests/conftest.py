@@ -3,6 +3,7 @@ import tempfile
 
 import pytest
 
+from recipes.counters import change_recipes_count
 from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
 
 
@@ -24,6 +25,39 @@ def temp_media_root(settings):
     shutil.rmtree(temp_dir)
 
 
+@pytest.fixture(autouse=True)
+def locmem_cache(settings):
+    from django.core.cache import cache
+
+    settings.CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+    yield
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_reference_registries(monkeypatch):
+    # Версии данных откатываются вместе с транзакцией теста.
+    monkeypatch.setattr("recipes.reference._reference", None)
+    monkeypatch.setattr("recipes.pantry._index", None)
+
+
+@pytest.fixture(autouse=True)
+def temp_shopping_list_cache(settings, temp_media_root):
+    settings.SHOPPING_LIST_CACHE = {
+        **settings.SHOPPING_LIST_CACHE,
+        "DIR": f"{temp_media_root}/cache",
+    }
+
+
+@pytest.fixture(autouse=True)
+def inline_pdf_rendering(settings):
+    settings.PDF_RENDER_POOL = {**settings.PDF_RENDER_POOL, "PROCESSES": 0}
+
+
 @pytest.fixture
 def temp_email_backend(settings):
     settings.EMAIL_BACKEND = "tests.utils.CustomLocMemEmailBackend"
@@ -124,6 +158,7 @@ def recipe(creator, tag, ingredient, recipes_image):
         "image": recipes_image,
     }
     recipe = Recipe.objects.create(**data)
+    change_recipes_count(creator.id, 1)
     recipe.tags.add(tag)
     recipe.save()
     IngredientRecipe.objects.create(
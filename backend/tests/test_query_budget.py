@@ -0,0 +1,264 @@
+import itertools
+import os
+import traceback
+from collections import Counter
+from io import StringIO
+
+import pytest
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.urls import reverse
+
+from api.management.commands.check_query_plans import sqlite_seq_scans
+from recipes.feed import add_author_to_feed
+from recipes.ingredient_index import bump_data_version
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+)
+from recipes.reference import REFERENCE
+from recipes.shopping_list import add_to_shopping_list
+from users.models import Subscribe
+
+SMALL, LARGE = 2, 5
+
+# (название, клиент, функция построения url по последним данным)
+ENDPOINTS = (
+    ("recipes-list", "client", lambda data: reverse("api:recipes-list")),
+    (
+        "recipes-list-auth",
+        "auth_client",
+        lambda data: reverse("api:recipes-list"),
+    ),
+    (
+        "recipes-list-popular",
+        "client",
+        lambda data: reverse("api:recipes-list") + "?ordering=popular",
+    ),
+    (
+        "recipes-detail",
+        "client",
+        lambda data: reverse("api:recipes-detail", args=[data["recipe"].id]),
+    ),
+    (
+        "recipes-detail-auth",
+        "auth_client",
+        lambda data: reverse("api:recipes-detail", args=[data["recipe"].id]),
+    ),
+    ("recipes-feed", "auth_client", lambda data: reverse("api:recipes-feed")),
+    (
+        "recipes-pantry",
+        "client",
+        lambda data: reverse("api:recipes-pantry")
+        + f"?ingredients={data['ingredient'].id}",
+    ),
+    (
+        "recipes-related",
+        "client",
+        lambda data: reverse("api:recipes-related", args=[data["recipe"].id]),
+    ),
+    ("tags-list", "client", lambda data: reverse("api:tags-list")),
+    (
+        "ingredients-list",
+        "client",
+        lambda data: reverse("api:ingredients-list"),
+    ),
+    (
+        "ingredients-detail",
+        "client",
+        lambda data: reverse(
+            "api:ingredients-detail", args=[data["ingredient"].id]
+        ),
+    ),
+    ("users-list", "auth_client", lambda data: reverse("api:users-list")),
+    (
+        "users-detail",
+        "auth_client",
+        lambda data: reverse("api:users-detail", args=[data["author"].id]),
+    ),
+    ("users-me", "auth_client", lambda data: reverse("api:users-me")),
+    (
+        "users-subscriptions",
+        "auth_client",
+        lambda data: reverse("api:users-subscriptions"),
+    ),
+    (
+        "download-shopping-cart",
+        "auth_client",
+        lambda data: reverse("api:download_shop_list") + "?format=csv",
+    ),
+)
+
+
+def call_site() -> str:
+    """
+    Место вызова запроса: ближайший кадр кода проекта и ближайший к
+    запросу кадр библиотеки вне django.db.
+    """
+    django_db = os.path.join("django", "db", "")
+    library = None
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        if frame.filename == __file__ or django_db in frame.filename:
+            continue
+        location = f"{frame.filename}:{frame.lineno} in {frame.name}"
+        if frame.filename.startswith(str(settings.BASE_DIR)):
+            return " <- ".join(filter(None, (library, location)))
+        library = library or location
+    return library or "?"
+
+
+class QueryRecorder:
+    """Обёртка выполнения запросов, запоминающая SQL и место вызова."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((call_site(), sql))
+        return execute(sql, params, many, context)
+
+    def report(self) -> str:
+        by_site = {}
+        for site, sql in self.queries:
+            by_site.setdefault(site, []).append(sql)
+        lines = []
+        for site, queries in sorted(
+            by_site.items(), key=lambda item: -len(item[1])
+        ):
+            lines.append(f"{len(queries)} x {site}")
+            lines.extend(
+                f"    {count} x {sql}"
+                for sql, count in Counter(queries).most_common()
+            )
+        return "\n".join(lines)
+
+
+@pytest.fixture
+def seed(django_user_model, authorized_user, tag):
+    """Добавляет авторов с рецептами, подписками, избранным и корзиной."""
+    numbers = itertools.count()
+    data = {}
+
+    def seed(count):
+        for _ in range(count):
+            number = next(numbers)
+            author = django_user_model.objects.create(
+                email=f"author{number}@mail.com", username=f"author{number}"
+            )
+            recipe = Recipe.objects.create(
+                author=author,
+                name=f"recipe {number}",
+                text="text",
+                cooking_time=1,
+            )
+            recipe.tags.add(tag)
+            ingredients = Ingredient.objects.bulk_create(
+                Ingredient(
+                    name=f"ingredient {number} {index}",
+                    measurement_unit="г",
+                )
+                for index in range(count)
+            )
+            bump_data_version(REFERENCE)
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                )
+                for ingredient in ingredients
+            )
+            Subscribe.objects.create(author=author, subscriber=authorized_user)
+            add_author_to_feed(authorized_user.id, author.id)
+            Favorite.objects.create(user=authorized_user, recipe=recipe)
+            ShoppingCart.objects.create(user=authorized_user, recipe=recipe)
+            add_to_shopping_list(authorized_user.id, [recipe.id])
+            data.update(
+                author=author, recipe=recipe, ingredient=ingredients[0]
+            )
+        return data
+
+    return seed
+
+
+@pytest.mark.django_db
+class TestQueryBudget:
+    """
+    Количество запросов к базе не должно зависеть от объёма данных.
+
+    Каждый эндпоинт вызывается на двух объёмах данных, при расхождении
+    выводится SQL, сгруппированный по месту вызова.
+    """
+
+    def measure(self, api_client, url) -> QueryRecorder:
+        cache.clear()
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = api_client.get(
+                url + ("&" if "?" in url else "?") + "limit=100"
+            )
+            if response.streaming:
+                # Потоковые ответы читают базу при выдаче содержимого,
+                # поэтому поток читается целиком внутри подсчёта.
+                list(response)
+        assert response.status_code == 200, f"{url}: {response.status_code}"
+        return recorder
+
+    @pytest.mark.parametrize(
+        "name, client_fixture, get_url",
+        ENDPOINTS,
+        ids=[endpoint[0] for endpoint in ENDPOINTS],
+    )
+    def test_queries_do_not_depend_on_size(
+        self, request, seed, name, client_fixture, get_url
+    ):
+        api_client = request.getfixturevalue(client_fixture)
+        small = self.measure(api_client, get_url(seed(SMALL)))
+        large = self.measure(api_client, get_url(seed(LARGE - SMALL)))
+        assert len(small.queries) == len(large.queries), (
+            f"{name}: {len(small.queries)} запросов на {SMALL} объектах и "
+            f"{len(large.queries)} на {LARGE}\n"
+            f"--- {SMALL} ---\n{small.report()}\n"
+            f"--- {LARGE} ---\n{large.report()}"
+        )
+
+
+@pytest.mark.django_db
+class TestQueryPlans:
+    """Тестирование команды проверки планов запросов"""
+
+    def test_seeded_plans_use_indexes(self):
+        out = StringIO()
+        call_command(
+            "check_query_plans", "--seed", "60", "--min-rows", "20", stdout=out
+        )
+        assert "download-shopping-cart" in out.getvalue()
+
+    def test_sqlite_seq_scans(self):
+        sql = (
+            'SELECT "recipes_recipe"."id" FROM "recipes_recipe" WHERE EXISTS'
+            '(SELECT 1 AS "a" FROM "recipes_favorite" U0 WHERE U0."user_id" '
+            "= %s)"
+        )
+        rows = [(2, 0, 0, "SCAN recipes_recipe"), (4, 2, 0, "SCAN U0")]
+        assert set(sqlite_seq_scans(sql, rows)) == {
+            "recipes_recipe",
+            "recipes_favorite",
+        }
+        assert not list(sqlite_seq_scans(f"{sql} LIMIT 6", rows))
+        assert list(
+            sqlite_seq_scans(
+                f"{sql} ORDER BY 1 LIMIT 6",
+                rows + [(9, 0, 0, "USE TEMP B-TREE FOR ORDER BY")],
+            )
+        )
+        derived = [
+            (2, 0, 0, "CO-ROUTINE subquery"),
+            (9, 0, 0, "SCAN subquery"),
+        ]
+        assert not list(
+            sqlite_seq_scans("SELECT COUNT(*) FROM (...)", derived)
+        )
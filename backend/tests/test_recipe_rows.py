@@ -0,0 +1,123 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.serializers.recipe_rows import recipe_rows, serialize_recipes
+from api.serializers.recipe_serializers import RecipeReadSerializer
+from api.views.recipe_views import RecipeViewSet
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    Tag,
+)
+
+
+@pytest.mark.django_db
+class TestRecipeRows:
+    """Быстрая сериализация рецептов совпадает с RecipeReadSerializer"""
+
+    @pytest.fixture
+    def recipes(self, recipe, recipes_many_data, authorized_user, tag):
+        recipes = [recipe, *Recipe.objects.bulk_create(recipes_many_data)]
+        other_tag = Tag.objects.create(
+            name="другой тег", color="#000000", slug="other"
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f"ингредиент «{index}»", measurement_unit="г")
+            for index in range(3)
+        )
+        for index, item in enumerate(recipes):
+            item.tags.add(*[tag, other_tag][: index % 3])
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe=item, ingredient=ingredient, amount=index + 1
+                )
+                for ingredient in ingredients[: index % 4]
+            )
+        Favorite.objects.create(user=authorized_user, recipe=recipes[1])
+        ShoppingCart.objects.create(user=authorized_user, recipe=recipes[2])
+        IngredientRecipe.objects.create(recipe=recipes[3], ingredient=None)
+        Recipe.objects.filter(id=recipe.id).update(
+            image_variants={
+                "source": recipe.image.name,
+                "widths": [320, 640],
+                "webp": [
+                    "recipes/variants/a-320.webp",
+                    "recipes/variants/a-640.webp",
+                ],
+                "jpeg": [
+                    "recipes/variants/a-320.jpg",
+                    "recipes/variants/a-640.jpg",
+                ],
+            }
+        )
+        return recipes
+
+    def get_view(self, user=None, params=None):
+        request = APIRequestFactory().get(reverse("api:recipes-list"), params)
+        if user is not None:
+            force_authenticate(request, user)
+        view = RecipeViewSet(
+            action="list", action_map={"get": "list"}, format_kwarg=None
+        )
+        view.request = view.initialize_request(request)
+        return view
+
+    @pytest.mark.parametrize("authorized", (False, True))
+    @pytest.mark.parametrize(
+        "params",
+        (
+            {},
+            {"fields": "id,name,image,cooking_time,tags"},
+            {"fields": "id,image_srcset"},
+            {"omit": "text,ingredients,is_favorited"},
+            {"fields": "author,is_in_shopping_cart", "omit": "author"},
+        ),
+    )
+    def test_same_bytes(self, recipes, authorized_user, authorized, params):
+        view = self.get_view(authorized_user if authorized else None, params)
+        queryset = view.get_queryset()
+        expected = RecipeReadSerializer(
+            queryset, many=True, context={"request": view.request}
+        ).data
+        actual = serialize_recipes(
+            recipe_rows(queryset, view.get_requested_fields()), view.request
+        )
+        assert JSONRenderer().render(actual) == JSONRenderer().render(
+            expected
+        ), "Быстрая сериализация должна совпадать с RecipeReadSerializer"
+
+    def test_retrieve_same_bytes(self, recipes, auth_client):
+        recipe = recipes[1]
+        response = auth_client.get(
+            reverse("api:recipes-detail", args=[recipe.id])
+        )
+        view = self.get_view()
+        expected = RecipeReadSerializer(
+            view.get_queryset().get(id=recipe.id),
+            context={"request": response.wsgi_request},
+        ).data
+        expected["is_favorited"] = True
+        expected["is_in_shopping_cart"] = False
+        assert response.content == JSONRenderer().render(expected)
+
+    def test_retrieve_not_found(self, client):
+        response = client.get(reverse("api:recipes-detail", args=[0]))
+        assert response.status_code == 404
+
+    def test_bench_command(self, recipes, authorized_user):
+        out = StringIO()
+        call_command(
+            "bench_recipe_serializers",
+            "--repeat=1",
+            f"--user={authorized_user.email}",
+            stdout=out,
+        )
+        assert "Ускорение" in out.getvalue()
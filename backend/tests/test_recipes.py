@@ -1,11 +1,35 @@
-from io import BytesIO
+import hashlib
+import os
+from datetime import timedelta
+from io import BytesIO, StringIO
 
 import pytest
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
 from PyPDF2 import PdfReader
 from rest_framework.test import APIClient
 
-from recipes.models import Favorite, Recipe, ShoppingCart
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    RelatedRecipe,
+    ShoppingCart,
+    Tag,
+)
+from api.serializers.user_serializers import RecipeForSubscribeSerializer
+from api.views.recipe_views import RecipeViewSet
+from recipes import pantry
+from recipes.images import build_variants, get_storage, variant_files
+from recipes.reference import get_reference_data
+from recipes.search import install_search, uninstall_search
 
 
 @pytest.mark.django_db
@@ -494,3 +518,1467 @@ class TestRecipePaginator:
         assert len(response.data["results"]) == 6
         assert response.data["count"] == 10
         assert response.data["next"] is not None
+
+
+@pytest.mark.django_db
+class TestBulkFavoriteShoppingCart:
+    """Тест массового управления избранным и списком покупок"""
+
+    @pytest.fixture
+    def recipes(self, recipes_many_data):
+        return Recipe.objects.bulk_create(recipes_many_data)
+
+    @pytest.mark.parametrize(
+        "url_name, model",
+        (
+            ("api:recipes-favorite-bulk", Favorite),
+            ("api:recipes-shopping-cart-bulk", ShoppingCart),
+        ),
+    )
+    def test_bulk_add_delete(
+        self, auth_client, authorized_user, recipes, url_name, model
+    ):
+        url = reverse(url_name)
+        recipe_ids = [recipe.id for recipe in recipes]
+        response = auth_client.post(
+            url, data={"recipes": recipe_ids}, format="json"
+        )
+        assert response.status_code == 201
+        assert [item["id"] for item in response.data] == recipe_ids
+        assert model.objects.filter(user=authorized_user).count() == len(
+            recipe_ids
+        )
+
+        response = auth_client.post(
+            url, data={"recipes": recipe_ids[:2]}, format="json"
+        )
+        assert (
+            response.status_code == 201
+        ), "Повторное добавление рецептов не должно вызывать ошибку"
+        assert model.objects.filter(user=authorized_user).count() == len(
+            recipe_ids
+        )
+
+        response = auth_client.delete(
+            url, data={"recipes": recipe_ids[:3]}, format="json"
+        )
+        assert response.status_code == 204
+        assert model.objects.filter(user=authorized_user).count() == (
+            len(recipe_ids) - 3
+        )
+
+    @pytest.mark.parametrize(
+        "url_name, field",
+        (
+            ("api:recipes-favorite", "favorites_count"),
+            ("api:recipes-shopping-cart", "in_carts_count"),
+        ),
+    )
+    def test_single_and_bulk_share_lock(
+        self, auth_client, recipe, monkeypatch, url_name, field
+    ):
+        actions = []
+        lock_user = RecipeViewSet.lock_user
+        monkeypatch.setattr(
+            RecipeViewSet,
+            "lock_user",
+            lambda view: actions.append(view.action) or lock_user(view),
+        )
+        url = reverse(url_name, args=[recipe.id])
+        bulk_url = reverse(f"{url_name}-bulk")
+        assert auth_client.post(url).status_code == 201
+        auth_client.post(
+            bulk_url, data={"recipes": [recipe.id]}, format="json"
+        )
+        assert auth_client.delete(url).status_code == 204
+        recipe.refresh_from_db()
+        assert getattr(recipe, field) == 0
+        assert len(actions) == 3, "Каждое изменение блокирует пользователя"
+
+    def test_bulk_queries_do_not_depend_on_size(
+        self, auth_client, recipes, django_assert_max_num_queries
+    ):
+        url = reverse("api:recipes-shopping-cart-bulk")
+        with django_assert_max_num_queries(12):
+            auth_client.post(
+                url,
+                data={"recipes": [recipe.id for recipe in recipes]},
+                format="json",
+            )
+        with django_assert_max_num_queries(12):
+            auth_client.delete(
+                url,
+                data={"recipes": [recipe.id for recipe in recipes]},
+                format="json",
+            )
+
+    def test_bulk_shopping_list_items(
+        self, auth_client, authorized_user, recipe, ingredient
+    ):
+        from recipes.models import ShoppingListItem
+
+        url = reverse("api:recipes-shopping-cart-bulk")
+        auth_client.post(url, data={"recipes": [recipe.id]}, format="json")
+        auth_client.post(url, data={"recipes": [recipe.id]}, format="json")
+        assert ShoppingListItem.objects.get(
+            user=authorized_user, ingredient=ingredient
+        ).amount == 5, "Повторное добавление не должно менять список покупок"
+        auth_client.delete(url, data={"recipes": [recipe.id]}, format="json")
+        assert not ShoppingListItem.objects.filter(
+            user=authorized_user
+        ).exists()
+
+    @pytest.mark.parametrize(
+        "url_name, model",
+        (
+            ("api:recipes-favorite-bulk", Favorite),
+            ("api:recipes-shopping-cart-bulk", ShoppingCart),
+        ),
+    )
+    def test_bulk_delete_is_fast(
+        self, auth_client, recipes, url_name, model
+    ):
+        from django.db.models.signals import post_delete, pre_delete
+
+        url = reverse(url_name)
+        data = {"recipes": [recipe.id for recipe in recipes]}
+        auth_client.post(url, data=data, format="json")
+        flag = "is_favorited" if model is Favorite else "is_in_shopping_cart"
+        list_url = reverse("api:recipes-list")
+        assert all(
+            item[flag] for item in auth_client.get(list_url).data["results"]
+        )
+        assert not (
+            pre_delete.has_listeners(model) or post_delete.has_listeners(model)
+        ), "Обработчики удаления заставляют delete() выбирать строки"
+        with CaptureQueriesContext(connection) as queries:
+            auth_client.delete(url, data=data, format="json")
+        deletes = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith("DELETE")
+            and model._meta.db_table in query["sql"]
+        ]
+        assert len(deletes) == 1
+        assert not any(
+            item[flag] for item in auth_client.get(list_url).data["results"]
+        )
+
+    def test_bulk_unknown_recipe(self, auth_client, recipe):
+        url = reverse("api:recipes-favorite-bulk")
+        response = auth_client.post(
+            url, data={"recipes": [recipe.id, recipe.id + 100]}, format="json"
+        )
+        assert response.status_code == 400
+        assert not Favorite.objects.exists()
+
+    @pytest.mark.parametrize("method", ("post", "delete"))
+    def test_bulk_for_not_auth_user(self, client, recipe, method):
+        url = reverse("api:recipes-shopping-cart-bulk")
+        response = getattr(client, method)(
+            url, data={"recipes": [recipe.id]}, content_type="application/json"
+        )
+        assert response.status_code == 401
+
+
+@pytest.mark.django_db
+class TestRecipeCursorPaginator:
+    """Тестирование курсорной пагинации рецептов"""
+
+    url = reverse("api:recipes-list")
+
+    def test_cursor_pages(
+        self, recipes_many_data: list, client, django_assert_max_num_queries
+    ):
+        Recipe.objects.bulk_create(recipes_many_data)
+        expected_ids = list(
+            Recipe.objects.order_by("-pub_date", "id").values_list(
+                "id", flat=True
+            )
+        )
+        received_ids = []
+        url = f"{self.url}?cursor=&limit=3"
+        # Реестр справочников строится один раз на процесс.
+        get_reference_data()
+        while url:
+            with django_assert_max_num_queries(3) as captured:
+                response = client.get(url)
+            assert response.status_code == 200
+            assert "count" not in response.data
+            assert not any(
+                "COUNT(" in query["sql"] for query in captured.captured_queries
+            ), "Курсорная пагинация не должна выполнять COUNT"
+            received_ids += [
+                recipe["id"] for recipe in response.data["results"]
+            ]
+            url = response.data["next"]
+        assert received_ids == expected_ids
+
+
+@pytest.mark.django_db
+class TestRecipeResponseCache:
+    """Тестирование кэша списка рецептов для анонимных пользователей"""
+
+    url = reverse("api:recipes-list")
+
+    def test_anonymous_list_is_cached(
+        self, client, recipe, django_assert_num_queries
+    ):
+        params = {"tags": recipe.tags.all()[0].slug}
+        first = client.get(self.url, params)
+        with django_assert_num_queries(0):
+            second = client.get(self.url, params)
+        assert first.data == second.data
+
+    def test_recipe_update_invalidates_cache(
+        self,
+        client,
+        creator_client,
+        recipe,
+        recipe_data,
+        django_capture_on_commit_callbacks,
+    ):
+        client.get(self.url)
+        with django_capture_on_commit_callbacks(execute=True):
+            creator_client.patch(
+                reverse("api:recipes-detail", args=[recipe.id]),
+                data=recipe_data,
+                format="json",
+            )
+        response = client.get(self.url)
+        assert (
+            response.data["results"][0]["name"] == recipe_data["name"]
+        ), "Изменение рецепта должно сбрасывать кэш списка рецептов"
+
+    def test_tag_update_invalidates_cache(
+        self, client, recipe, tag, django_capture_on_commit_callbacks
+    ):
+        client.get(self.url)
+        with django_capture_on_commit_callbacks(execute=True):
+            tag.name = "new tag name"
+            tag.save()
+        response = client.get(self.url)
+        assert response.data["results"][0]["tags"][0]["name"] == tag.name
+
+    @pytest.mark.parametrize("change", ("favorite", "author"))
+    def test_counter_and_author_changes_invalidate_cache(
+        self,
+        client,
+        auth_client,
+        creator,
+        recipe,
+        change,
+        django_capture_on_commit_callbacks,
+    ):
+        etag = client.get(self.url)["ETag"]
+        with django_capture_on_commit_callbacks(execute=True):
+            if change == "favorite":
+                auth_client.post(
+                    reverse("api:recipes-favorite", args=[recipe.id])
+                )
+            else:
+                creator.first_name = "Новое имя"
+                creator.save()
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        assert (
+            response.status_code == 200
+        ), f"Изменение ({change}) должно сбрасывать кэш списка рецептов"
+        data = response.data["results"][0]
+        assert data["favorites_count"] == (change == "favorite")
+        assert data["author"]["first_name"] == creator.first_name
+
+    def test_counter_change_keeps_cached_page(
+        self,
+        client,
+        auth_client,
+        recipe,
+        django_assert_num_queries,
+        django_capture_on_commit_callbacks,
+    ):
+        from api.cache import get_generation
+
+        client.get(self.url)
+        generation = get_generation()
+        with django_capture_on_commit_callbacks(execute=True):
+            auth_client.post(
+                reverse("api:recipes-favorite", args=[recipe.id])
+            )
+        assert get_generation() == generation
+        # Страница из кэша, счётчики из кэша счётчиков рецептов.
+        with django_assert_num_queries(0):
+            response = client.get(self.url)
+        assert response.data["results"][0]["favorites_count"] == 1
+        assert client.get(self.url)["ETag"] == response["ETag"]
+
+    def test_authorized_list_is_not_cached(
+        self, auth_client, authorized_user, recipe
+    ):
+        auth_client.get(self.url)
+        Favorite.objects.create(recipe=recipe, user=authorized_user)
+        response = auth_client.get(self.url)
+        assert response.data["results"][0]["is_favorited"]
+
+
+@pytest.mark.django_db
+class TestCounters:
+    """Тестирование счётчиков рецептов и пользователей"""
+
+    @pytest.mark.parametrize(
+        "url_name, field",
+        (
+            ("api:recipes-favorite", "favorites_count"),
+            ("api:recipes-shopping-cart", "in_carts_count"),
+        ),
+    )
+    def test_recipe_counters(self, auth_client, recipe, url_name, field):
+        url = reverse(url_name, args=[recipe.id])
+        auth_client.post(url)
+        recipe.refresh_from_db()
+        assert (
+            getattr(recipe, field) == 1
+        ), f"Поле {field} должно увеличиваться при добавлении рецепта"
+        response = auth_client.get(
+            reverse("api:recipes-detail", args=[recipe.id])
+        )
+        assert response.data[field] == 1
+        auth_client.delete(url)
+        recipe.refresh_from_db()
+        assert getattr(recipe, field) == 0
+
+    @pytest.mark.parametrize(
+        "url_name, field",
+        (
+            ("api:recipes-favorite-bulk", "favorites_count"),
+            ("api:recipes-shopping-cart-bulk", "in_carts_count"),
+        ),
+    )
+    def test_bulk_recipe_counters(
+        self, auth_client, recipes_many_data, url_name, field
+    ):
+        recipes = Recipe.objects.bulk_create(recipes_many_data)
+        recipe_ids = [recipe.id for recipe in recipes]
+        url = reverse(url_name)
+        auth_client.post(url, data={"recipes": recipe_ids}, format="json")
+        auth_client.post(url, data={"recipes": recipe_ids}, format="json")
+        auth_client.delete(
+            url, data={"recipes": recipe_ids[:2]}, format="json"
+        )
+        counts = dict(
+            Recipe.objects.filter(id__in=recipe_ids).values_list("id", field)
+        )
+        assert counts == {
+            recipe_id: int(recipe_id not in recipe_ids[:2])
+            for recipe_id in recipe_ids
+        }
+
+    def test_recipes_count(self, auth_client, authorized_user, recipe_data):
+        response = auth_client.post(
+            reverse("api:recipes-list"), data=recipe_data, format="json"
+        )
+        authorized_user.refresh_from_db()
+        assert authorized_user.recipes_count == 1
+        auth_client.delete(
+            reverse("api:recipes-detail", args=[response.data["id"]])
+        )
+        authorized_user.refresh_from_db()
+        assert authorized_user.recipes_count == 0
+
+    def test_reconcile_counters(self, authorized_user, recipe):
+        Favorite.objects.create(user=authorized_user, recipe=recipe)
+        ShoppingCart.objects.create(user=authorized_user, recipe=recipe)
+        with pytest.raises(CommandError):
+            call_command("reconcile_counters", "--check")
+        call_command("reconcile_counters")
+        recipe.refresh_from_db()
+        assert (recipe.favorites_count, recipe.in_carts_count) == (1, 1)
+        call_command("reconcile_counters", "--check")
+
+
+@pytest.mark.django_db
+class TestSparseFields:
+    """Тестирование параметров fields и omit"""
+
+    url = reverse("api:recipes-list")
+
+    def test_fields(self, auth_client, recipe):
+        response = auth_client.get(
+            self.url, {"fields": "id,name,image,cooking_time,tags"}
+        )
+        assert list(response.data["results"][0]) == [
+            "id",
+            "tags",
+            "name",
+            "image",
+            "cooking_time",
+        ], "В ответе должны быть только поля из параметра fields"
+
+    def test_omit(self, client, recipe):
+        response = client.get(
+            reverse("api:recipes-detail", args=[recipe.id]),
+            {"omit": "text,ingredients,author"},
+        )
+        assert not {"text", "ingredients", "author"} & set(response.data)
+        assert "name" in response.data
+
+    def test_nested_author_is_complete(self, client, recipe):
+        response = client.get(self.url, {"fields": "author"})
+        assert list(response.data["results"][0]) == ["author"]
+        assert "email" in response.data["results"][0]["author"]
+
+    def test_queries_skip_unrequested_fields(self, auth_client, recipe):
+        with CaptureQueriesContext(connection) as full:
+            auth_client.get(self.url)
+        with CaptureQueriesContext(connection) as sparse:
+            auth_client.get(self.url, {"fields": "id,name"})
+        assert len(sparse) < len(full)
+        for query in sparse:
+            if "authtoken_token" in query["sql"]:
+                continue
+            for fragment in (
+                "EXISTS",
+                "users_user",
+                "recipes_tag",
+                "recipes_ingredient",
+                '"recipes_recipe"."text"',
+            ):
+                assert (
+                    fragment not in query["sql"]
+                ), f"Незапрошенные поля не должны загружаться: {fragment}"
+
+    def test_user_fields(self, auth_client, authorized_user):
+        response = auth_client.get(
+            reverse("api:users-list"), {"fields": "id,username"}
+        )
+        assert list(response.data["results"][0]) == ["id", "username"]
+        response = auth_client.get(reverse("api:users-me"), {"omit": "email"})
+        assert "email" not in response.data
+        assert "username" in response.data
+
+
+@pytest.mark.django_db
+class TestTagsMask:
+    """Тестирование битовой маски тегов рецепта"""
+
+    url = reverse("api:recipes-list")
+
+    @pytest.fixture
+    def other_tag(self):
+        return Tag.objects.create(name="other", color="#000000", slug="other")
+
+    def get_mask(self, recipe):
+        recipe.refresh_from_db()
+        return recipe.tags_mask
+
+    def test_mask_follows_tags(self, recipe, tag, other_tag):
+        tag_bit, other_bit = 1 << (tag.id - 1), 1 << (other_tag.id - 1)
+        assert self.get_mask(recipe) == tag_bit
+        recipe.tags.add(other_tag)
+        assert recipe.tags_mask == tag_bit | other_bit
+        assert self.get_mask(recipe) == tag_bit | other_bit
+        recipe.tags.remove(tag)
+        assert self.get_mask(recipe) == other_bit
+        other_tag.recipes.clear()
+        assert self.get_mask(recipe) == 0
+        other_tag.recipes.add(recipe)
+        assert self.get_mask(recipe) == other_bit
+        other_tag.delete()
+        assert self.get_mask(recipe) == 0
+
+    @pytest.mark.parametrize("min_links", (1, 1000))
+    def test_filter_without_distinct(
+        self, settings, client, recipe, tag, other_tag, min_links
+    ):
+        settings.TAGS_MASK_MIN_LINKS = min_links
+        recipe.tags.add(other_tag)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(
+                self.url, {"tags": [tag.slug, other_tag.slug]}
+            )
+        assert [item["id"] for item in response.data["results"]] == [
+            recipe.id
+        ], "Рецепт с несколькими тегами не должен повторяться"
+        count_sql = next(
+            query["sql"]
+            for query in queries
+            if 'COUNT(*) AS "__count" FROM "recipes_recipe"' in query["sql"]
+        )
+        assert "DISTINCT" not in count_sql
+        # У тегов две связи: ниже порога рецепты выбираются по таблице
+        # связей, иначе по маске.
+        assert ("recipes_recipe_tags" in count_sql) == (min_links > 2)
+
+    def test_fallback_for_large_tag_id(self, client, recipe):
+        big_tag = Tag.objects.create(
+            id=100, name="big", color="#111111", slug="big"
+        )
+        recipe.tags.add(big_tag)
+        response = client.get(self.url, {"tags": [big_tag.slug]})
+        assert [item["id"] for item in response.data["results"]] == [
+            recipe.id
+        ]
+
+
+@pytest.mark.django_db
+class TestRecipeSearch:
+    """Тестирование полнотекстового поиска рецептов"""
+
+    url = reverse("api:recipes-list")
+
+    @pytest.fixture
+    def recipes(self, creator):
+        data = (
+            ("Оладьи", "Мука, кефир и яйца."),
+            ("Борщ", "Свекла, капуста и картофель."),
+            ("Салат с капустой", "Нарезать и перемешать."),
+        )
+        return [
+            Recipe.objects.create(
+                author=creator, name=name, text=text, cooking_time=10
+            )
+            for name, text in data
+        ]
+
+    def search(self, client, query):
+        response = client.get(self.url, {"search": query})
+        assert response.status_code == 200
+        return [item["name"] for item in response.data["results"]]
+
+    def test_search_ranked(self, client, recipes):
+        assert self.search(client, "капуст") == [
+            "Салат с капустой",
+            "Борщ",
+        ], "Совпадения в названии должны быть выше совпадений в описании"
+        assert self.search(client, "КЕФИР") == ["Оладьи"]
+        assert self.search(client, "борщ капуст") == ["Борщ"]
+
+    def test_search_follows_changes(self, client, recipes):
+        recipes[0].name = "Блины"
+        recipes[0].save()
+        recipes[1].delete()
+        assert self.search(client, "блин") == ["Блины"]
+        assert self.search(client, "оладьи") == []
+        assert self.search(client, "свекла") == []
+
+    def test_search_syntax_is_escaped(self, client, recipes):
+        assert self.search(client, '"*:( OR') == []
+        assert self.search(client, "!!!") == []
+
+    @pytest.mark.parametrize(
+        "params", ({"cursor": ""}, {"ordering": "popular"})
+    )
+    def test_search_with_other_ordering(self, client, recipes, params):
+        response = client.get(self.url, {"search": "капуст", **params})
+        assert (
+            response.status_code == 400
+        ), "Поиск сортирует по релевантности и не сочетается с другим порядком"
+        assert "search" in response.data
+        params["search"] = ""
+        assert client.get(self.url, params).status_code == 200
+
+    def test_search_restored_after_triggers_lost(self, client, recipes):
+        uninstall_search(connection)
+        Recipe.objects.filter(id=recipes[0].id).update(name="Сырники")
+        install_search(connection)
+        assert self.search(client, "сырник") == ["Сырники"]
+
+
+@pytest.mark.django_db
+class TestIngredientSearch:
+    """Тестирование поиска ингредиентов по индексу в памяти"""
+
+    url = reverse("api:ingredients-list")
+
+    @pytest.fixture
+    def ingredients(self):
+        return [
+            Ingredient.objects.create(name=name, measurement_unit="г")
+            for name in ("Сыр", "сырники", "Творожный сыр", "Соль", "сыроежки")
+        ]
+
+    def search(self, client, query):
+        response = client.get(self.url, {"name": query})
+        assert response.status_code == 200
+        return [item["name"] for item in response.data]
+
+    def test_prefix_before_substring(self, client, ingredients):
+        assert self.search(client, "СЫР") == [
+            "Сыр",
+            "сырники",
+            "сыроежки",
+            "Творожный сыр",
+        ], "Совпадения по началу названия должны идти первыми"
+        assert self.search(client, "сол") == ["Соль"]
+        assert self.search(client, "мука") == []
+        assert len(self.search(client, "")) == len(ingredients)
+
+    def test_response_fields(self, client, ingredients):
+        response = client.get(self.url, {"name": "соль"})
+        ingredient = ingredients[3]
+        assert response.data == [
+            {
+                "id": ingredient.id,
+                "name": ingredient.name,
+                "measurement_unit": ingredient.measurement_unit,
+            }
+        ]
+
+    def test_index_is_reused(
+        self, client, ingredients, django_assert_num_queries
+    ):
+        self.search(client, "сыр")
+        with django_assert_num_queries(1):
+            self.search(client, "сыр")
+
+    def test_index_rebuilt_on_change(self, client, ingredients):
+        assert self.search(client, "мёд") == []
+        Ingredient.objects.create(name="Мёд", measurement_unit="г")
+        assert self.search(client, "мёд") == ["Мёд"]
+        ingredients[0].delete()
+        assert self.search(client, "сыр")[0] == "сырники"
+
+
+@pytest.mark.django_db
+class TestConditionalGet:
+    """Тестирование ETag и Last-Modified у рецептов"""
+
+    list_url = reverse("api:recipes-list")
+
+    def detail_url(self, recipe):
+        return reverse("api:recipes-detail", args=[recipe.id])
+
+    def test_detail_not_modified(
+        self, client, recipe, django_assert_num_queries
+    ):
+        response = client.get(self.detail_url(recipe))
+        etag = response["ETag"]
+        with django_assert_num_queries(1):
+            response = client.get(
+                self.detail_url(recipe), HTTP_IF_NONE_MATCH=etag
+            )
+        assert response.status_code == 304
+        assert response["ETag"] == etag
+        assert not response.content
+
+    def test_author_save_without_changes(self, client, creator, recipe):
+        etag = client.get(self.detail_url(recipe))["ETag"]
+        creator.save()
+        response = client.get(
+            self.detail_url(recipe), HTTP_IF_NONE_MATCH=etag
+        )
+        assert (
+            response.status_code == 304
+        ), "Сохранение автора без изменений не должно менять его рецепты"
+        creator.last_name = "Новая фамилия"
+        creator.save()
+        response = client.get(
+            self.detail_url(recipe), HTTP_IF_NONE_MATCH=etag
+        )
+        assert response.status_code == 200
+        assert response.data["author"]["last_name"] == creator.last_name
+
+    def test_detail_if_modified_since(self, client, recipe):
+        response = client.get(self.detail_url(recipe))
+        last_modified = response["Last-Modified"]
+        response = client.get(
+            self.detail_url(recipe), HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        assert response.status_code == 304
+        response = client.get(
+            self.detail_url(recipe),
+            HTTP_IF_MODIFIED_SINCE="Mon, 01 Jan 2001 00:00:00 GMT",
+        )
+        assert response.status_code == 200
+
+    def test_etag_depends_on_params_and_user(
+        self, client, auth_client, recipe
+    ):
+        url = self.detail_url(recipe)
+        etags = {
+            client.get(url)["ETag"],
+            client.get(url, {"fields": "id"})["ETag"],
+            auth_client.get(url)["ETag"],
+        }
+        assert len(etags) == 3
+
+    @pytest.mark.parametrize(
+        "change",
+        (
+            "recipe",
+            "favorite",
+            "tag",
+            "ingredient",
+            "author",
+        ),
+    )
+    def test_changes_update_etag(
+        self,
+        client,
+        auth_client,
+        creator_client,
+        creator,
+        recipe,
+        tag,
+        change,
+    ):
+        url = self.detail_url(recipe)
+        etag = client.get(url)["ETag"]
+        if change == "recipe":
+            creator_client.patch(url, {"cooking_time": 5}, format="json")
+        elif change == "favorite":
+            auth_client.post(reverse("api:recipes-favorite", args=[recipe.id]))
+        elif change == "tag":
+            tag.name = "new tag name"
+            tag.save()
+        elif change == "ingredient":
+            ingredient = recipe.ingredients.get()
+            ingredient.name = "new ingredient name"
+            ingredient.save()
+        else:
+            creator.first_name = "Новое имя"
+            creator.save()
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert (
+            response.status_code == 200
+        ), f"Изменение ({change}) должно менять ETag рецепта"
+        assert response["ETag"] != etag
+
+    def test_list_not_modified(self, auth_client, recipe):
+        etag = auth_client.get(self.list_url)["ETag"]
+        with CaptureQueriesContext(connection) as queries:
+            response = auth_client.get(
+                self.list_url, HTTP_IF_NONE_MATCH=etag
+            )
+        assert response.status_code == 304
+        assert "Last-Modified" not in response
+        assert not any(
+            "recipes_ingredientrecipe" in query["sql"]
+            or "recipes_recipe_tags" in query["sql"]
+            for query in queries.captured_queries
+        ), "Ответ 304 не должен загружать теги и ингредиенты"
+
+    def test_cursor_page_not_modified(self, client, recipe):
+        params = {"cursor": "", "limit": 3}
+        etag = client.get(self.list_url, params)["ETag"]
+        response = client.get(self.list_url, params, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+
+    def test_list_etag_changes(
+        self,
+        auth_client,
+        creator_client,
+        recipe,
+        django_capture_on_commit_callbacks,
+    ):
+        etag = auth_client.get(self.list_url)["ETag"]
+        auth_client.post(reverse("api:recipes-favorite", args=[recipe.id]))
+        response = auth_client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response.data["results"][0]["is_favorited"]
+        etag = response["ETag"]
+        # Страницы одинаковы для всех пользователей и берутся из кэша.
+        with django_capture_on_commit_callbacks(execute=True):
+            creator_client.delete(self.detail_url(recipe))
+        response = auth_client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response.data["count"] == 0
+
+    def test_anonymous_cached_list(
+        self, client, recipe, django_assert_num_queries
+    ):
+        first = client.get(self.list_url)
+        with django_assert_num_queries(0):
+            response = client.get(
+                self.list_url, HTTP_IF_NONE_MATCH=first["ETag"]
+            )
+        assert response.status_code == 304
+        assert client.get(self.list_url)["ETag"] == first["ETag"]
+
+
+@pytest.mark.django_db
+class TestPantry:
+    """Тестирование подбора рецептов по продуктам"""
+
+    url = reverse("api:recipes-pantry")
+
+    @pytest.fixture
+    def products(self):
+        return Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit="г")
+            for name in ("мука", "яйца", "молоко")
+        )
+
+    def create_recipe(self, author, ingredients):
+        recipe = Recipe.objects.create(
+            author=author, name="recipe", text="text", cooking_time=1
+        )
+        for ingredient in ingredients:
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=1
+            )
+        return recipe
+
+    def search(self, client, ingredients, **params) -> list[tuple]:
+        response = client.get(
+            self.url,
+            {"ingredients": [item.id for item in ingredients], **params},
+        )
+        assert response.status_code == 200
+        return [
+            (recipe["id"], recipe["coverage"], recipe["missing_count"])
+            for recipe in response.data["results"]
+        ]
+
+    def test_ranked_by_coverage_and_missing(self, client, creator, products):
+        flour, eggs, milk = products
+        pancakes = self.create_recipe(creator, [flour, eggs, milk])
+        bread = self.create_recipe(creator, [flour])
+        omelette = self.create_recipe(creator, [eggs, milk])
+        custard = self.create_recipe(creator, [milk])
+        assert self.search(client, [flour, eggs]) == [
+            (bread.id, 1.0, 0),
+            (pancakes.id, pytest.approx(2 / 3), 1),
+            (omelette.id, 0.5, 1),
+        ]
+        assert self.search(client, [milk], limit=1) == [(custard.id, 1.0, 0)]
+
+    def test_index_updated_on_recipe_changes(
+        self, client, creator, products
+    ):
+        flour, eggs, milk = products
+        pancakes = self.create_recipe(creator, [flour, eggs, milk])
+        assert self.search(client, [flour]) == [
+            (pancakes.id, pytest.approx(1 / 3), 2)
+        ]
+        index = pantry._index
+        IngredientRecipe.objects.filter(
+            recipe=pancakes, ingredient=milk
+        ).delete()
+        bread = self.create_recipe(creator, [flour])
+        assert self.search(client, [flour, eggs]) == [
+            (bread.id, 1.0, 0),
+            (pancakes.id, 1.0, 0),
+        ]
+        assert pantry._index is index
+        bread.delete()
+        assert self.search(client, [flour]) == [(pancakes.id, 0.5, 1)]
+        assert pantry._index is not index
+
+    def test_stale_changes_ignored(self, creator, products):
+        flour, eggs, milk = products
+        recipe = self.create_recipe(creator, [flour])
+        index = pantry.PantryIndex.build(0)
+        stale = pantry.get_changes(index.updated_at)
+        IngredientRecipe.objects.create(
+            recipe=recipe, ingredient=eggs, amount=1
+        )
+        index.apply(*pantry.get_changes(index.updated_at))
+        index.apply(*stale)
+        assert index.search([eggs.id]) == [(recipe.id, 0.5, 1)]
+
+    def test_queries_outside_lock(self, creator, products, monkeypatch):
+        flour, eggs, milk = products
+        self.create_recipe(creator, [flour])
+        queries = CaptureQueriesContext(connection)
+        locked = []
+
+        class Lock:
+            def __enter__(self):
+                self.start = len(queries)
+
+            def __exit__(self, *args):
+                locked.append(len(queries) - self.start)
+
+        monkeypatch.setattr(pantry, "_lock", Lock())
+        with queries:
+            pantry.search_pantry([flour.id])
+            self.create_recipe(creator, [flour])
+            pantry.search_pantry([flour.id])
+        assert locked == [0, 0], "Под блокировкой нет запросов к базе"
+
+    def test_recipe_fields(self, client, recipe):
+        ingredient = recipe.ingredients.first()
+        response = client.get(
+            self.url, {"ingredients": ingredient.id, "fields": "id,name"}
+        )
+        assert response.data["count"] == 1
+        assert set(response.data["results"][0]) == {
+            "id",
+            "name",
+            "coverage",
+            "missing_count",
+        }
+
+    @pytest.mark.parametrize("params", [{}, {"ingredients": "abc"}])
+    def test_invalid_ingredients(self, client, params):
+        assert client.get(self.url, params).status_code == 400
+
+
+@pytest.mark.django_db
+class TestRelatedRecipes:
+    """Тестирование похожих рецептов"""
+
+    @pytest.fixture
+    def recipes(self, django_user_model, creator):
+        """
+        Рецепты a, b, c, d: a и b сохранили двое, a и c - двое, b и c -
+        один пользователь, d никто не сохранял.
+        """
+        a, b, c, d = (
+            Recipe.objects.create(
+                author=creator, name=name, text="text", cooking_time=1
+            )
+            for name in "abcd"
+        )
+        first, second, third = (
+            django_user_model.objects.create(
+                email=f"saver{number}@mail.com", username=f"saver{number}"
+            )
+            for number in range(3)
+        )
+        for user, recipe in ((first, a), (first, b), (second, a)):
+            Favorite.objects.create(user=user, recipe=recipe)
+        for user, recipe in ((second, b), (second, c), (third, c)):
+            ShoppingCart.objects.create(user=user, recipe=recipe)
+        Favorite.objects.create(user=third, recipe=a)
+        ShoppingCart.objects.create(user=third, recipe=a)
+        return a, b, c, d
+
+    def build(self, *args):
+        call_command("build_related_recipes", *args, stdout=StringIO())
+
+    def get_related(self, client, recipe) -> list:
+        url = reverse("api:recipes-related", args=[recipe.id])
+        response = client.get(url)
+        assert response.status_code == 200
+        return response.data
+
+    def test_related_by_cosine(self, client, recipes):
+        a, b, c, d = recipes
+        self.build("--chunk-size", "1")
+        related = self.get_related(client, a)
+        assert [recipe["id"] for recipe in related] == [b.id, c.id]
+        assert set(related[0]) == {"id", "name", "image", "cooking_time"}
+        assert [
+            recipe["id"] for recipe in self.get_related(client, b)
+        ] == [a.id, c.id]
+        assert self.get_related(client, d) == []
+        score = RelatedRecipe.objects.get(recipe=a, related=b).score
+        assert score == pytest.approx(2 / 6**0.5)
+        score = RelatedRecipe.objects.get(recipe=b, related=c).score
+        assert score == pytest.approx(0.5)
+
+    def test_chunk_size_does_not_change_result(self, recipes):
+        def rows():
+            return list(
+                RelatedRecipe.objects.values_list(
+                    "recipe_id", "related_id", "score"
+                )
+            )
+
+        self.build("--chunk-size", "1")
+        by_user = rows()
+        self.build("--chunk-size", "100")
+        assert rows() == by_user
+
+    def test_top_and_min_common(self, client, recipes):
+        a, b, c, d = recipes
+        self.build("--top", "1")
+        assert [
+            recipe["id"] for recipe in self.get_related(client, a)
+        ] == [b.id]
+        self.build("--min-common", "2")
+        assert [
+            recipe["id"] for recipe in self.get_related(client, b)
+        ] == [a.id]
+
+    def test_related_is_single_query(self, client, recipes):
+        self.build()
+        url = reverse("api:recipes-related", args=[recipes[0].id])
+        with CaptureQueriesContext(connection) as queries:
+            assert client.get(url).status_code == 200
+        assert len(queries) == 1
+
+    def test_unknown_recipe(self, client, recipes):
+        url = reverse("api:recipes-related", args=[recipes[-1].id + 1])
+        assert client.get(url).status_code == 404
+        url = reverse("api:recipes-related", args=[recipes[-1].id])
+        assert client.get(url).status_code == 200
+
+    def test_deleted_recipe_drops_related(self, recipes):
+        a, b, c, d = recipes
+        self.build()
+        b.delete()
+        assert not RelatedRecipe.objects.filter(related_id=b.id).exists()
+
+
+@pytest.mark.django_db
+class TestPopularOrdering:
+    """Тестирование сортировки по популярности"""
+
+    url = reverse("api:recipes-list")
+
+    @pytest.fixture
+    def recipes(self, creator):
+        return [
+            Recipe.objects.create(
+                author=creator, name=name, text="text", cooking_time=1
+            )
+            for name in "abc"
+        ]
+
+    @pytest.fixture
+    def savers(self, django_user_model):
+        return [
+            django_user_model.objects.create(
+                email=f"fan{number}@mail.com", username=f"fan{number}"
+            )
+            for number in range(3)
+        ]
+
+    def update(self, *args) -> str:
+        out = StringIO()
+        call_command("update_popularity", *args, stdout=out)
+        return out.getvalue()
+
+    def get_ids(self, client, params=None) -> list[int]:
+        response = client.get(self.url, {"ordering": "popular", **params})
+        assert response.status_code == 200
+        return [recipe["id"] for recipe in response.data["results"]]
+
+    def test_favorite_marks_recipe(self, auth_client, recipes):
+        url = reverse("api:recipes-favorite", args=[recipes[0].id])
+        assert auth_client.post(url).status_code == 201
+        recipes[0].refresh_from_db()
+        assert recipes[0].activity_at is not None
+        assert "1" in self.update()
+        recipes[0].refresh_from_db()
+        assert recipes[0].activity_at is None
+        assert recipes[0].popularity > 0
+        assert "0" in self.update()
+
+    def test_ordering_by_decayed_saves(self, client, recipes, savers):
+        a, b, c = recipes
+        for user in savers[:2]:
+            Favorite.objects.create(user=user, recipe=a)
+        ShoppingCart.objects.create(user=savers[2], recipe=a)
+        Favorite.objects.create(user=savers[0], recipe=b)
+        # Три добавления два периода полураспада назад весят меньше
+        # одного сегодняшнего.
+        Favorite.objects.filter(recipe=a).update(
+            created=timezone.now() - timedelta(days=14)
+        )
+        ShoppingCart.objects.filter(recipe=a).update(
+            created=timezone.now() - timedelta(days=14)
+        )
+        self.update("--all")
+        assert self.get_ids(client, {}) == [b.id, a.id, c.id]
+        Favorite.objects.create(user=savers[2], recipe=a)
+        Recipe.objects.filter(id=a.id).update(activity_at=timezone.now())
+        self.update()
+        # Страницы для анонимных пользователей обновляются по истечении
+        # времени хранения в кэше.
+        cache.clear()
+        assert self.get_ids(client, {}) == [a.id, b.id, c.id]
+
+    def test_cursor_pages(self, client, recipes, savers):
+        for user, recipe in zip(savers, recipes[1:]):
+            Favorite.objects.create(user=user, recipe=recipe)
+        self.update("--all")
+        expected = self.get_ids(client, {})
+        ids = []
+        response = client.get(
+            self.url, {"ordering": "popular", "cursor": "", "limit": 1}
+        )
+        while True:
+            ids += [recipe["id"] for recipe in response.data["results"]]
+            if not response.data["next"]:
+                break
+            response = client.get(response.data["next"])
+        assert ids == expected
+
+    def test_invalid_ordering(self, client):
+        response = client.get(self.url, {"ordering": "name"})
+        assert response.status_code == 400
+
+
+@pytest.mark.django_db
+class TestSavedRecipeIds:
+    """Тестирование флагов избранного и списка покупок из кэша"""
+
+    url = reverse("api:recipes-list")
+
+    def get_flags(self, client, params=None) -> dict[int, tuple]:
+        response = client.get(self.url, params)
+        assert response.status_code == 200
+        return {
+            recipe["id"]: (
+                recipe["is_favorited"],
+                recipe["is_in_shopping_cart"],
+            )
+            for recipe in response.data["results"]
+        }
+
+    def test_cached_page_shared_by_users(
+        self, client, auth_client, recipe, django_assert_num_queries
+    ):
+        auth_client.post(reverse("api:recipes-favorite", args=[recipe.id]))
+        assert self.get_flags(client) == {recipe.id: (False, False)}
+        assert self.get_flags(auth_client) == {recipe.id: (True, False)}
+        # Страница и множества id в кэше, остаётся проверка токена.
+        with django_assert_num_queries(1):
+            assert self.get_flags(auth_client) == {recipe.id: (True, False)}
+
+    def test_own_counter_change(
+        self, auth_client, recipe, django_capture_on_commit_callbacks
+    ):
+        auth_client.get(self.url)
+        with django_capture_on_commit_callbacks(execute=True):
+            auth_client.post(
+                reverse("api:recipes-favorite", args=[recipe.id])
+            )
+        data = auth_client.get(self.url).data["results"][0]
+        assert data["is_favorited"]
+        assert data["favorites_count"] == 1
+        detail = auth_client.get(
+            reverse("api:recipes-detail", args=[recipe.id])
+        )
+        assert detail.data["favorites_count"] == data["favorites_count"]
+
+    def test_etag_changes_with_saved(self, auth_client, recipe):
+        etag = auth_client.get(self.url)["ETag"]
+        response = auth_client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        auth_client.post(
+            reverse("api:recipes-shopping-cart", args=[recipe.id])
+        )
+        response = auth_client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response.data["results"][0]["is_in_shopping_cart"]
+
+    def test_filter_by_saved(self, auth_client, recipe, creator):
+        other = Recipe.objects.create(
+            author=creator, name="other", text="text", cooking_time=1
+        )
+        assert self.get_flags(auth_client, {"is_favorited": 1}) == {}
+        auth_client.post(reverse("api:recipes-favorite", args=[recipe.id]))
+        assert self.get_flags(auth_client, {"is_favorited": 1}) == {
+            recipe.id: (True, False)
+        }
+        assert self.get_flags(auth_client, {"is_favorited": 0}) == {
+            other.id: (False, False)
+        }
+
+    def test_bulk_changes(self, auth_client, recipe):
+        url = reverse("api:recipes-favorite-bulk")
+        assert self.get_flags(auth_client) == {recipe.id: (False, False)}
+        auth_client.post(url, data={"recipes": [recipe.id]}, format="json")
+        assert self.get_flags(auth_client) == {recipe.id: (True, False)}
+        auth_client.delete(url, data={"recipes": [recipe.id]}, format="json")
+        assert self.get_flags(auth_client) == {recipe.id: (False, False)}
+
+
+@pytest.mark.django_db
+class TestReferenceData:
+    """Тестирование реестра тегов и ингредиентов"""
+
+    tags_url = reverse("api:tags-list")
+    ingredients_url = reverse("api:ingredients-list")
+
+    def detail_url(self, recipe):
+        return reverse("api:recipes-detail", args=[recipe.id])
+
+    def test_lists_from_registry(
+        self, client, tag, ingredient, django_assert_num_queries
+    ):
+        get_reference_data()
+        # В каждом запросе остаётся только чтение версии справочников.
+        with django_assert_num_queries(2):
+            tags = client.get(self.tags_url)
+            ingredients = client.get(self.ingredients_url)
+        assert tags.json() == [
+            {
+                "id": tag.id,
+                "name": tag.name,
+                "color": tag.color,
+                "slug": tag.slug,
+            }
+        ]
+        assert ingredients.json() == [
+            {
+                "id": ingredient.id,
+                "name": ingredient.name,
+                "measurement_unit": ingredient.measurement_unit,
+            }
+        ]
+        response = client.get(self.tags_url, HTTP_IF_NONE_MATCH=tags["ETag"])
+        assert response.status_code == 304
+
+    def test_not_found(self, client):
+        url = reverse("api:tags-detail", args=[1])
+        assert client.get(url).status_code == 404
+
+    def test_changes_bump_version(self, client, tag, recipe):
+        etag = client.get(self.tags_url)["ETag"]
+        tag.name = "renamed"
+        tag.save()
+        response = client.get(self.tags_url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response.data[0]["name"] == "renamed"
+        response = client.get(self.detail_url(recipe))
+        assert response.data["tags"][0]["name"] == "renamed"
+
+    def test_tags_outside_mask(self, client, recipe):
+        tags = Tag.objects.bulk_create(
+            Tag(id=tag_id, name=name, color=f"#00000{tag_id % 10}", slug=name)
+            for tag_id, name in ((100, "b"), (2, "a"))
+        )
+        recipe.tags.add(*tags)
+        response = client.get(self.detail_url(recipe))
+        assert [tag["name"] for tag in response.data["tags"]] == [
+            "a",
+            "b",
+            "test tag",
+        ]
+
+    def test_missing_ingredient_loaded(self, client, recipe):
+        get_reference_data()
+        # bulk_create не отправляет сигналов и не меняет версию.
+        (ingredient,) = Ingredient.objects.bulk_create(
+            [Ingredient(name="apple", measurement_unit="g")]
+        )
+        IngredientRecipe.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=2
+        )
+        response = client.get(self.detail_url(recipe))
+        assert response.data["ingredients"][-1] == {
+            "id": ingredient.id,
+            "name": "apple",
+            "measurement_unit": "g",
+            "amount": 2,
+        }
+
+
+@pytest.mark.django_db
+class TestImageVariants:
+    """Тестирование уменьшенных копий изображений рецептов"""
+
+    def detail_url(self, recipe):
+        return reverse("api:recipes-detail", args=[recipe.id])
+
+    def set_image(self, recipe, size, mode="RGB") -> bytes:
+        output = BytesIO()
+        Image.new(mode, size, "red").save(output, format="PNG")
+        recipe.image.save("photo.png", ContentFile(output.getvalue()))
+        return output.getvalue()
+
+    def process(self) -> str:
+        out = StringIO()
+        call_command("image_variants_worker", "--once", stdout=out)
+        return out.getvalue()
+
+    def get_srcset(self, client, recipe) -> dict | None:
+        response = client.get(self.detail_url(recipe))
+        assert response.status_code == 200
+        return response.data["image_srcset"]
+
+    def test_variants_built(self, client, recipe):
+        self.set_image(recipe, (1200, 600), "RGBA")
+        assert recipe.image_changed_at is not None
+        assert self.get_srcset(client, recipe) is None
+        assert "готово" in self.process()
+        recipe.refresh_from_db()
+        assert recipe.image_changed_at is None
+        srcset = self.get_srcset(client, recipe)
+        assert set(srcset) == {"webp", "jpeg"}
+        for key, image_format in (("webp", "WEBP"), ("jpeg", "JPEG")):
+            entries = [entry.split() for entry in srcset[key].split(", ")]
+            assert [width for _, width in entries] == [
+                "320w",
+                "640w",
+                "960w",
+            ]
+            assert all(
+                url.startswith("http://testserver/") for url, _ in entries
+            )
+        for name, width in zip(
+            recipe.image_variants["jpeg"], recipe.image_variants["widths"]
+        ):
+            with get_storage().open(name) as file, Image.open(file) as image:
+                assert image.format == "JPEG"
+                assert image.size == (width, width // 2)
+        name = recipe.image_variants["webp"][0]
+        with get_storage().open(name) as file, Image.open(file) as image:
+            assert image.format == "WEBP"
+
+    def test_small_image_not_enlarged(self, client, recipe):
+        self.set_image(recipe, (100, 50))
+        self.process()
+        srcset = self.get_srcset(client, recipe)
+        assert srcset["webp"].endswith(" 100w")
+        assert ", " not in srcset["webp"]
+
+    def test_replaced_image(
+        self, client, recipe, settings, django_capture_on_commit_callbacks
+    ):
+        settings.MEDIA_RELEASE_GRACE = 0
+        self.set_image(recipe, (400, 400))
+        self.process()
+        recipe.refresh_from_db()
+        old_files = [
+            recipe.image.name,
+            *recipe.image_variants["webp"],
+            *recipe.image_variants["jpeg"],
+        ]
+        with django_capture_on_commit_callbacks(execute=True):
+            self.set_image(recipe, (500, 500))
+        assert self.get_srcset(client, recipe) is None
+        self.process()
+        assert self.get_srcset(client, recipe)["jpeg"].endswith(" 500w")
+        assert not any(get_storage().exists(name) for name in old_files)
+
+    def test_cached_list_updated(
+        self, client, recipe, django_capture_on_commit_callbacks
+    ):
+        url = reverse("api:recipes-list")
+        self.set_image(recipe, (400, 400))
+        assert client.get(url).data["results"][0]["image_srcset"] is None
+        with django_capture_on_commit_callbacks(execute=True):
+            self.process()
+        srcset = client.get(url).data["results"][0]["image_srcset"]
+        assert srcset is not None, "Копии должны сбрасывать кэш списка"
+
+    def test_unreadable_image(self, recipe):
+        err = StringIO()
+        call_command("image_variants_worker", "--once", stderr=err)
+        assert str(recipe.id) in err.getvalue()
+        recipe.refresh_from_db()
+        assert recipe.image_changed_at is None
+        assert recipe.image_variants == {}
+
+    def test_subscription_recipes(self, recipe):
+        content = self.set_image(recipe, (400, 200))
+        data = RecipeForSubscribeSerializer(recipe).data
+        assert data["image_srcset"] is None
+        self.process()
+        recipe.refresh_from_db()
+        data = RecipeForSubscribeSerializer(recipe).data
+        # Без запроса ссылки относительные.
+        prefix = "/media/recipes/variants/" + (
+            hashlib.sha256(content).hexdigest()
+        )
+        assert data["image_srcset"]["webp"] == (
+            f"{prefix}_png-320-q80.webp 320w, "
+            f"{prefix}_png-400-q80.webp 400w"
+        )
+
+
+@pytest.mark.django_db
+class TestHashedStorage:
+    """Тестирование хранения изображений под хешем содержимого"""
+
+    @pytest.fixture
+    def second_recipe(self, creator):
+        return Recipe.objects.create(
+            name="second", author=creator, text="text", cooking_time=1
+        )
+
+    def get_content(self, color="red") -> bytes:
+        output = BytesIO()
+        Image.new("RGB", (400, 400), color).save(output, format="PNG")
+        return output.getvalue()
+
+    def set_image(self, recipe, content, name="photo.PNG"):
+        recipe.image.save(name, ContentFile(content))
+
+    def process(self):
+        call_command("image_variants_worker", "--once", stdout=StringIO())
+
+    def files(self, recipe) -> list[str]:
+        recipe.refresh_from_db()
+        return [
+            recipe.image.name,
+            *recipe.image_variants["webp"],
+            *recipe.image_variants["jpeg"],
+        ]
+
+    def test_same_content_same_name(self, recipe, second_recipe):
+        content = self.get_content()
+        self.set_image(recipe, content)
+        self.set_image(second_recipe, content, "other.png")
+        digest = hashlib.sha256(content).hexdigest()
+        assert recipe.image.name == f"recipes/images/{digest}.png"
+        assert second_recipe.image.name == recipe.image.name
+        directory = get_storage().path("recipes/images")
+        assert os.listdir(directory) == [f"{digest}.png"]
+
+    def test_shared_file_kept(
+        self,
+        recipe,
+        second_recipe,
+        settings,
+        django_capture_on_commit_callbacks,
+    ):
+        settings.MEDIA_RELEASE_GRACE = 0
+        content = self.get_content()
+        self.set_image(recipe, content)
+        self.set_image(second_recipe, content)
+        self.process()
+        files = self.files(recipe)
+        assert self.files(second_recipe) == files
+        with django_capture_on_commit_callbacks(execute=True):
+            recipe.delete()
+        assert all(get_storage().exists(name) for name in files)
+        with django_capture_on_commit_callbacks(execute=True):
+            second_recipe.delete()
+        assert not any(get_storage().exists(name) for name in files)
+
+    def test_recent_file_released_later(
+        self, recipe, settings, django_capture_on_commit_callbacks
+    ):
+        self.set_image(recipe, self.get_content())
+        self.process()
+        source, *variants = self.files(recipe)
+        with django_capture_on_commit_callbacks(execute=True):
+            recipe.delete()
+        assert get_storage().exists(source)
+        assert not any(get_storage().exists(name) for name in variants)
+        call_command("release_unused_images", stdout=StringIO())
+        assert get_storage().exists(source), "Недавний файл не удаляется"
+        settings.MEDIA_RELEASE_GRACE = 0
+        call_command("release_unused_images", stdout=StringIO())
+        assert not get_storage().exists(source)
+
+    def test_release_unused_keeps_referenced(
+        self, recipe, second_recipe, settings
+    ):
+        settings.MEDIA_RELEASE_GRACE = 0
+        self.set_image(recipe, self.get_content())
+        self.process()
+        files = self.files(recipe)
+        # Копии, которые обработчик построил, но ещё не записал.
+        self.set_image(second_recipe, self.get_content("blue"))
+        pending = variant_files(build_variants(second_recipe.image.name))
+        orphan = get_storage().save(
+            "recipes/images/old.png", ContentFile(self.get_content("green"))
+        )
+        out = StringIO()
+        call_command("release_unused_images", "--check", stdout=out)
+        assert orphan in out.getvalue()
+        assert get_storage().exists(orphan)
+        call_command("release_unused_images", stdout=StringIO())
+        assert not get_storage().exists(orphan)
+        assert all(get_storage().exists(name) for name in files)
+        assert get_storage().exists(second_recipe.image.name)
+        assert all(get_storage().exists(name) for name in pending)
+
+    def test_replaced_image_released(
+        self, recipe, settings, django_capture_on_commit_callbacks
+    ):
+        settings.MEDIA_RELEASE_GRACE = 0
+        self.set_image(recipe, self.get_content())
+        old_name = recipe.image.name
+        with django_capture_on_commit_callbacks(execute=True):
+            self.set_image(recipe, self.get_content("blue"))
+        assert recipe.image.name != old_name
+        assert not get_storage().exists(old_name)
+        assert get_storage().exists(recipe.image.name)
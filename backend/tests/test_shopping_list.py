@@ -0,0 +1,511 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+
+from recipes.models import ShoppingCart, ShoppingListJob
+from recipes.shopping_list import (
+    add_to_shopping_list,
+    remove_from_shopping_list,
+)
+
+
+def add_to_cart(user, recipe):
+    cart = ShoppingCart.objects.create(user=user, recipe=recipe)
+    add_to_shopping_list(user.id, [recipe.id])
+    return cart
+
+
+def remove_from_cart(user, recipe):
+    ShoppingCart.objects.filter(user=user, recipe=recipe).delete()
+    remove_from_shopping_list(user.id, [recipe.id])
+
+
+@pytest.mark.django_db
+class TestShoppingListJob:
+    """Тестирование фонового формирования списка покупок"""
+
+    reverse_name_list = "api:shopping_list_jobs-list"
+    reverse_name_detail = "api:shopping_list_jobs-detail"
+    reverse_name_download = "api:shopping_list_jobs-download"
+
+    def test_create_job(self, auth_client, authorized_user):
+        url = reverse(self.reverse_name_list)
+        response = auth_client.post(url)
+        assert (
+            response.status_code == 202
+        ), f"Метод POST на эндпоинт {url} должен возвращать статус 202"
+        assert response.data["status"] == ShoppingListJob.Status.PENDING
+        assert response.data["download_url"] is None
+        assert ShoppingListJob.objects.filter(
+            id=response.data["id"], user=authorized_user
+        ).exists(), "Задача не сохраняется в БД"
+
+        second_response = auth_client.post(url)
+        assert second_response.data["id"] == response.data["id"], (
+            "Пока задача не выполнена, повторный запрос должен возвращать "
+            "ту же задачу"
+        )
+
+    def test_job_reuse_is_locked(self, auth_client, monkeypatch):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        from api.views.recipe_views import ShoppingListJobViewSet
+
+        locked = []
+        lock_user = ShoppingListJobViewSet.lock_user
+        with CaptureQueriesContext(connection) as queries:
+            monkeypatch.setattr(
+                ShoppingListJobViewSet,
+                "lock_user",
+                lambda view: locked.append(len(queries)) or lock_user(view),
+            )
+            auth_client.post(reverse(self.reverse_name_list))
+        lookup = next(
+            index
+            for index, query in enumerate(queries)
+            if "recipes_shoppinglistjob" in query["sql"]
+        )
+        assert len(locked) == 1 and locked[0] <= lookup, (
+            "Поиск незавершённой задачи и создание новой должны выполняться "
+            "под блокировкой пользователя"
+        )
+
+    def test_job_for_not_auth_user(self, client):
+        response = client.post(reverse(self.reverse_name_list))
+        assert (
+            response.status_code == 401
+        ), "Анонимному пользователю не доступно формирование списка покупок"
+
+    def test_job_of_other_user(self, auth_client, creator):
+        job = ShoppingListJob.objects.create(user=creator)
+        url = reverse(self.reverse_name_detail, args=[job.id])
+        response = auth_client.get(url)
+        assert (
+            response.status_code == 404
+        ), "Пользователю не доступны задачи других пользователей"
+
+    def test_download_not_ready_job(self, auth_client, authorized_user):
+        job = ShoppingListJob.objects.create(user=authorized_user)
+        url = reverse(self.reverse_name_download, args=[job.id])
+        response = auth_client.get(url)
+        assert (
+            response.status_code == 409
+        ), "Скачивание невыполненной задачи должно возвращать статус 409"
+
+    def test_worker_renders_job(self, auth_client, authorized_user, recipe):
+        add_to_cart(authorized_user, recipe)
+        job = ShoppingListJob.objects.create(user=authorized_user)
+        call_command("shopping_list_worker", "--once")
+        job.refresh_from_db()
+        assert (
+            job.status == ShoppingListJob.Status.DONE
+        ), f"Задача не выполнена обработчиком: {job.error}"
+
+        response = auth_client.get(
+            reverse(self.reverse_name_detail, args=[job.id])
+        )
+        assert response.data["download_url"], "Отсутствует ссылка на файл"
+        response = auth_client.get(
+            reverse(self.reverse_name_download, args=[job.id])
+        )
+        assert response.status_code == 200
+        assert response["Content-Type"] == "application/pdf"
+        assert response.content.startswith(b"%PDF")
+
+
+@pytest.mark.django_db
+class TestShoppingListCache:
+    """Тестирование кэша pdf-файлов списка покупок"""
+
+    reverse_name_download = "api:download_shop_list"
+
+    @pytest.fixture
+    def render_calls(self, monkeypatch):
+        from recipes import shopping_list
+
+        calls = []
+        render = shopping_list.render_shopping_list_pdf
+
+        def counting_render(ingredients):
+            calls.append(ingredients)
+            return render(ingredients)
+
+        monkeypatch.setattr(
+            shopping_list, "render_shopping_list_pdf", counting_render
+        )
+        return calls
+
+    def test_repeated_download_uses_cache(
+        self, auth_client, authorized_user, recipe, render_calls
+    ):
+        add_to_cart(authorized_user, recipe)
+        url = reverse(self.reverse_name_download)
+        first = auth_client.get(url)
+        second = auth_client.get(url)
+        assert first.status_code == second.status_code == 200
+        assert first.content == second.content
+        assert (
+            len(render_calls) == 1
+        ), "Повторное скачивание не должно заново формировать pdf-файл"
+
+    def test_same_list_shared_between_users(
+        self,
+        auth_client,
+        creator_client,
+        authorized_user,
+        creator,
+        recipe,
+        render_calls,
+    ):
+        add_to_cart(authorized_user, recipe)
+        add_to_cart(creator, recipe)
+        url = reverse(self.reverse_name_download)
+        auth_client.get(url)
+        creator_client.get(url)
+        assert (
+            len(render_calls) == 1
+        ), "Одинаковые списки покупок должны использовать один файл"
+
+    def test_cart_change_invalidates_cache(
+        self,
+        auth_client,
+        authorized_user,
+        recipe,
+        render_calls,
+        django_capture_on_commit_callbacks,
+    ):
+        add_to_cart(authorized_user, recipe)
+        url = reverse(self.reverse_name_download)
+        auth_client.get(url)
+        with django_capture_on_commit_callbacks(execute=True):
+            remove_from_cart(authorized_user, recipe)
+        auth_client.get(url)
+        assert (
+            len(render_calls) == 2
+        ), "Изменение списка покупок должно сбрасывать кэш pdf-файла"
+        assert render_calls[1] == [], "Список покупок должен быть пустым"
+
+    def test_recipe_update_invalidates_cache(
+        self,
+        auth_client,
+        creator_client,
+        authorized_user,
+        recipe,
+        recipe_data,
+        render_calls,
+    ):
+        add_to_cart(authorized_user, recipe)
+        url = reverse(self.reverse_name_download)
+        auth_client.get(url)
+        recipe_data["ingredients"][0]["amount"] = 42
+        creator_client.patch(
+            reverse("api:recipes-detail", args=[recipe.id]),
+            data=recipe_data,
+            format="json",
+        )
+        auth_client.get(url)
+        assert len(render_calls) == 2
+        assert render_calls[1][0]["sum_amount"] == 42
+
+    def test_eviction(self, tmp_path):
+        import os
+        import time
+
+        from recipes.pdf_cache import ShoppingListPDFCache
+
+        cache = ShoppingListPDFCache(
+            directory=tmp_path, max_size=10, max_age=60, sources=()
+        )
+        cache.set(1, "old", b"x" * 6)
+        old_time = time.time() - 30
+        os.utime(cache._file_path("old"), (old_time, old_time))
+        cache.set(2, "new", b"y" * 6)
+        assert cache.get(1) is None, "Самый старый файл должен вытесняться"
+        assert cache.get(2) == b"y" * 6
+
+        expired_time = time.time() - 120
+        os.utime(cache._file_path("new"), (expired_time, expired_time))
+        cache.evict()
+        assert cache.get(2) is None, "Устаревший файл должен удаляться"
+
+
+@pytest.mark.django_db
+class TestShoppingListFormats:
+    """Тестирование выгрузки списка покупок в разных форматах"""
+
+    reverse_name_download = "api:download_shop_list"
+
+    @pytest.fixture
+    def cart(self, authorized_user, recipe):
+        return add_to_cart(authorized_user, recipe)
+
+    @staticmethod
+    def get_content(response) -> str:
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv(self, auth_client, cart, ingredient):
+        url = reverse(self.reverse_name_download)
+        response = auth_client.get(url, {"format": "csv"})
+        assert response.status_code == 200
+        assert response["Content-Type"] == "text/csv; charset=utf-8"
+        assert "shortlist.csv" in response["Content-Disposition"]
+        lines = self.get_content(response).splitlines()
+        assert lines == [
+            "name,measurement_unit,amount",
+            f"{ingredient.name},{ingredient.measurement_unit},5",
+        ]
+
+    def test_txt(self, auth_client, cart, ingredient):
+        url = reverse(self.reverse_name_download)
+        response = auth_client.get(url, {"format": "txt"})
+        assert response.status_code == 200
+        assert response["Content-Type"] == "text/plain; charset=utf-8"
+        assert (
+            f"1. {ingredient.name} ({ingredient.measurement_unit}) — 5"
+            in self.get_content(response)
+        )
+
+    def test_json_by_accept_header(self, auth_client, cart, ingredient):
+        import json
+
+        url = reverse(self.reverse_name_download)
+        response = auth_client.get(url, HTTP_ACCEPT="application/json")
+        assert response.status_code == 200
+        assert json.loads(self.get_content(response)) == [
+            {
+                "name": ingredient.name,
+                "measurement_unit": ingredient.measurement_unit,
+                "amount": 5,
+            }
+        ]
+
+    def test_empty_json(self, auth_client):
+        import json
+
+        url = reverse(self.reverse_name_download)
+        response = auth_client.get(url, {"format": "json"})
+        assert json.loads(self.get_content(response)) == []
+
+    def test_unknown_format(self, auth_client):
+        url = reverse(self.reverse_name_download)
+        response = auth_client.get(url, {"format": "xls"})
+        assert response.status_code == 404
+
+    def test_not_auth_user(self, client):
+        url = reverse(self.reverse_name_download)
+        response = client.get(url, {"format": "csv"})
+        assert response.status_code == 401
+        assert response["Content-Type"] == "application/json"
+
+
+class TestPDFRenderPool:
+    """Тестирование пула процессов формирования pdf-файлов"""
+
+    @pytest.fixture
+    def pool(self, settings):
+        from recipes.pdf_pool import PDFRenderPool
+
+        pool = PDFRenderPool(
+            processes=1,
+            max_queue=0,
+            timeout=60,
+            max_tasks_per_child=10,
+            stylesheet=f"{settings.STATICFILES_DIRS[0]}/css/pdf.css",
+        )
+        yield pool
+        if pool._pool is not None:
+            pool._pool.terminate()
+
+    def test_render(self, pool):
+        pdf = pool.render("<h1>Список покупок</h1>")
+        assert pdf.startswith(b"%PDF")
+        assert pool.stats["rendered"] == 1
+        assert pool.stats["max_rss_kb"] > 0
+
+    def test_full_queue_rejects(self, pool):
+        from recipes.pdf_pool import RenderPoolBusy
+
+        class Running:
+            def ready(self):
+                return False
+
+        pool._tasks[Running()] = time.monotonic()
+        with pytest.raises(RenderPoolBusy):
+            pool.render("<h1>Список покупок</h1>")
+        assert pool.stats["rejected"] == 1
+        assert pool._pool is None, "Отклонённый запрос не запускает пул"
+
+    def test_capacity_restored_after_worker_death(self, pool):
+        from recipes.pdf_pool import RenderPoolBusy
+
+        pool.timeout = 2
+        # Процесс завершается, не вернув результата задачи.
+        pool._submit(os._exit, (1,))
+        with pytest.raises(RenderPoolBusy):
+            pool.render("<h1>Список покупок</h1>")
+        time.sleep(pool.timeout + 0.5)
+        pdf = pool.render("<h1>Список покупок</h1>")
+        assert pdf.startswith(b"%PDF")
+        assert pool.stats["lost"] == 1
+        assert pool.stats["restarts"] == 1
+
+    def test_single_pool_per_process(self, settings, monkeypatch):
+        from recipes import pdf_pool
+
+        class SlowPool(pdf_pool.PDFRenderPool):
+            def __init__(self, **kwargs):
+                time.sleep(0.05)
+                super().__init__(**kwargs)
+
+        settings.PDF_RENDER_POOL = {**settings.PDF_RENDER_POOL, "PROCESSES": 1}
+        monkeypatch.setattr(pdf_pool, "_render_pool", None)
+        monkeypatch.setattr(pdf_pool, "PDFRenderPool", SlowPool)
+        with ThreadPoolExecutor(4) as executor:
+            pools = set(
+                executor.map(lambda _: pdf_pool.get_render_pool(), range(4))
+            )
+        assert len(pools) == 1, "Параллельные запросы создают один пул"
+
+
+@pytest.mark.django_db
+class TestShoppingListItems:
+    """Тестирование сводного списка покупок"""
+
+    reverse_name = "api:recipes-shopping-cart"
+
+    @staticmethod
+    def get_items(user) -> dict[int, int]:
+        from recipes.models import ShoppingListItem
+
+        return dict(
+            ShoppingListItem.objects.filter(user=user).values_list(
+                "ingredient_id", "amount"
+            )
+        )
+
+    @pytest.fixture
+    def second_recipe(self, creator, ingredient, tag):
+        from recipes.models import IngredientRecipe, Recipe
+
+        recipe = Recipe.objects.create(
+            name="second recipe", author=creator, text="text", cooking_time=5
+        )
+        recipe.tags.add(tag)
+        IngredientRecipe.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=3
+        )
+        return recipe
+
+    def test_add_and_remove(
+        self, auth_client, authorized_user, recipe, second_recipe, ingredient
+    ):
+        auth_client.post(reverse(self.reverse_name, args=[recipe.id]))
+        auth_client.post(reverse(self.reverse_name, args=[second_recipe.id]))
+        assert self.get_items(authorized_user) == {
+            ingredient.id: 8
+        }, "Количества ингредиентов должны суммироваться"
+
+        auth_client.delete(reverse(self.reverse_name, args=[recipe.id]))
+        assert self.get_items(authorized_user) == {ingredient.id: 3}
+
+        auth_client.delete(reverse(self.reverse_name, args=[second_recipe.id]))
+        assert (
+            self.get_items(authorized_user) == {}
+        ), "Пустые строки должны удаляться из сводного списка"
+
+    def test_recipe_update_propagates(
+        self,
+        auth_client,
+        creator_client,
+        authorized_user,
+        recipe,
+        recipe_data,
+    ):
+        from recipes.models import Ingredient
+
+        auth_client.post(reverse(self.reverse_name, args=[recipe.id]))
+        new_ingredient = Ingredient.objects.create(
+            name="apple", measurement_unit="g"
+        )
+        recipe_data["ingredients"] = [{"id": new_ingredient.id, "amount": 7}]
+        response = creator_client.patch(
+            reverse("api:recipes-detail", args=[recipe.id]),
+            data=recipe_data,
+            format="json",
+        )
+        assert response.status_code == 200
+        assert self.get_items(authorized_user) == {
+            new_ingredient.id: 7
+        }, "Изменение ингредиентов рецепта должно попадать в список покупок"
+
+    def test_recipe_delete_propagates(
+        self, auth_client, creator_client, authorized_user, recipe
+    ):
+        auth_client.post(reverse(self.reverse_name, args=[recipe.id]))
+        creator_client.delete(reverse("api:recipes-detail", args=[recipe.id]))
+        assert self.get_items(authorized_user) == {}
+
+    def test_author_delete_propagates(
+        self, auth_client, authorized_user, creator, recipe
+    ):
+        auth_client.post(reverse(self.reverse_name, args=[recipe.id]))
+        creator.delete()
+        assert self.get_items(authorized_user) == {}
+
+    def test_admin_changes_propagate(
+        self, admin_client, authorized_user, recipe, ingredient
+    ):
+        response = admin_client.post(
+            reverse("admin:recipes_shoppingcart_add"),
+            {"user": authorized_user.id, "recipe": recipe.id},
+        )
+        assert response.status_code == 302
+        assert self.get_items(authorized_user) == {ingredient.id: 5}
+        link = recipe.recipe_ingredients.get()
+        prefix = "recipe_ingredients"
+        response = admin_client.post(
+            reverse("admin:recipes_recipe_change", args=[recipe.id]),
+            {
+                "name": recipe.name,
+                "author": recipe.author_id,
+                "text": recipe.text,
+                "cooking_time": recipe.cooking_time,
+                "tags": [tag.id for tag in recipe.tags.all()],
+                f"{prefix}-TOTAL_FORMS": 1,
+                f"{prefix}-INITIAL_FORMS": 1,
+                f"{prefix}-0-id": link.id,
+                f"{prefix}-0-recipe": recipe.id,
+                f"{prefix}-0-ingredient": ingredient.id,
+                f"{prefix}-0-amount": 2,
+            },
+        )
+        assert response.status_code == 302, response.context[
+            "adminform"
+        ].form.errors
+        assert self.get_items(authorized_user) == {ingredient.id: 2}
+        admin_client.post(
+            reverse("admin:recipes_shoppingcart_changelist"),
+            {
+                "action": "delete_selected",
+                "_selected_action": list(
+                    ShoppingCart.objects.values_list("id", flat=True)
+                ),
+                "post": "yes",
+            },
+        )
+        assert self.get_items(authorized_user) == {}
+
+    def test_rebuild_command(self, authorized_user, recipe, ingredient):
+        from django.core.management.base import CommandError
+
+        ShoppingCart.objects.create(user=authorized_user, recipe=recipe)
+        with pytest.raises(CommandError):
+            call_command("rebuild_shopping_lists", "--check")
+        call_command("rebuild_shopping_lists")
+        assert self.get_items(authorized_user) == {ingredient.id: 5}
+        call_command("rebuild_shopping_lists", "--check")
@@ -1,6 +1,11 @@
+from io import StringIO
+
 import pytest
+from django.core.management import CommandError, call_command
 from django.urls import reverse
+from rest_framework.test import APIClient
 
+from recipes.models import FeedEntry, Recipe
 from users.models import Subscribe
 
 
@@ -15,9 +20,13 @@ class TestSubscription:
         url = reverse(self.reverse_name_subscribe, args=[creator.id])
         response = auth_client.post(url)
         assert response.status_code == 201
+        creator.refresh_from_db()
+        assert creator.subscribers_count == 1
 
         response = auth_client.delete(url)
         assert response.status_code == 204
+        creator.refresh_from_db()
+        assert creator.subscribers_count == 0
 
     def test_subscribe_for_not_auth_user(self, client, creator):
         url = reverse(self.reverse_name_subscribe, args=[creator.id])
@@ -92,3 +101,172 @@ class TestSubscription:
         assert response.status_code == 200
         assert "is_subscribed" in response.data
         assert response.data["is_subscribed"]
+
+
+@pytest.mark.django_db
+class TestFeed:
+    """Тестирование ленты подписок"""
+
+    url = reverse("api:recipes-feed")
+
+    def subscribe(self, client, author, method="post"):
+        url = reverse("api:users-subscribe", args=[author.id])
+        response = getattr(client, method)(url)
+        assert response.status_code in (201, 204)
+
+    def get_ids(self, client, params=None) -> list[int]:
+        response = client.get(self.url, params)
+        assert response.status_code == 200
+        return [recipe["id"] for recipe in response.data["results"]]
+
+    def test_feed_for_not_auth_user(self, client):
+        assert client.get(self.url).status_code == 401
+
+    def test_subscribe_adds_recent_recipes(self, auth_client, creator, recipe):
+        assert self.get_ids(auth_client) == []
+        self.subscribe(auth_client, creator)
+        assert self.get_ids(auth_client) == [recipe.id]
+        self.subscribe(auth_client, creator, method="delete")
+        assert self.get_ids(auth_client) == []
+
+    def test_new_recipe_fans_out(
+        self,
+        auth_client,
+        authorized_user,
+        creator,
+        creator_client,
+        recipe_data,
+    ):
+        self.subscribe(auth_client, creator)
+        response = creator_client.post(
+            reverse("api:recipes-list"), data=recipe_data, format="json"
+        )
+        assert response.status_code == 201
+        assert FeedEntry.objects.filter(
+            user=authorized_user, recipe_id=response.data["id"]
+        ).exists()
+        response = auth_client.get(self.url)
+        assert (
+            response.data["results"][0]["id"]
+            == Recipe.objects.latest("pub_date").id
+        )
+        assert response.data["results"][0]["name"] == recipe_data["name"]
+
+    def test_popular_author_is_read_directly(
+        self, settings, auth_client, creator, creator_client, recipe_data
+    ):
+        settings.FEED_FANOUT_LIMIT = 0
+        self.subscribe(auth_client, creator)
+        creator_client.post(
+            reverse("api:recipes-list"), data=recipe_data, format="json"
+        )
+        assert not FeedEntry.objects.exists()
+        assert self.get_ids(auth_client) == list(
+            Recipe.objects.order_by("-pub_date", "id").values_list(
+                "id", flat=True
+            )
+        )
+
+    def test_pages(
+        self,
+        settings,
+        auth_client,
+        authorized_user,
+        creator,
+        django_user_model,
+        django_assert_max_num_queries,
+    ):
+        popular = django_user_model.objects.create(
+            email="popular@mail.com", username="popular"
+        )
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=(creator, popular)[number % 2],
+                name=f"recipe {number}",
+                text="text",
+                cooking_time=1,
+            )
+            for number in range(7)
+        )
+        self.subscribe(auth_client, creator)
+        django_user_model.objects.filter(id=popular.id).update(
+            subscribers_count=settings.FEED_FANOUT_LIMIT
+        )
+        self.subscribe(auth_client, popular)
+        expected = list(
+            Recipe.objects.order_by("-pub_date", "id").values_list(
+                "id", flat=True
+            )
+        )
+        assert len(expected) == len(recipes)
+        received = []
+        url = f"{self.url}?limit=3"
+        # Первый запрос загружает в кэш id рецептов в избранном и списке
+        # покупок пользователя.
+        auth_client.get(url)
+        while url:
+            with django_assert_max_num_queries(6):
+                response = auth_client.get(url)
+            assert response.status_code == 200
+            received += [recipe["id"] for recipe in response.data["results"]]
+            url = response.data["next"]
+        assert received == expected
+
+    def test_fanout_limit_crossing(
+        self,
+        settings,
+        auth_client,
+        authorized_user,
+        creator,
+        recipe,
+        django_user_model,
+    ):
+        settings.FEED_FANOUT_LIMIT = 1
+        self.subscribe(auth_client, creator)
+        other = django_user_model.objects.create(
+            email="other@mail.com", username="other"
+        )
+        other_client = APIClient()
+        other_client.force_authenticate(other)
+        self.subscribe(other_client, creator)
+        assert not FeedEntry.objects.exists()
+        assert self.get_ids(auth_client) == [recipe.id]
+        self.subscribe(other_client, creator, method="delete")
+        assert FeedEntry.objects.filter(user=authorized_user).exists()
+        assert self.get_ids(auth_client) == [recipe.id]
+
+    def test_duplicates_do_not_shorten_page(
+        self, settings, auth_client, authorized_user, creator
+    ):
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=creator,
+                name=f"recipe {number}",
+                text="text",
+                cooking_time=1,
+            )
+            for number in range(4)
+        )
+        self.subscribe(auth_client, creator)
+        # Автор стал популярным без сверки лент: записи остались.
+        settings.FEED_FANOUT_LIMIT = 0
+        expected = list(
+            Recipe.objects.order_by("-pub_date", "id").values_list(
+                "id", flat=True
+            )
+        )
+        assert self.get_ids(auth_client, {"limit": 3}) == expected[:3]
+
+    def test_invalid_cursor(self, auth_client):
+        response = auth_client.get(self.url, {"cursor": "bad"})
+        assert response.status_code == 404
+
+    def test_rebuild_feeds(self, authorized_user, creator, recipe):
+        Subscribe.objects.create(author=creator, subscriber=authorized_user)
+        with pytest.raises(CommandError):
+            call_command("rebuild_feeds", "--check", stdout=StringIO())
+        call_command("rebuild_feeds", stdout=StringIO())
+        assert FeedEntry.objects.get(user=authorized_user).recipe == recipe
+        Subscribe.objects.all().delete()
+        call_command("rebuild_feeds", stdout=StringIO())
+        assert not FeedEntry.objects.exists()
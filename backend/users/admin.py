@@ -7,7 +7,10 @@ EMPTY = '-пусто-'
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
-    list_display = ['username', 'email', 'first_name', 'last_name']
+    list_display = [
+        'username', 'email', 'first_name', 'last_name',
+        'recipes_count', 'subscribers_count'
+    ]
     search_fields = ['username', 'email']
     list_filter = ['username', 'email']
     ordering = ['username']
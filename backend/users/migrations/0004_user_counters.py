@@ -0,0 +1,51 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:29
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_subscribers_count(apps, schema_editor):
+    User = apps.get_model("users", "User")
+    Subscribe = apps.get_model("users", "Subscribe")
+    User.objects.update(
+        subscribers_count=Coalesce(
+            Subquery(
+                Subscribe.objects.filter(author=OuterRef("pk"))
+                .order_by()
+                .values("author")
+                .annotate(total=Count("*"))
+                .values("total")
+            ),
+            0,
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0003_alter_user_managers"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="recipes_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Количество рецептов"
+            ),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="subscribers_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                verbose_name="Количество подписчиков",
+            ),
+        ),
+        migrations.RunPython(
+            fill_subscribers_count, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0004_user_counters"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="subscribe",
+            index=models.Index(
+                fields=["subscriber", "author"],
+                name="subscribe_subscriber_idx",
+            ),
+        ),
+    ]
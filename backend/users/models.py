@@ -47,6 +47,12 @@ class User(AbstractUser):
     first_name = models.CharField(max_length=150, verbose_name="Имя")
     last_name = models.CharField(max_length=150, verbose_name="Фамилия")
     password = models.CharField(max_length=150, verbose_name="Пароль")
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Количество рецептов"
+    )
+    subscribers_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Количество подписчиков"
+    )
 
     objects = CustomUserManager()
 
@@ -84,6 +90,14 @@ class Subscribe(models.Model):
                 name="author_subscriber_unique",
             )
         ]
+        indexes = [
+            # Уникальный индекс начинается с автора и не помогает
+            # выбрать подписки пользователя.
+            models.Index(
+                fields=["subscriber", "author"],
+                name="subscribe_subscriber_idx",
+            )
+        ]
 
     def __str__(self):
         return f"{self.subscriber} подписан на {self.author}"